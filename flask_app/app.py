@@ -1,8 +1,31 @@
-from flask import Flask
+from flask import Flask, g, request
 from typing import Type
 
 from config import Config
+from commands.rollup import rollup_cli
+from commands.cache import cache_cli
+from commands.db import db_cli
+from commands.partitions import partitions_cli
+from commands.ingest import ingest_cli
+from commands.snapshot import snapshot_cli
+from custom.errors import DBError, PriceEngineError
+from db_engine.db import DB
+from db_engine.partitions import PricePartitions
+from db_engine.postgres_db import close_pools, forget_inherited_pools
+from db_engine.replicas import create_replica_set
+from db_engine.numpy_db import create_price_engine
+from db_engine.mmap_db import region_index_rows
 from end_points.rates_api import rates_bp
+from end_points.metrics_api import metrics_bp
+from utils.logger import configure_logger, setup_logging, parse_log_levels, bind_request
+from utils.region_index import RegionIndex
+from utils.cache import create_cache, create_invalidation_listener, get_caches
+from utils.cache_warmer import warm_rates_cache
+from utils.metrics import SlowRequestProfiler
+from utils.single_flight import SingleFlight
+from utils.admission import AdmissionController, create_rate_tiers
+
+logger = configure_logger(__name__)
 
 
 def create_app(config_class: Type[Config] = Config) -> Flask:
@@ -23,5 +46,140 @@ def create_app(config_class: Type[Config] = Config) -> Flask:
 
     # setting config
     app.config.from_object(config_class)
+    setup_logging(
+        app.config["LOG_LEVEL"],
+        module_levels=parse_log_levels(app.config["LOG_LEVELS"]),
+        sample_rate=app.config["LOG_SAMPLE_RATE"],
+        log_format=app.config["LOG_FORMAT"],
+    )
     app.register_blueprint(rates_bp, url_prefix="/rates")
+    app.register_blueprint(metrics_bp, url_prefix="/metrics")
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(cache_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(ingest_cli)
+    app.cli.add_command(snapshot_cli)
+
+    # Read replicas of the /rates/ queries, None when everything goes to DB_HOST
+    app.extensions["replica_set"] = create_replica_set(app)
+
+    # In-memory price engine, None when averages are computed by Postgres
+    price_engine = create_price_engine(
+        app.config["PRICE_ENGINE"],
+        app.config["PRICE_ENGINE_REFRESH_SECONDS"],
+        app.config["PRICE_SNAPSHOT_PATH"],
+    )
+    app.extensions["price_engine"] = price_engine
+    snapshot = None
+    if price_engine is not None and app.config["PRICE_ENGINE_PRELOAD"]:
+        with app.app_context():
+            try:
+                snapshot = price_engine.load()
+            except DBError as e:
+                # Retried lazily on the first request
+                logger.warning("Failed to preload price snapshot Error: %s", e)
+            except PriceEngineError as e:
+                # A corrupt or outdated snapshot file, Postgres answers until it is exported again
+                logger.warning("Price snapshot is unusable, querying Postgres Error: %s", e)
+                app.extensions["price_engine"] = price_engine = None
+
+    # Region tree index shared by all requests of this app
+    region_index = RegionIndex(ttl=app.config["REGION_INDEX_TTL"])
+    app.extensions["region_index"] = region_index
+    if app.config["REGION_INDEX_PRELOAD"]:
+        with app.app_context():
+            try:
+                if getattr(snapshot, "regions", None) is not None:
+                    # Snapshot files carry the region tree, no query needed at startup
+                    region_index.load(*region_index_rows(snapshot))
+                else:
+                    region_index.load()
+            except DBError as e:
+                # Retried lazily on the first request
+                logger.warning("Failed to preload region index Error: %s", e)
+
+    if app.config["PRICE_PARTITION_ENSURE_ON_STARTUP"]:
+        with app.app_context():
+            try:
+                PricePartitions(
+                    app.config["PRICE_PARTITION_INTERVAL"], app.config["PRICE_PARTITION_PREMAKE"]
+                ).ensure()
+            except DBError as e:
+                # Rows of missing partitions land in the default partition meanwhile
+                logger.warning("Failed to create price_detail partitions Error: %s", e)
+
+    app.extensions["rates_cache"] = create_cache(
+        app.config["RATES_CACHE_BACKEND"],
+        ttl=app.config["RATES_CACHE_TTL"],
+        max_bytes=app.config["RATES_CACHE_MAX_BYTES"],
+        redis_url=app.config["RATES_CACHE_REDIS_URL"],
+    )
+    app.extensions["rates_day_cache"] = create_cache(
+        app.config["RATES_DAY_CACHE_BACKEND"],
+        ttl=app.config["RATES_DAY_CACHE_TTL"],
+        max_bytes=app.config["RATES_DAY_CACHE_MAX_BYTES"],
+        redis_url=app.config["RATES_CACHE_REDIS_URL"],
+        prefix="rates_day",
+    )
+    app.extensions["rates_cache_invalidations"] = create_invalidation_listener(
+        app.extensions, app.config["RATES_CACHE_INVALIDATION_POLL"]
+    )
+    app.extensions["rates_warmed_keys"] = set()
+    if app.config["RATES_SINGLE_FLIGHT"]:
+        app.extensions["single_flight"] = SingleFlight("rates")
+    app.extensions["rates_tiers"] = create_rate_tiers(app.config)
+    if app.config["RATES_MAX_CONCURRENT"] > 0:
+        app.extensions["rates_admission"] = AdmissionController(
+            app.config["RATES_MAX_CONCURRENT"],
+            app.config["RATES_MAX_QUEUE"],
+            app.config["RATES_QUEUE_TIMEOUT"],
+        )
+    if app.config["METRICS_PROFILE_SAMPLE_RATE"] > 0:
+        app.extensions["slow_request_profiler"] = SlowRequestProfiler(
+            app.config["METRICS_PROFILE_SAMPLE_RATE"],
+            app.config["METRICS_PROFILE_SLOW_MS"] / 1000,
+            app.config["METRICS_PROFILE_DIR"],
+        )
+
+    @app.before_request
+    def bind_request_id():
+        # Every log record of the request carries its id
+        g.request_id = bind_request(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def add_request_id_header(response):
+        if "request_id" in g:
+            response.headers["X-Request-ID"] = g.request_id
+        return response
+
     return app
+
+
+def init_worker(app):
+    """Per process setup of a pre-forked worker, e.g. from gunicorn's post_worker_init.
+
+    Connections are never shared with the parent process: the inherited pools and
+    cache clients are dropped and the worker opens its own pool before its first request.
+    The region index and price snapshot loaded by the parent stay shared. With
+    RATES_WARMUP_ON_STARTUP the result cache is warmed before the worker serves requests.
+
+    :param app: Flask application instance created by ``create_app`` in the parent.
+    """
+    forget_inherited_pools()
+    for _, cache in get_caches(app.extensions):
+        cache.after_fork()
+    with app.app_context():
+        DB().get_pool()
+    if app.config["RATES_WARMUP_ON_STARTUP"]:
+        warm_rates_cache(app)
+
+
+def shutdown_worker(app):
+    """Closes the connections of a worker process before it exits.
+
+    :param app: Flask application instance of the worker.
+    """
+    close_pools()
+    for _, cache in get_caches(app.extensions):
+        cache.close()
@@ -0,0 +1,5 @@
+from async_app import create_async_app
+from config import DevelopmentConfig
+
+# Serve with an ASGI server, e.g. `hypercorn asgi:app --bind 0.0.0.0:5000`
+app = create_async_app(DevelopmentConfig)
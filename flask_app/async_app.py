@@ -0,0 +1,97 @@
+from typing import Type
+
+from quart import Quart, Response, g, request
+
+from config import Config
+from custom.errors import DBError
+from db_engine.async_postgres_db import AsyncPostGresDB, create_async_pool
+from end_points.async_rates_api import async_rates_bp
+from end_points.metrics_api import PROMETHEUS_MIMETYPE, collect_gauges
+from utils.logger import configure_logger, setup_logging, parse_log_levels, bind_request
+from utils.region_index import RegionIndex
+from utils.cache import create_cache
+from utils.metrics import metrics
+from utils.single_flight import AsyncSingleFlight
+from utils.admission import create_rate_tiers
+
+logger = configure_logger(__name__)
+
+
+def create_async_app(config_class: Type[Config] = Config) -> Quart:
+    """Create the async (ASGI) application.
+
+    Serves the same rates endpoints as ``create_app`` with an asyncio-native
+    Postgres pool, so one worker keeps many queries in flight. Run it with an
+    ASGI server, e.g. ``hypercorn asgi:app``.
+
+    :param config_class: Config Class. Quart + other configurations as class variables.
+    :type config_class: Config
+
+    :returns: Quart application instance.
+    :rtype: Quart
+    """
+    app = Quart(__name__)
+
+    # setting config
+    app.config.from_object(config_class)
+    setup_logging(
+        app.config["LOG_LEVEL"],
+        module_levels=parse_log_levels(app.config["LOG_LEVELS"]),
+        sample_rate=app.config["LOG_SAMPLE_RATE"],
+        log_format=app.config["LOG_FORMAT"],
+    )
+    app.register_blueprint(async_rates_bp, url_prefix="/rates")
+
+    app.extensions["region_index"] = RegionIndex(ttl=app.config["REGION_INDEX_TTL"])
+    app.extensions["rates_cache"] = create_cache(
+        app.config["RATES_CACHE_BACKEND"],
+        ttl=app.config["RATES_CACHE_TTL"],
+        max_bytes=app.config["RATES_CACHE_MAX_BYTES"],
+        redis_url=app.config["RATES_CACHE_REDIS_URL"],
+    )
+    if app.config["RATES_SINGLE_FLIGHT"]:
+        # One worker runs one event loop, its tasks share the in-flight queries
+        app.extensions["single_flight"] = AsyncSingleFlight("rates")
+    app.extensions["rates_tiers"] = create_rate_tiers(app.config)
+
+    @app.before_serving
+    async def open_db_pool():
+        # The asyncpg pool belongs to the event loop of the server
+        pool = await create_async_pool(app.config)
+        app.extensions["async_db_pool"] = pool
+        if app.config["REGION_INDEX_PRELOAD"]:
+            try:
+                await app.extensions["region_index"].ensure_fresh_async(AsyncPostGresDB(pool))
+            except DBError as e:
+                # Retried lazily on the first request
+                logger.warning("Failed to preload region index Error: %s", e)
+
+    @app.before_request
+    async def bind_request_id():
+        # Async hook, so the context variables are set in the request task itself
+        g.request_id = bind_request(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    async def add_request_id_header(response):
+        if "request_id" in g:
+            response.headers["X-Request-ID"] = g.request_id
+        return response
+
+    @app.route("/metrics")
+    async def get_metrics():
+        pool = app.extensions.get("async_db_pool")
+        pools_stats = {}
+        if pool is not None:
+            pools_stats["async"] = {
+                "size": pool.get_size(),
+                "idle": pool.get_idle_size(),
+                "max_size": pool.get_max_size(),
+            }
+        gauges = collect_gauges(app.extensions, pools_stats)
+        return Response(metrics.render(gauges), mimetype=PROMETHEUS_MIMETYPE)
+
+    @app.after_serving
+    async def close_db_pool():
+        await app.extensions.pop("async_db_pool").close()
+
+    return app
@@ -0,0 +1,425 @@
+"""
+Load test of the rates API.
+
+Replays or synthesizes request mixes against ``create_app`` (in process) or a
+running server (``--url``) and reports latency percentiles, throughput and
+queries per request. In process, queries are the checkouts of the connection
+pool. Against a server they are approximated by the transactions Postgres
+counted for the database, which include parallel query workers.
+
+Usage (from flask_app/, with the DBMS / *_HOST / ... env of the app):
+    python -m benchmarks.bench_rates --load --scale 10
+    python -m benchmarks.bench_rates --mix wide_region --requests 500 --concurrency 8
+    python -m benchmarks.bench_rates --url http://127.0.0.1:5000 --replay urls.txt
+    python -m benchmarks.bench_rates --load --years 1,4,8 --partition month --mix all
+    python -m benchmarks.bench_rates --load --years 1,8 --max-p95-growth 1.2
+    python -m benchmarks.bench_rates --serve gunicorn --workers 4 --threads 4 --concurrency 16
+    python -m benchmarks.bench_rates --mix narrow_port --plan-cache-mode force_generic_plan
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from db_engine.prepared import PLAN_CACHE_MODES
+from benchmarks import dataset, workload
+
+
+def percentile(sorted_values, pct):
+    """Nearest rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class InProcessClient:
+    """Sends requests to a ``create_app`` instance, one test client per thread."""
+
+    def __init__(self, app, accept):
+        self.app = app
+        self.accept = accept
+        self._local = threading.local()
+
+    def get(self, url):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(url, headers={"Accept": self.accept})
+        # Drain streamed responses so their queries are part of the latency
+        response.get_data()
+        return response.status_code
+
+    def query_count(self):
+        """Queries sent so far, every query checks out a pooled connection."""
+        from db_engine.db import DB
+
+        with self.app.app_context():
+            return DB().get_pool_stats()["checkouts"]
+
+
+class HTTPClient:
+    """Sends requests to a running server."""
+
+    def __init__(self, base_url, accept, database, stats_wait, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.accept = accept
+        self.database = database
+        self.stats_wait = stats_wait
+        self.timeout = timeout
+
+    def get(self, url):
+        request = urllib.request.Request(self.base_url + url, headers={"Accept": self.accept})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def query_count(self):
+        """Transactions of the database, once the server's backends reported their stats."""
+        time.sleep(self.stats_wait)
+        return dataset.transaction_count(Config, self.database)
+
+
+def run(client, urls, concurrency):
+    """
+    Sends every url once with concurrency threads.
+
+    Returns:
+        (latencies in seconds, number of non 200 responses, wall time in seconds)
+    """
+
+    def timed_get(url):
+        start = time.perf_counter()
+        status = client.get(url)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_get, urls))
+    wall_time = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return latencies, errors, wall_time
+
+
+def report(mix, latencies, errors, wall_time, queries, years=1):
+    count = len(latencies)
+    return {
+        "mix": mix,
+        "years": years,
+        "requests": count,
+        "errors": errors,
+        "throughput": count / wall_time if wall_time else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "queries_per_request": queries / count if count else None,
+    }
+
+
+def print_report(result):
+    queries = result["queries_per_request"]
+    print(
+        f"{result['mix']:<14} {result['years']:>5} {result['requests']:>8} {result['errors']:>7}"
+        f" {result['throughput']:>9.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+        f" {result['p99_ms']:>9.2f} {result['max_ms']:>9.2f}"
+        f" {'-' if queries is None else f'{queries:.2f}':>8}"
+    )
+
+
+def check_sweep(results, max_growth):
+    """
+    Compares the p95 latency of every mix at the last step of a --years sweep to the first one.
+
+    Args:
+        results: Reports of the sweep, in the order of its steps.
+        max_growth (float): Highest tolerated ratio of the last p95 to the first one.
+
+    Returns:
+        List of {"mix", "first_p95_ms", "last_p95_ms", "growth", "regressed"} dicts
+    """
+    steps = {}
+    for result in results:
+        steps.setdefault(result["mix"], []).append(result)
+    checks = []
+    for mix, reports in steps.items():
+        first, last = reports[0]["p95_ms"], reports[-1]["p95_ms"]
+        growth = last / first if first else (float("inf") if last else 1.0)
+        checks.append(
+            {
+                "mix": mix,
+                "first_p95_ms": first,
+                "last_p95_ms": last,
+                "growth": growth,
+                "regressed": growth > max_growth,
+            }
+        )
+    return checks
+
+
+def create_bench_app(database, cache, engine="postgres", prepared=True, plan_cache_mode="auto"):
+    from app import create_app
+
+    class BenchConfig(Config):
+        DB_NAME = database
+        PRICE_ENGINE = engine
+        DB_PREPARED_STATEMENTS = prepared
+        DB_PLAN_CACHE_MODE = plan_cache_mode
+        RATES_CACHE_BACKEND = "memory" if cache else "none"
+        RATES_DAY_CACHE_BACKEND = "memory" if cache else "none"
+        LOG_LEVEL = "WARNING"
+
+    return create_app(BenchConfig)
+
+
+def start_server(args):
+    """
+    Starts the app on a free local port, ``dev`` is the werkzeug server of ``python wsgi.py``.
+
+    Returns:
+        (server process, base url)
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(
+        os.environ,
+        **{
+            f"{Config.DBMS}_DB": args.database,
+            "PRICE_ENGINE": args.engine,
+            "DB_PREPARED_STATEMENTS": str(not args.no_prepared),
+            "DB_PLAN_CACHE_MODE": args.plan_cache_mode,
+            "RATES_CACHE_BACKEND": "memory" if args.cache else "none",
+            "RATES_DAY_CACHE_BACKEND": "memory" if args.cache else "none",
+            "LOG_LEVEL": "WARNING",
+            "SERVER_BIND": f"127.0.0.1:{port}",
+            "SERVER_WORKERS": str(args.workers),
+            "SERVER_THREADS": str(args.threads),
+        },
+    )
+    if args.serve == "dev":
+        command = [sys.executable, "-m", "flask", "--app", "wsgi", "run", "--port", str(port)]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "wsgi:app"]
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            with urllib.request.urlopen(base_url + "/metrics", timeout=1):
+                return process, base_url
+        except (urllib.error.URLError, OSError):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"{args.serve} server did not start")
+            time.sleep(0.2)
+
+
+def run_mixes(args, years, universe=None):
+    """
+    Runs every requested mix against the current content of the database.
+
+    Args:
+        universe (dict): Lanes and dates to synthesize requests from, read from the database if None.
+
+    Returns:
+        (results, universe)
+    """
+    conn = dataset.connect(Config, args.database)
+    universe = universe or workload.load_universe(conn)
+    print(f"Dataset {args.database}: {dataset.table_counts(conn)}")
+    conn.close()
+
+    if args.url:
+        client = HTTPClient(args.url, args.accept, args.database, args.stats_wait)
+    else:
+        app = create_bench_app(
+            args.database, args.cache, args.engine, not args.no_prepared, args.plan_cache_mode
+        )
+        if args.engine == "mmap":
+            from db_engine.mmap_db import export_from_database
+
+            # Snapshot of the current content, mapped like a worker would
+            with app.app_context():
+                export_from_database(app.config["PRICE_SNAPSHOT_PATH"])
+                app.extensions["price_engine"].load()
+        client = InProcessClient(app, args.accept)
+
+    if args.replay:
+        mixes = {"replay": workload.replay(args.replay, args.requests)}
+    else:
+        names = workload.MIXES if args.mix == "all" else (args.mix,)
+        mixes = {
+            name: workload.synthesize(universe, name, args.requests, args.seed) for name in names
+        }
+
+    print(
+        f"{'mix':<14} {'years':>5} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>9}"
+        f" {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8}"
+    )
+    results = []
+    for name, urls in mixes.items():
+        # Warm up pools and region index, on requests other than the measured ones
+        warmup = (
+            urls[: args.warmup]
+            if args.replay
+            else workload.synthesize(universe, name, args.warmup, args.seed + 1)
+        )
+        run(client, warmup, args.concurrency)
+
+        before = client.query_count()
+        latencies, errors, wall_time = run(client, urls, args.concurrency)
+        after = client.query_count()
+
+        result = report(name, latencies, errors, wall_time, after - before, years)
+        print_report(result)
+        results.append(result)
+    return results, universe
+
+
+def load_database(args, years):
+    """(Re)creates the benchmark database with years of prices, partitioned if requested."""
+    from db_engine.postgres_db import close_pools
+
+    # Pooled connections of a previous run would block DROP DATABASE
+    close_pools()
+    dataset.recreate_database(Config, args.database)
+    conn = dataset.connect(Config, args.database)
+    dataset.load_dump(conn)
+    dataset.scale_prices(conn, args.scale)
+    dataset.add_years(conn, years - 1)
+    last_day = dataset.table_counts(conn)["last_day"]
+    conn.close()
+
+    if args.partition != "none":
+        from db_engine.partitions import PricePartitions
+
+        # Premake relative to the dataset, not to today, keeps the partition count realistic
+        with create_bench_app(args.database, cache=False).app_context():
+            PricePartitions(args.partition, premake=3).convert(last_day)
+        close_pools()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the rates API")
+    parser.add_argument("--database", default="rates_bench", help="Benchmark database name")
+    parser.add_argument(
+        "--load", action="store_true", help="(Re)create the database from rates.sql"
+    )
+    parser.add_argument("--scale", type=int, default=1, help="Multiply price_detail rows on --load")
+    parser.add_argument(
+        "--years",
+        default="1",
+        help="Years of prices on --load, a comma separated list runs one load per value",
+    )
+    parser.add_argument(
+        "--partition",
+        choices=("none", "month", "year"),
+        default="none",
+        help="Partition price_detail by day after --load",
+    )
+    parser.add_argument("--mix", default="mixed", help=f"One of {', '.join(workload.MIXES)} or all")
+    parser.add_argument("--replay", help="File with one request url per line")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per mix")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests before each mix")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads")
+    parser.add_argument("--accept", default="application/json", help="Accept header")
+    parser.add_argument("--cache", action="store_true", help="Enable the result caches")
+    parser.add_argument(
+        "--engine", choices=("postgres", "numpy", "mmap"), default="postgres", help="PRICE_ENGINE"
+    )
+    parser.add_argument(
+        "--no-prepared", action="store_true", help="Disable the prepared statements"
+    )
+    parser.add_argument(
+        "--plan-cache-mode",
+        choices=PLAN_CACHE_MODES,
+        default="auto",
+        help="DB_PLAN_CACHE_MODE, compares generic and custom plans of the prepared statements",
+    )
+    parser.add_argument("--url", help="Benchmark a running server instead of create_app")
+    parser.add_argument(
+        "--serve",
+        choices=("dev", "gunicorn"),
+        help="Start the app with the werkzeug dev server or gunicorn and benchmark it over HTTP",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="SERVER_WORKERS (--serve only)")
+    parser.add_argument("--threads", type=int, default=4, help="SERVER_THREADS (--serve only)")
+    parser.add_argument(
+        "--stats-wait",
+        type=float,
+        default=11.0,
+        help="Seconds to wait for a running server's backends to report stats (--url/--serve)",
+    )
+    parser.add_argument(
+        "--max-p95-growth",
+        type=float,
+        default=1.5,
+        help="Fail a --years sweep if the p95 of the last step exceeds the first one this many times",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthesized requests")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    years_sweep = [int(years) for years in args.years.split(",")]
+    if len(years_sweep) > 1 and not args.load:
+        parser.error("--years with several values needs --load")
+    if args.serve and args.url:
+        parser.error("--serve and --url are exclusive")
+
+    results = []
+    universe = None
+    for years in years_sweep:
+        if args.load:
+            load_database(args, years)
+        server = None
+        if args.serve:
+            server, args.url = start_server(args)
+        try:
+            # Every step of a sweep sends the requests of the first one, only the history grows
+            mix_results, universe = run_mixes(args, years, universe)
+        finally:
+            if server is not None:
+                # Its connections would block the next --load
+                server.terminate()
+                server.wait()
+                args.url = None
+        results += mix_results
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if len(years_sweep) > 1:
+        checks = check_sweep(results, args.max_p95_growth)
+        print(f"p95 growth from {years_sweep[0]} to {years_sweep[-1]} years:")
+        for check in checks:
+            flag = "REGRESSED" if check["regressed"] else "ok"
+            print(
+                f"{check['mix']:<14} {flag:<9} {check['first_p95_ms']:>9.2f} ms"
+                f" -> {check['last_p95_ms']:>9.2f} ms  x{check['growth']:.2f}"
+            )
+        # Non zero exit status lets CI fail when latency grows with the history
+        if any(check["regressed"] for check in checks):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
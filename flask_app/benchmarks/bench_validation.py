@@ -0,0 +1,85 @@
+"""
+Micro benchmark of the RateAPI request validation.
+
+Compares the previous per request path (regexes compiled on every call, dates
+parsed with strptime, SQL injection regex on origin/destination) with the
+precompiled allowlist validator, on valid and on pathological inputs.
+
+Usage (from flask_app/):
+    python -m benchmarks.bench_validation [--number 20000]
+"""
+
+import argparse
+import re
+import timeit
+from datetime import datetime
+
+from custom.errors import ValidationError
+from utils.constants import (
+    MAX_LENGTH_OF_STRING,
+    MIN_LENGTH_OF_STRING,
+    REGEX_FOR_SQL_INJECTION,
+    REGEX_FOR_STR_LENGTH,
+)
+from utils.data_validator import rate_api_validation
+
+VALID = {
+    "date_from": "2016-01-01",
+    "date_to": "2016-01-10",
+    "origin": "CNSGH",
+    "destination": "north_europe_main",
+}
+
+CASES = {
+    "valid": VALID,
+    "injection": {**VALID, "origin": "x' or 1=1 --"},
+    # Internal whitespace makes the injection regex backtrack
+    "tabs": {**VALID, "origin": "x" + "\t" * 23 + "x"},
+    "spaces": {**VALID, "origin": "x" + " " * 23 + "x"},
+}
+
+
+def legacy_validate(params):
+    """The validation path before the allowlist grammar, kept for comparison."""
+    param_data = {key.strip(): value.strip() for key, value in params.items()}
+    if sorted(param_data) != sorted(["date_from", "date_to", "origin", "destination"]):
+        raise ValidationError("keys")
+    start = datetime.strptime(param_data["date_from"], "%Y-%m-%d")
+    end = datetime.strptime(param_data["date_to"], "%Y-%m-%d")
+    if start > end:
+        raise ValidationError("order")
+    for value in (param_data["origin"], param_data["destination"]):
+        pattern = re.compile(REGEX_FOR_STR_LENGTH % (MIN_LENGTH_OF_STRING, MAX_LENGTH_OF_STRING))
+        if not pattern.match(value):
+            raise ValidationError("length")
+        if re.compile(REGEX_FOR_SQL_INJECTION, re.IGNORECASE).search(value):
+            raise ValidationError("injection")
+    return param_data
+
+
+def time_per_call(validate, params, number):
+    def call():
+        try:
+            validate(params)
+        except ValidationError:
+            pass
+
+    return min(timeit.repeat(call, number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run")
+    args = parser.parse_args()
+
+    print(f"{'case':<10} {'legacy us':>12} {'new us':>12} {'speedup':>9}")
+    for name, params in CASES.items():
+        # The pathological cases are slow on the legacy path, keep them short
+        number = args.number if name in ("valid", "injection") else max(args.number // 1000, 5)
+        legacy = time_per_call(legacy_validate, params, number)
+        new = time_per_call(rate_api_validation.validate_rates_args, params, args.number)
+        print(f"{name:<10} {legacy * 1e6:>12.2f} {new * 1e6:>12.2f} {legacy / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Loads the rates dataset into a benchmark database and scales it up.
+"""
+
+import io
+from pathlib import Path
+
+import psycopg2
+
+RATES_DUMP = Path(__file__).resolve().parents[2] / "postgres" / "rates.sql"
+
+
+def connect(config, db_name=None):
+    return psycopg2.connect(
+        dbname=db_name or config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+    )
+
+
+def recreate_database(config, db_name):
+    """Drops and creates db_name."""
+    conn = connect(config, db_name="postgres")
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
+        cur.execute(f'CREATE DATABASE "{db_name}"')
+    conn.close()
+
+
+def load_dump(conn, path=RATES_DUMP):
+    """
+    Executes a pg_dump plain SQL file, including its ``COPY ... FROM stdin`` blocks.
+
+    psycopg2 can not run those blocks as part of a script, so the statements
+    in between are executed as is and every data block goes through copy_expert.
+    """
+    statements = []
+
+    def flush(cur):
+        # Skip chunks made of comments only, psycopg2 refuses empty queries
+        if any(line.strip() and not line.startswith("--") for line in statements):
+            cur.execute("".join(statements))
+        statements.clear()
+
+    with open(path) as dump, conn.cursor() as cur:
+        for line in dump:
+            if line.startswith("COPY ") and line.rstrip().endswith("FROM stdin;"):
+                flush(cur)
+                data = io.StringIO()
+                for data_line in dump:
+                    if data_line.rstrip("\n") == "\\.":
+                        break
+                    data.write(data_line)
+                data.seek(0)
+                cur.copy_expert(line, data)
+            else:
+                statements.append(line)
+        flush(cur)
+    conn.commit()
+
+
+def scale_prices(conn, factor, seed=0.42):
+    """
+    Multiplies the price_detail rows by factor.
+
+    The copies keep route and day of the original rows with prices jittered by
+    up to +-5%, so every request hits factor times the rows it hits at scale 1.
+    """
+    if factor <= 1:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", (seed,))
+        cur.execute(
+            """
+            INSERT INTO price_detail (id, route_id, day, price)
+            SELECT p.id + g * m.max_id, p.route_id, p.day,
+                   (p.price * (0.95 + random() * 0.1))::integer
+            FROM price_detail AS p
+            CROSS JOIN (SELECT max(id) AS max_id FROM price_detail) AS m
+            CROSS JOIN generate_series(1, %s) AS g
+            """,
+            (factor - 1,),
+        )
+        rows = cur.rowcount
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.autocommit = False
+    return rows
+
+
+def add_years(conn, years):
+    """
+    Adds years of history before the loaded prices.
+
+    Copy k holds the rows shifted k years back, so requests on the original
+    dates hit the same rows while the table grows by one dataset per year.
+    """
+    if years <= 0:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO price_detail (id, route_id, day, price)
+            SELECT p.id + k * m.max_id, p.route_id, (p.day - make_interval(years => k))::date,
+                   p.price
+            FROM price_detail AS p
+            CROSS JOIN (SELECT max(id) AS max_id FROM price_detail) AS m
+            CROSS JOIN generate_series(1, %s) AS k
+            """,
+            (years,),
+        )
+        rows = cur.rowcount
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.autocommit = False
+    return rows
+
+
+def table_counts(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT (SELECT count(*) FROM route), (SELECT count(*) FROM price_detail),"
+            " (SELECT min(day) FROM price_detail), (SELECT max(day) FROM price_detail)"
+        )
+        routes, prices, first_day, last_day = cur.fetchone()
+    return {"routes": routes, "price_rows": prices, "first_day": first_day, "last_day": last_day}
+
+
+def transaction_count(config, db_name):
+    """
+    Committed plus rolled back transactions of db_name from pg_stat_database.
+
+    Backends report their stats only after being idle for a while (or on exit),
+    so wait some seconds after a run before reading the counter.
+    """
+    conn = connect(config, db_name="postgres")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = %s",
+                (db_name,),
+            )
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
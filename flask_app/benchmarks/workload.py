@@ -0,0 +1,101 @@
+"""
+Request mixes of the rates API benchmark, synthesized from the loaded dataset or replayed from a file.
+"""
+
+import json
+import random
+from datetime import timedelta
+from urllib.parse import urlencode
+
+MIXES = ("narrow_port", "wide_port", "narrow_region", "wide_region", "mixed")
+
+# Narrow requests cover 1 to NARROW_MAX_DAYS days
+NARROW_MAX_DAYS = 7
+
+
+def load_universe(conn):
+    """Reads the lanes and regions requests are synthesized from."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT orig_code, dest_code FROM route ORDER BY id")
+        port_lanes = cur.fetchall()
+        cur.execute("SELECT slug, parent_slug FROM regions")
+        regions = cur.fetchall()
+        cur.execute("SELECT min(day), max(day) FROM price_detail")
+        first_day, last_day = cur.fetchone()
+
+    parents = {parent for _, parent in regions if parent is not None}
+    return {
+        "port_lanes": port_lanes,
+        # Leaves of the region tree cover few ports, top level regions cover whole continents
+        "leaf_regions": sorted(slug for slug, _ in regions if slug not in parents),
+        "top_regions": sorted(slug for slug, parent in regions if parent is None),
+        "first_day": first_day,
+        "last_day": last_day,
+    }
+
+
+def _rates_url(origin, destination, date_from, date_to):
+    query = urlencode(
+        {
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat(),
+            "origin": origin,
+            "destination": destination,
+        }
+    )
+    return f"/rates/?{query}"
+
+
+def _narrow_range(rng, universe):
+    span = (universe["last_day"] - universe["first_day"]).days
+    days = rng.randint(1, min(NARROW_MAX_DAYS, span + 1))
+    start = universe["first_day"] + timedelta(days=rng.randint(0, span + 1 - days))
+    return start, start + timedelta(days=days - 1)
+
+
+def _wide_range(universe):
+    return universe["first_day"], universe["last_day"]
+
+
+def synthesize(universe, mix, count, seed=0):
+    """
+    Generates count request urls of a mix.
+
+    Args:
+        universe (dict): Output of ``load_universe``.
+        mix (str): One of MIXES, mixed draws uniformly from the other ones.
+        count (int): Number of urls.
+        seed (int): Seed making the workload repeatable.
+    """
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(count):
+        kind = rng.choice(MIXES[:-1]) if mix == "mixed" else mix
+        if kind.endswith("_port"):
+            origin, destination = rng.choice(universe["port_lanes"])
+        elif kind == "narrow_region":
+            origin, destination = rng.sample(universe["leaf_regions"], 2)
+        else:
+            origin, destination = rng.sample(universe["top_regions"], 2)
+        dates = _narrow_range(rng, universe) if kind.startswith("narrow") else _wide_range(universe)
+        urls.append(_rates_url(origin, destination, *dates))
+    return urls
+
+
+def replay(path, count=None):
+    """
+    Reads request urls from a file, one per line.
+
+    Lines are either a url (``/rates/?...``) or a JSON object with a ``url`` key.
+    The urls are repeated to fill count if the file has fewer lines.
+    """
+    urls = []
+    with open(path) as requests_file:
+        for line in requests_file:
+            line = line.strip()
+            if not line:
+                continue
+            urls.append(json.loads(line)["url"] if line.startswith("{") else line)
+    if count and urls:
+        urls = (urls * (count // len(urls) + 1))[:count]
+    return urls
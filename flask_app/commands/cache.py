@@ -0,0 +1,58 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from utils.cache import get_caches, invalidate_cached_days, record_day_changes
+from utils.cache_warmer import warm_rates_cache
+
+cache_cli = AppGroup("cache", help="Manage the /rates/ result and day caches.")
+
+
+def _get_caches():
+    caches = get_caches(current_app.extensions)
+    if not caches:
+        raise click.ClickException(
+            "Result caches are disabled (RATES_CACHE_BACKEND=none, RATES_DAY_CACHE_BACKEND=none)"
+        )
+    return caches
+
+
+@cache_cli.command("invalidate")
+@click.option("--day", "days", multiple=True, required=True, help="Day to invalidate (YYYY-MM-DD).")
+def invalidate_cache(days):
+    """Drop cached results and cached days covering the given days.
+
+    Shared caches are invalidated right away, the in-process caches of the workers
+    within RATES_CACHE_INVALIDATION_POLL seconds.
+    """
+    _get_caches()
+    record_day_changes(days)
+    count = invalidate_cached_days(current_app.extensions, days)
+    click.echo(f"Invalidated {count} cached results")
+
+
+@cache_cli.command("clear")
+def clear_cache():
+    """Drop every cached result and cached day."""
+    for name, cache in _get_caches():
+        cache.clear()
+        click.echo(f"Cleared {name}")
+
+
+@cache_cli.command("warm")
+@click.option("--top", "top_n", type=int, default=None, help="Lanes to warm (RATES_WARMUP_TOP_N).")
+@click.option(
+    "--concurrency", type=int, default=None, help="Requests in flight (RATES_WARMUP_CONCURRENCY)."
+)
+@click.option("--log", "log_path", default=None, help="Request log to mine (RATES_WARMUP_LOG).")
+def warm_cache(top_n, concurrency, log_path):
+    """Fill the result cache with the most requested lanes of the request log.
+
+    Only useful with a shared backend, in-process caches are warmed by the workers
+    on startup (RATES_WARMUP_ON_STARTUP).
+    """
+    _get_caches()
+    results = warm_rates_cache(
+        current_app._get_current_object(), top_n, concurrency=concurrency, log_path=log_path
+    )
+    click.echo(", ".join(f"{count} {result}" for result, count in results.items()))
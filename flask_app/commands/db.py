@@ -0,0 +1,55 @@
+import json
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db_engine.migrations import Migrations, PlanCheck
+from utils.region_index import get_region_index
+
+db_cli = AppGroup("db", help="Manage schema migrations and check query plans.")
+
+
+@db_cli.command("apply")
+@click.option("--target", type=int, default=None, help="Apply migrations up to this version.")
+def apply_migrations(target):
+    """Apply the pending migrations."""
+    applied = Migrations().apply(target)
+    for migration in applied:
+        click.echo(f"Applied {migration.version:04d} {migration.name}")
+    if not applied:
+        click.echo("No pending migrations")
+
+
+@db_cli.command("status")
+def migrations_status():
+    """List the migrations and whether they are applied."""
+    for migration, applied_at, changed in Migrations().status():
+        state = "pending" if applied_at is None else f"applied {applied_at:%Y-%m-%d %H:%M:%S}"
+        if changed:
+            state += " (file changed after it was applied)"
+        click.echo(f"{migration.version:04d} {migration.name:<40} {state}")
+
+
+@db_cli.command("check")
+@click.option("--rollup", is_flag=True, default=None, help="Check the rollup query.")
+@click.option("--json", "as_json", is_flag=True, help="Print the results as JSON.")
+def check_plans(rollup, as_json):
+    """EXPLAIN (ANALYZE, BUFFERS) representative requests and flag sequential scans."""
+    use_rollup = current_app.config["USE_PRICE_ROLLUP"] if rollup is None else rollup
+    results = PlanCheck(get_region_index(), use_rollup).run()
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            flag = "REGRESSED" if result["regressed"] else "ok"
+            seq_scans = ", ".join(result["seq_scans"]) or "-"
+            click.echo(
+                f"{result['name']:<16} {flag:<9} {result['execution_ms']:>9.2f} ms"
+                f"  buffers hit={result['shared_hit']} read={result['shared_read']}"
+                f"  seq scans: {seq_scans}"
+            )
+    # Non zero exit status lets CI fail on plan regressions
+    if any(result["regressed"] for result in results):
+        sys.exit(1)
@@ -0,0 +1,53 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db_engine.ingest import FORMATS, MODES, PriceIngest, detect_format
+from db_engine.partitions import PricePartitions
+from utils.cache import invalidate_cached_days
+
+ingest_cli = AppGroup("ingest", help="Load prices into price_detail.")
+
+
+@ingest_cli.command("prices")
+@click.argument("input_file", type=click.File("r"))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None, help="Input format.")
+@click.option(
+    "--mode",
+    type=click.Choice(MODES),
+    default="append",
+    help="append adds the prices, upsert replaces the prices of their (route, day).",
+)
+@click.option("--chunk-rows", type=int, default=None, help="Rows sent per COPY.")
+def ingest_prices(input_file, fmt, mode, chunk_rows):
+    """Load prices from a CSV (route_id,day,price header) or NDJSON file, - reads stdin."""
+    fmt = fmt or detect_format(input_file.name)
+    chunk_rows = chunk_rows or current_app.config["INGEST_CHUNK_ROWS"]
+    stats = PriceIngest(mode, chunk_rows).ingest(input_file, fmt)
+
+    partitions = PricePartitions(
+        current_app.config["PRICE_PARTITION_INTERVAL"],
+        current_app.config["PRICE_PARTITION_PREMAKE"],
+    )
+    if stats["days"] and partitions.is_partitioned():
+        # Moves rows of days without a partition out of the default partition
+        partitions.ensure()
+
+    # Caches of this process, the workers drop the changed days recorded by the
+    # ingestion from their in-process caches within RATES_CACHE_INVALIDATION_POLL seconds
+    invalidated = invalidate_cached_days(current_app.extensions, stats["days"])
+
+    click.echo(
+        f"Inserted {stats['rows_inserted']} rows (replaced {stats['rows_deleted']}) of"
+        f" {stats['rows_read']} read in {stats['seconds']:.2f}s,"
+        f" {stats['rows_per_second']:.0f} rows/s"
+    )
+    click.echo(
+        f"Rejected {stats['rows_rejected']} malformed rows and"
+        f" {stats['unknown_route_rows']} rows of unknown routes"
+    )
+    if stats["days"]:
+        click.echo(
+            f"Affected days {stats['days'][0]} to {stats['days'][-1]},"
+            f" invalidated {invalidated} cached results"
+        )
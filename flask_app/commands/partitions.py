@@ -0,0 +1,42 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db_engine.partitions import INTERVALS, PricePartitions
+
+partitions_cli = AppGroup("partitions", help="Manage the range partitions of price_detail.")
+
+
+def _price_partitions(interval=None, premake=None):
+    return PricePartitions(
+        interval or current_app.config["PRICE_PARTITION_INTERVAL"],
+        current_app.config["PRICE_PARTITION_PREMAKE"] if premake is None else premake,
+    )
+
+
+@partitions_cli.command("convert")
+@click.option("--interval", type=click.Choice(INTERVALS), default=None, help="Partition size.")
+@click.option("--premake", type=int, default=None, help="Future partitions to create ahead.")
+def convert_partitions(interval, premake):
+    """Move price_detail into a table partitioned by day (locks the table while copying)."""
+    count = _price_partitions(interval, premake).convert()
+    click.echo(f"price_detail partitioned into {count} partitions")
+
+
+@partitions_cli.command("ensure")
+@click.option("--premake", type=int, default=None, help="Future partitions to create ahead.")
+def ensure_partitions(premake):
+    """Create the upcoming partitions and move rows out of the default partition."""
+    created = _price_partitions(premake=premake).ensure()
+    click.echo(f"Created {', '.join(created)}" if created else "Partitions are up to date")
+
+
+@partitions_cli.command("status")
+def partitions_status():
+    """List the partitions of price_detail."""
+    price_partitions = _price_partitions()
+    if not price_partitions.is_partitioned():
+        click.echo("price_detail is not partitioned")
+        return
+    for name, bound, rows in price_partitions.partitions():
+        click.echo(f"{name:<28} {bound:<60} ~{max(rows, 0)} rows")
@@ -0,0 +1,15 @@
+import click
+from flask.cli import AppGroup
+
+from db_engine.rollup import PriceRollup
+
+rollup_cli = AppGroup("rollup", help="Manage the daily price rollup.")
+
+
+@rollup_cli.command("build")
+@click.option("--date-from", default=None, help="First day to backfill (YYYY-MM-DD).")
+@click.option("--date-to", default=None, help="Last day to backfill (YYYY-MM-DD).")
+def build_rollup(date_from, date_to):
+    """Create the rollup table/triggers and backfill it from price_detail."""
+    rows = PriceRollup().build(date_from, date_to)
+    click.echo(f"Price rollup built with {rows} (route, day) rows")
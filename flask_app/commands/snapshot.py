@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db_engine.mmap_db import export_from_database, open_snapshot
+
+snapshot_cli = AppGroup("snapshot", help="Manage the price snapshot file of PRICE_ENGINE=mmap.")
+
+
+@snapshot_cli.command("export")
+@click.option("--path", default=None, help="Snapshot file, PRICE_SNAPSHOT_PATH by default.")
+def export_price_snapshot(path):
+    """Write route, regions and price_detail to a new snapshot file version.
+
+    The file is replaced atomically, running workers switch to it on their next check.
+    """
+    path = path or current_app.config["PRICE_SNAPSHOT_PATH"]
+    metadata = export_from_database(path)
+    click.echo(f"Exported snapshot {metadata['version']} with {metadata['rows']} rows to {path}")
+
+
+@snapshot_cli.command("info")
+@click.option("--path", default=None, help="Snapshot file, PRICE_SNAPSHOT_PATH by default.")
+def price_snapshot_info(path):
+    """Show the version and size of a snapshot file."""
+    path = path or current_app.config["PRICE_SNAPSHOT_PATH"]
+    snapshot = open_snapshot(path)
+    created_at = datetime.fromtimestamp(snapshot.version / 1e9)
+    click.echo(
+        f"Snapshot {snapshot.version} ({created_at:%Y-%m-%d %H:%M:%S}) with {len(snapshot)} rows,"
+        f" {len(snapshot.routes)} routes and {len(snapshot.regions)} regions"
+    )
@@ -10,6 +10,148 @@ class Config:
     DB_PASSWORD = os.getenv(f"{DBMS}_PASSWORD")
     DB_NAME = os.getenv(f"{DBMS}_DB")
 
+    # Logging, records are written by a background thread. LOG_LEVELS overrides
+    # the level per module (``db_engine.postgres_db=WARNING,utils.cache=DEBUG``)
+    # and INFO/DEBUG records are kept for LOG_SAMPLE_RATE of the requests.
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+    # Server-Timing header with the time spent per stage of /rates/ requests.
+    # METRICS_PROFILE_SAMPLE_RATE of the requests run under cProfile and the
+    # profiles of those slower than METRICS_PROFILE_SLOW_MS are kept.
+    METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "True") == "True"
+    METRICS_PROFILE_SAMPLE_RATE = float(os.getenv("METRICS_PROFILE_SAMPLE_RATE", 0.0))
+    METRICS_PROFILE_SLOW_MS = float(os.getenv("METRICS_PROFILE_SLOW_MS", 1000))
+    METRICS_PROFILE_DIR = os.getenv("METRICS_PROFILE_DIR", "logs/profiles")
+
+    # Production server, see gunicorn.conf.py. SERVER_WORKERS pre-forked processes
+    # serve SERVER_THREADS requests each and are replaced after SERVER_MAX_REQUESTS
+    # requests (plus up to SERVER_MAX_REQUESTS_JITTER). Every worker has its own
+    # connection pool, keep SERVER_WORKERS * DB_POOL_MAX_SIZE below max_connections.
+    SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:5000")
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", 4))
+    SERVER_PRELOAD = os.getenv("SERVER_PRELOAD", "True") == "True"
+    SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 10000))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 1000))
+    SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 60))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+    SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", 5))
+
+    # Connection pool, sized per worker process
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))
+    DB_POOL_HEALTH_CHECK = os.getenv("DB_POOL_HEALTH_CHECK", "True") == "True"
+    DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+
+    # Hot queries (PREPARED_QUERIES of queries/sql_queries.py) run as server side prepared
+    # statements, prepared once per pooled connection. DB_PLAN_CACHE_MODE sets plan_cache_mode
+    # of the sessions: auto (server default), force_generic_plan or force_custom_plan
+    DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "True") == "True"
+    DB_PLAN_CACHE_MODE = os.getenv("DB_PLAN_CACHE_MODE", "auto")
+
+    # Read replicas of the read-only /rates/ queries as ``host:port,host:port``, empty
+    # sends every query to DB_HOST. DB_READ_BALANCE is round_robin or least_outstanding.
+    # A replica failing DB_READ_MAX_ERRORS queries in a row, failing a health check or
+    # lagging more than DB_READ_MAX_LAG_SECONDS (0 disables it) is skipped.
+    DB_READ_HOSTS = os.getenv("DB_READ_HOSTS", "")
+    DB_READ_BALANCE = os.getenv("DB_READ_BALANCE", "round_robin")
+    DB_READ_MAX_ERRORS = int(os.getenv("DB_READ_MAX_ERRORS", 3))
+    DB_READ_EJECT_SECONDS = float(os.getenv("DB_READ_EJECT_SECONDS", 30))
+    DB_READ_MAX_LAG_SECONDS = float(os.getenv("DB_READ_MAX_LAG_SECONDS", 0))
+    DB_READ_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_READ_HEALTH_CHECK_INTERVAL", 5))
+    DB_READ_FALLBACK_TO_PRIMARY = os.getenv("DB_READ_FALLBACK_TO_PRIMARY", "True") == "True"
+
+    # Region tree index, loaded at startup and reloaded after the TTL (seconds)
+    REGION_INDEX_PRELOAD = True
+    REGION_INDEX_TTL = float(os.getenv("REGION_INDEX_TTL", 3600))
+
+    # Read averages from the price_daily_rollup table (see `flask rollup build`)
+    USE_PRICE_ROLLUP = os.getenv("USE_PRICE_ROLLUP", "False") == "True"
+
+    # Engine computing /rates/ averages, postgres, numpy (in-memory snapshot of price_detail) or
+    # mmap (snapshot file of `flask snapshot export` shared by the workers), numpy and mmap
+    # require `pip install numpy`. Snapshots pick up changes every PRICE_ENGINE_REFRESH_SECONDS
+    PRICE_ENGINE = os.getenv("PRICE_ENGINE", "postgres")
+    PRICE_ENGINE_PRELOAD = True
+    PRICE_ENGINE_REFRESH_SECONDS = float(os.getenv("PRICE_ENGINE_REFRESH_SECONDS", 60))
+    PRICE_SNAPSHOT_PATH = os.getenv("PRICE_SNAPSHOT_PATH", "snapshots/prices.snap")
+
+    # Range partitions of price_detail (see `flask partitions convert`), interval is month or year.
+    # PRICE_PARTITION_PREMAKE future partitions are created ahead, on startup if enabled
+    PRICE_PARTITION_INTERVAL = os.getenv("PRICE_PARTITION_INTERVAL", "month")
+    PRICE_PARTITION_PREMAKE = int(os.getenv("PRICE_PARTITION_PREMAKE", 3))
+    PRICE_PARTITION_ENSURE_ON_STARTUP = (
+        os.getenv("PRICE_PARTITION_ENSURE_ON_STARTUP", "False") == "True"
+    )
+
+    # Rows sent per COPY by `flask ingest prices`
+    INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", 50000))
+
+    # Result cache of /rates/, backend is memory, redis or none
+    RATES_CACHE_BACKEND = os.getenv("RATES_CACHE_BACKEND", "memory")
+    RATES_CACHE_TTL = float(os.getenv("RATES_CACHE_TTL", 300))
+    RATES_CACHE_MAX_BYTES = int(os.getenv("RATES_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    RATES_CACHE_REDIS_URL = os.getenv("RATES_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    RATES_CACHE_CONTROL_MAX_AGE = int(os.getenv("RATES_CACHE_CONTROL_MAX_AGE", 60))
+
+    # Concurrent identical /rates/ queries of a worker share one database query
+    RATES_SINGLE_FLIGHT = os.getenv("RATES_SINGLE_FLIGHT", "True") == "True"
+
+    # Per (origin, destination, day) cache serving overlapping date ranges
+    RATES_DAY_CACHE_BACKEND = os.getenv("RATES_DAY_CACHE_BACKEND", "memory")
+    RATES_DAY_CACHE_TTL = float(os.getenv("RATES_DAY_CACHE_TTL", 300))
+    RATES_DAY_CACHE_MAX_BYTES = int(os.getenv("RATES_DAY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    # Upper limit of sub-range queries for the days missing from the cache
+    RATES_DAY_CACHE_MAX_QUERIES = int(os.getenv("RATES_DAY_CACHE_MAX_QUERIES", 3))
+
+    # Workers poll the days changed by ingestion every RATES_CACHE_INVALIDATION_POLL
+    # seconds and drop them from their in-process caches, 0 disables it
+    RATES_CACHE_INVALIDATION_POLL = float(os.getenv("RATES_CACHE_INVALIDATION_POLL", 5))
+
+    # Responses of at least RATES_STREAM_MIN_DAYS rows (days, or weeks / months with a
+    # granularity) are streamed as chunked JSON (NDJSON is always streamed), fetching
+    # RATES_STREAM_BATCH_SIZE rows at a time
+    RATES_STREAM_MIN_DAYS = int(os.getenv("RATES_STREAM_MIN_DAYS", 366))
+    RATES_STREAM_BATCH_SIZE = int(os.getenv("RATES_STREAM_BATCH_SIZE", 1000))
+
+    # Load shedding, a worker serves RATES_MAX_CONCURRENT /rates/ requests at once
+    # (0 disables it) and RATES_MAX_QUEUE more wait up to RATES_QUEUE_TIMEOUT
+    # seconds, the others get a 503 asking to retry after RATES_RETRY_AFTER seconds
+    RATES_MAX_CONCURRENT = int(os.getenv("RATES_MAX_CONCURRENT", 32))
+    RATES_MAX_QUEUE = int(os.getenv("RATES_MAX_QUEUE", 64))
+    RATES_QUEUE_TIMEOUT = float(os.getenv("RATES_QUEUE_TIMEOUT", 1))
+    RATES_RETRY_AFTER = int(os.getenv("RATES_RETRY_AFTER", 1))
+
+    # Limits per cost tier (port, region, top_region) as ``tier=value,...``: widest
+    # date range in days, query timeout in ms and requests in flight per worker
+    RATES_TIER_MAX_DAYS = os.getenv("RATES_TIER_MAX_DAYS", "port=7320,region=3660,top_region=3660")
+    RATES_TIER_TIMEOUT_MS = os.getenv(
+        "RATES_TIER_TIMEOUT_MS", "port=5000,region=10000,top_region=30000"
+    )
+    RATES_TIER_MAX_CONCURRENT = os.getenv("RATES_TIER_MAX_CONCURRENT", "top_region=8")
+
+    # POST /rates/batch limits, lanes are queried in chunks of RATES_BATCH_CHUNK_SIZE
+    RATES_BATCH_MAX_LANES = int(os.getenv("RATES_BATCH_MAX_LANES", 500))
+    RATES_BATCH_CHUNK_SIZE = int(os.getenv("RATES_BATCH_CHUNK_SIZE", 100))
+
+    # Cacheable /rates/ requests are logged to logs/requests.jsonl. The cache warm-up
+    # replays the RATES_WARMUP_TOP_N most requested lanes of the last
+    # RATES_WARMUP_WINDOW_HOURS of RATES_WARMUP_LOG, RATES_WARMUP_CONCURRENCY at a time.
+    # With RATES_WARMUP_ON_STARTUP every worker warms its cache before serving and gives
+    # up after RATES_WARMUP_TIMEOUT seconds, keep it below SERVER_TIMEOUT
+    RATES_REQUEST_LOG = os.getenv("RATES_REQUEST_LOG", "True") == "True"
+    RATES_WARMUP_ON_STARTUP = os.getenv("RATES_WARMUP_ON_STARTUP", "False") == "True"
+    RATES_WARMUP_LOG = os.getenv("RATES_WARMUP_LOG", "logs/requests.jsonl")
+    RATES_WARMUP_TOP_N = int(os.getenv("RATES_WARMUP_TOP_N", 500))
+    RATES_WARMUP_WINDOW_HOURS = float(os.getenv("RATES_WARMUP_WINDOW_HOURS", 24))
+    RATES_WARMUP_CONCURRENCY = int(os.getenv("RATES_WARMUP_CONCURRENCY", 4))
+    RATES_WARMUP_TIMEOUT = float(os.getenv("RATES_WARMUP_TIMEOUT", 45))
+
 
 class DevelopmentConfig(Config):
     pass
@@ -19,3 +161,9 @@ class TestConfig(Config):
     DBMS = os.getenv("DBMS")
     DB_NAME = os.getenv(f"TEST_{DBMS}_DB")
     TESTING = True
+    # Test database is created after the app, index is loaded on first request
+    REGION_INDEX_PRELOAD = False
+    PRICE_ENGINE_PRELOAD = False
+    # Tests change prices between requests, cache tests enable it explicitly
+    RATES_CACHE_BACKEND = "none"
+    RATES_DAY_CACHE_BACKEND = "none"
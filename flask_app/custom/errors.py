@@ -24,3 +24,43 @@ class DateOrderMismatchedError(Exception):
 
 class StringLengthExceedError(Exception):
     """Custom exception for Date order mismatched."""
+
+
+class PoolError(DBError):
+    """Connection pool Error"""
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no pooled connection is available within the checkout timeout."""
+
+
+class QueryCancelledError(DBError):
+    """Raised when a query was cancelled, by its statement timeout or for a disconnected client."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class CacheError(Exception):
+    """Cache Error"""
+
+
+class InvalidLocationError(Exception):
+    """Custom exception for origin/destination not matching the allowlist grammar."""
+
+
+class MigrationError(Exception):
+    """Custom exception for invalid or changed schema migrations."""
+
+
+class PartitionError(Exception):
+    """Custom exception for invalid price_detail partitioning operations."""
+
+
+class IngestError(Exception):
+    """Custom exception for invalid price ingestion options."""
+
+
+class PriceEngineError(Exception):
+    """Custom exception for an unavailable or misconfigured price engine."""
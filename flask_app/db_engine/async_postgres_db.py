@@ -0,0 +1,156 @@
+import asyncio
+import re
+import time
+from typing import Any
+
+from utils.logger import configure_logger
+from custom.errors import DBError, QueryCancelledError
+from db_engine.base_class import DBBaseClass
+from db_engine.prepared import plan_cache_options
+from utils.admission import query_budget_var
+from utils.metrics import metrics, record_query, record_stage
+
+try:
+    import asyncpg
+except ImportError:  # Optional, only needed for the async app
+    asyncpg = None
+
+logger = configure_logger(__name__)
+
+_PLACEHOLDER_REGEX = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def to_asyncpg_query(query, params=()):
+    """
+    Converts a psycopg2 style query (``%s`` / ``%(name)s``) to asyncpg ``$n`` placeholders.
+
+    Named parameters used several times are bound only once.
+
+    Returns:
+        Tuple of (query, list of arguments)
+    """
+    args = []
+    named = {}
+    positional = iter(params) if not isinstance(params, dict) else None
+
+    def replace(match):
+        token = match.group(0)
+        if token == "%%":
+            return "%"
+        if token == "%s":
+            args.append(next(positional))
+            return f"${len(args)}"
+        name = match.group(1)
+        if name not in named:
+            args.append(params[name])
+            named[name] = len(args)
+        return f"${named[name]}"
+
+    return _PLACEHOLDER_REGEX.sub(replace, query), args
+
+
+async def create_async_pool(config):
+    """Create the asyncpg pool of an event loop from the DB_* / DB_POOL_* config."""
+    if asyncpg is None:
+        raise DBError("The asyncpg package is required for the async app")
+    # asyncpg prepares every query itself (statement cache), only the plan cache mode is set
+    mode = config["DB_PLAN_CACHE_MODE"]
+    server_settings = {"plan_cache_mode": mode} if plan_cache_options(mode) else None
+    return await asyncpg.create_pool(
+        host=config["DB_HOST"],
+        port=int(config["DB_PORT"]) if config["DB_PORT"] else None,
+        user=config["DB_USER"],
+        password=config["DB_PASSWORD"],
+        database=config["DB_NAME"],
+        min_size=config["DB_POOL_MIN_SIZE"],
+        max_size=config["DB_POOL_MAX_SIZE"],
+        max_inactive_connection_lifetime=config["DB_POOL_MAX_LIFETIME"],
+        server_settings=server_settings,
+    )
+
+
+class AsyncPostGresDB(DBBaseClass):
+    """
+    Postgres access for the async app, on an asyncpg pool owned by the event loop.
+
+    Queries are written for psycopg2 and converted to asyncpg placeholders, so
+    the same queries from queries/sql_queries.py serve both apps. Date
+    parameters have to be ``datetime.date`` objects.
+    """
+
+    def __init__(self, pool, timeout=None):
+        self.pool = pool
+        self.timeout = timeout
+
+    def get_db_connection(self, **kwargs):
+        """
+        Acquires a pooled connection, use as ``async with db.get_db_connection() as conn``.
+        """
+        return self.pool.acquire(timeout=kwargs.get("timeout", self.timeout))
+
+    async def execute_query(self, query: str, params: Any = ()):
+        """Execute PostGres Query
+
+        query : Raw sql query
+        params: Tuple or dict
+
+        Returns:
+            Query Result as list of tuples
+        """
+        query, args = to_asyncpg_query(query, params)
+        # asyncpg cancels the query on the server once the budget is spent, or
+        # when the request task is cancelled because its client disconnected
+        budget = query_budget_var.get()
+        timeout = budget.timeout if budget is not None else None
+        start = time.perf_counter()
+        connected = False
+        try:
+            async with self.get_db_connection() as conn:
+                record_stage("db_connect", time.perf_counter() - start)
+                connected, start = True, time.perf_counter()
+                records = await conn.fetch(query, *args, timeout=timeout)
+            record_query("postgres_async", time.perf_counter() - start, len(records))
+            logger.debug("Successfully Executed Async Postgres Query")
+            return [tuple(record) for record in records]
+        except asyncio.TimeoutError:
+            if not connected:
+                logger.error("No pooled Async Postgres connection available", exc_info=True)
+                raise DBError("Failed executing Postgres Query")
+            record_query("postgres_async", time.perf_counter() - start, failed=True)
+            metrics.inc("db_queries_cancelled_total", reason="timeout")
+            logger.warning("Cancelled Async Postgres Query: %s %s. Reason timeout", query, args)
+            raise QueryCancelledError(
+                f"Query cancelled after its time budget of {timeout:g}s", "timeout"
+            )
+        except Exception as e:
+            if connected:
+                record_query("postgres_async", time.perf_counter() - start, failed=True)
+            logger.error(
+                "Error executing Async Postgres Query: %s %s. Error %s",
+                query,
+                args,
+                e,
+                exc_info=True,
+            )
+            raise DBError("Failed executing Postgres Query")
+
+    async def execute_command(self, query: str, params: Any = ()):
+        """Execute a write statement in its own transaction
+
+        Returns:
+            Command status of the statement
+        """
+        query, args = to_asyncpg_query(query, params)
+        try:
+            async with self.get_db_connection() as conn:
+                async with conn.transaction():
+                    return await conn.execute(query, *args)
+        except Exception as e:
+            logger.error(
+                "Error executing Async Postgres Command: %s %s. Error %s",
+                query,
+                args,
+                e,
+                exc_info=True,
+            )
+            raise DBError("Failed executing Postgres Command")
@@ -9,3 +9,7 @@ class DBBaseClass(ABC):
     @abstractmethod
     def execute_query(self, **kwargs):
         "Method to execute Query"
+
+    @abstractmethod
+    def execute_command(self, **kwargs):
+        "Method to execute and commit a write statement"
@@ -1,8 +1,12 @@
+import time
+from contextlib import contextmanager
+
 import psycopg2
 from flask import current_app
+from psycopg2.extensions import QueryCanceledError
 
 from utils.logger import configure_logger
-from custom.errors import DBError
+from custom.errors import DBError, PoolError, QueryCancelledError
 from db_engine.postgres_db import PostGresDB
 
 logger = configure_logger(__name__)
@@ -10,3 +14,74 @@ logger = configure_logger(__name__)
 
 class DB(PostGresDB):
     pass
+
+
+def is_host_failure(error):
+    """Check if a query failed because of its host (connection, server) instead of the query.
+
+    Pool errors are not: a checkout timeout means the pool of this worker is saturated,
+    the replica itself may well be healthy.
+    """
+    if isinstance(error, QueryCanceledError):
+        return False
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+class ReadDB(DB):
+    """
+    Read-only queries balanced over the read replicas of the current app.
+
+    Queries go to the primary if no replica is configured, or if every replica
+    is ejected and DB_READ_FALLBACK_TO_PRIMARY is set. A query failing because
+    of its replica is retried once on another endpoint.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.replica_set = current_app.extensions.get("replica_set")
+        self.fallback_to_primary = current_app.config["DB_READ_FALLBACK_TO_PRIMARY"]
+        self._failed_endpoint = None
+
+    @contextmanager
+    def connection(self):
+        if self.replica_set is None:
+            with super().connection() as conn:
+                yield conn
+            return
+
+        endpoint = self.replica_set.acquire(exclude=self._failed_endpoint)
+        if endpoint is None:
+            if not self.fallback_to_primary:
+                raise PoolError("No read replica available")
+            with super().connection() as conn:
+                yield conn
+            return
+
+        start = time.perf_counter()
+        failed = False
+        try:
+            with DB(endpoint.host, endpoint.port).connection() as conn:
+                yield conn
+        except BaseException as e:
+            failed = is_host_failure(e)
+            if failed:
+                self._failed_endpoint = endpoint
+            raise
+        finally:
+            self.replica_set.release(endpoint, time.perf_counter() - start, failed)
+
+    def execute_query(self, query, params=()):
+        try:
+            return super().execute_query(query, params)
+        except DBError as e:
+            if self._failed_endpoint is None or isinstance(e, QueryCancelledError):
+                raise
+            # Reads are safe to repeat, the failed endpoint is skipped this time
+            logger.warning("Retrying read query after %s failed", self._failed_endpoint.name)
+            return super().execute_query(query, params)
+
+    def execute_command(self, query, params=()):
+        raise DBError("Read replicas do not accept write statements, use DB()")
+
+    def execute_commands(self, statements):
+        raise DBError("Read replicas do not accept write statements, use DB()")
@@ -0,0 +1,201 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from operator import itemgetter
+
+import psycopg2
+
+from utils.logger import configure_logger
+from custom.errors import DBError, IngestError
+from db_engine.db import DB
+from queries.sql_queries import (
+    CREATE_PRICE_STAGING,
+    COPY_PRICE_STAGING,
+    INGEST_LOCK,
+    DELETE_UNKNOWN_ROUTES,
+    STAGING_DAYS_QUERY,
+    DELETE_STAGED_ROUTE_DAYS,
+    INSERT_STAGED_PRICES,
+    CREATE_PRICE_DAY_CHANGES,
+    RECORD_PRICE_DAY_CHANGES,
+)
+
+logger = configure_logger(__name__)
+
+FORMATS = ("csv", "ndjson")
+MODES = ("append", "upsert")
+PRICE_FIELDS = ("route_id", "day", "price")
+
+# Rejected input rows logged individually, the rest are only counted
+MAX_LOGGED_REJECTS = 10
+
+
+def detect_format(filename):
+    """ndjson for .ndjson/.jsonl files, csv otherwise."""
+    return "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def parse_price_row(route_id, day, price):
+    """
+    Validates the fields of an input row.
+
+    Returns:
+        (route_id, day, price) with price None for a missing price
+
+    Raises:
+        ValueError: if a field is missing or malformed
+    """
+    if route_id in (None, "") or day in (None, ""):
+        raise ValueError("route_id and day are required")
+    route_id = int(route_id)
+    day = date.fromisoformat(str(day))
+    price = None if price in (None, "") else int(price)
+    return route_id, day, price
+
+
+def _parse_json_line(line):
+    record = json.loads(line)
+    return parse_price_row(record.get("route_id"), record.get("day"), record.get("price"))
+
+
+def read_records(lines, fmt):
+    """
+    Splits a CSV (with a header row, columns in any order) or NDJSON input into records.
+
+    Returns:
+        (records, parse) where parse turns a record into a validated (route_id, day, price)
+    """
+    if fmt == "csv":
+        reader = csv.reader(lines)
+        header = [column.strip() for column in next(reader, None) or ()]
+        missing = [field for field in PRICE_FIELDS if field not in header]
+        if missing:
+            raise IngestError(f"CSV header misses the columns {', '.join(missing)}")
+        pick = itemgetter(*(header.index(field) for field in PRICE_FIELDS))
+        return reader, lambda row: parse_price_row(*pick(row))
+    if fmt == "ndjson":
+        return (line for line in lines if line.strip()), _parse_json_line
+    raise IngestError(f"Input format should be one of {', '.join(FORMATS)}")
+
+
+class PriceIngest:
+    """
+    Loads prices into price_detail through COPY.
+
+    Input rows are parsed and validated in Python, written in chunks of
+    ``chunk_rows`` to a temporary staging table and merged into price_detail
+    in the same transaction, so only one chunk is held in memory at a time.
+    Rows of unknown routes are dropped from the staging table before the merge.
+
+    In ``append`` mode the staged rows are added to the existing prices, in
+    ``upsert`` mode they replace every existing price of their (route, day).
+    The rollup triggers of price_detail follow the merge.
+
+    Args:
+        mode (str): append or upsert.
+        chunk_rows (int): Rows sent per COPY.
+    """
+
+    def __init__(self, mode="append", chunk_rows=50000):
+        if mode not in MODES:
+            raise IngestError(f"Ingest mode should be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.chunk_rows = chunk_rows
+
+    def _copy_chunks(self, cur, records, parse, stats):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffered = 0
+
+        def flush():
+            buffer.seek(0)
+            cur.copy_expert(COPY_PRICE_STAGING, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+
+        for number, record in enumerate(records, 1):
+            stats["rows_read"] += 1
+            try:
+                writer.writerow(parse(record))
+            except (AttributeError, IndexError, TypeError, ValueError) as e:
+                stats["rows_rejected"] += 1
+                if stats["rows_rejected"] <= MAX_LOGGED_REJECTS:
+                    logger.warning("Rejected input row %s %s Error: %s", number, record, e)
+                continue
+            buffered += 1
+            if buffered == self.chunk_rows:
+                flush()
+                buffered = 0
+        if buffered:
+            flush()
+
+    def ingest(self, lines, fmt="csv"):
+        """
+        Loads the prices of a CSV or NDJSON input into price_detail in one transaction.
+
+        Args:
+            lines: Iterable of input lines, e.g. an open file.
+            fmt (str): csv or ndjson.
+
+        Returns:
+            Dict of counts (rows_read, rows_rejected, unknown_route_rows, rows_deleted,
+            rows_inserted), the affected days, seconds and rows_per_second.
+        """
+        stats = {
+            "rows_read": 0,
+            "rows_rejected": 0,
+            "unknown_route_rows": 0,
+            "rows_deleted": 0,
+            "rows_inserted": 0,
+        }
+        records, parse = read_records(lines, fmt)
+        start = time.perf_counter()
+        conn = DB().get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(INGEST_LOCK)
+                cur.execute(CREATE_PRICE_STAGING)
+                self._copy_chunks(cur, records, parse, stats)
+
+                cur.execute(DELETE_UNKNOWN_ROUTES)
+                unknown_routes = cur.fetchall()
+                if unknown_routes:
+                    stats["unknown_route_rows"] = sum(count for _, count in unknown_routes)
+                    logger.warning(
+                        "Rejected %s rows of unknown routes %s",
+                        stats["unknown_route_rows"],
+                        ", ".join(str(route_id) for route_id, _ in unknown_routes[:20]),
+                    )
+
+                cur.execute(STAGING_DAYS_QUERY)
+                days = [row[0] for row in cur.fetchall()]
+                if self.mode == "upsert":
+                    cur.execute(DELETE_STAGED_ROUTE_DAYS)
+                    stats["rows_deleted"] = cur.rowcount
+                cur.execute(INSERT_STAGED_PRICES)
+                stats["rows_inserted"] = cur.rowcount
+                # Committed with the prices, workers invalidate their caches once they see it
+                cur.execute(CREATE_PRICE_DAY_CHANGES)
+                cur.execute(RECORD_PRICE_DAY_CHANGES, {"days": days})
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error("Error ingesting prices Error: %s", e, exc_info=True)
+            raise DBError("Failed ingesting prices")
+        finally:
+            conn.close()
+
+        seconds = time.perf_counter() - start
+        stats["days"] = days
+        stats["seconds"] = seconds
+        stats["rows_per_second"] = stats["rows_read"] / seconds if seconds else 0.0
+        logger.info(
+            "Ingested %s of %s rows for %s days in %.2fs",
+            stats["rows_inserted"],
+            stats["rows_read"],
+            len(days),
+            seconds,
+        )
+        return stats
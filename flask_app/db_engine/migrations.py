@@ -0,0 +1,208 @@
+import hashlib
+import json
+import re
+from datetime import timedelta
+from pathlib import Path
+
+from utils.logger import configure_logger
+from custom.errors import MigrationError
+from db_engine.db import DB
+from utils.data_processor import RateAPIDataFormat
+from utils.data_validator import RatesParams
+from queries.sql_queries import (
+    CREATE_SCHEMA_MIGRATIONS,
+    APPLIED_MIGRATIONS_QUERY,
+    RECORD_MIGRATION,
+    AVG_PRICE_QUERY,
+    AVG_PRICE_ROLLUP_QUERY,
+    PRICE_DATE_RANGE_QUERY,
+    BUSIEST_ROUTE_QUERY,
+)
+
+logger = configure_logger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "migrations"
+
+# Migration files are named <version>_<name>.sql, e.g. 0001_lookup_indexes.sql
+MIGRATION_FILE_REGEX = re.compile(r"(\d+)_(\w+)\.sql\Z")
+
+# Tables which must not be read with a sequential scan by narrow requests
+CHECKED_TABLES = ("price_detail", "price_daily_rollup")
+
+
+class Migration:
+    __slots__ = ("version", "name", "sql", "checksum")
+
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.encode()).hexdigest()
+
+
+class Migrations:
+    """
+    Versioned SQL migrations of the schema.
+
+    Every file of ``directory`` is applied once, in version order and in its own
+    transaction, and recorded in the schema_migrations table with its checksum.
+
+    Args:
+        directory (Path): Directory of the migration files.
+    """
+
+    def __init__(self, directory=MIGRATIONS_DIR):
+        self.directory = Path(directory)
+
+    def discover(self):
+        """Migration files of the directory ordered by version."""
+        migrations = {}
+        for path in sorted(self.directory.glob("*.sql")):
+            match = MIGRATION_FILE_REGEX.match(path.name)
+            if match is None:
+                raise MigrationError(f"Invalid migration file name {path.name}")
+            version = int(match.group(1))
+            if version in migrations:
+                raise MigrationError(f"Duplicate migration version {version}")
+            migrations[version] = Migration(version, match.group(2), path.read_text())
+        return [migrations[version] for version in sorted(migrations)]
+
+    def applied(self):
+        """Dict of version to (name, checksum, applied_at) of the applied migrations."""
+        DB().execute_command(CREATE_SCHEMA_MIGRATIONS)
+        return {
+            version: (name, checksum, applied_at)
+            for version, name, checksum, applied_at in DB().execute_query(APPLIED_MIGRATIONS_QUERY)
+        }
+
+    def status(self):
+        """
+        Returns:
+            List of (migration, applied_at or None, whether the file changed after it was applied).
+        """
+        applied = self.applied()
+        statuses = []
+        for migration in self.discover():
+            name, checksum, applied_at = applied.get(migration.version, (None, None, None))
+            changed = applied_at is not None and checksum != migration.checksum
+            statuses.append((migration, applied_at, changed))
+        return statuses
+
+    def apply(self, target=None):
+        """
+        Applies the pending migrations up to target (all by default).
+
+        Raises:
+            MigrationError: If an applied migration file was changed afterwards.
+
+        Returns:
+            List of the applied migrations.
+        """
+        done = []
+        for migration, applied_at, changed in self.status():
+            if changed:
+                raise MigrationError(
+                    f"Migration {migration.version} {migration.name} changed after it was applied"
+                )
+            if applied_at is not None or (target is not None and migration.version > target):
+                continue
+            # The statements and the bookkeeping row are committed together, the
+            # file is sent without parameters so that its % signs are kept as is
+            DB().execute_commands(
+                [
+                    (migration.sql, None),
+                    (
+                        RECORD_MIGRATION,
+                        {
+                            "version": migration.version,
+                            "name": migration.name,
+                            "checksum": migration.checksum,
+                        },
+                    ),
+                ]
+            )
+            logger.info("Applied migration %s %s", migration.version, migration.name)
+            done.append(migration)
+        return done
+
+
+def find_seq_scans(plan, tables=CHECKED_TABLES):
+    """Names of the checked tables read by a Seq Scan node of an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(find_seq_scans(child, tables))
+    return found
+
+
+class PlanCheck:
+    """
+    Runs EXPLAIN (ANALYZE, BUFFERS) of the avg price query for representative requests.
+
+    Narrow requests (one lane or a small region over a few days) are expected
+    to use the indexes, a sequential scan of a checked table is flagged as a
+    regression. Wide requests are reported only, a sequential scan can be the
+    best plan when they cover most of the table.
+
+    Args:
+        region_index (RegionIndex): Index expanding origin/destination.
+        use_rollup (bool): Check AVG_PRICE_ROLLUP_QUERY instead of AVG_PRICE_QUERY.
+    """
+
+    def __init__(self, region_index, use_rollup=False):
+        self.region_index = region_index
+        self.query = AVG_PRICE_ROLLUP_QUERY if use_rollup else AVG_PRICE_QUERY
+
+    def cases(self):
+        """(name, RatesParams, index expected) of the representative requests."""
+        first_day, last_day = DB().execute_query(PRICE_DATE_RANGE_QUERY)[0]
+        busiest = DB().execute_query(BUSIEST_ROUTE_QUERY)
+        if first_day is None or not busiest:
+            return []
+        orig_code, dest_code, orig_region, dest_region = busiest[0]
+        top_regions = (
+            self.region_index.root_of(orig_region),
+            self.region_index.root_of(dest_region),
+        )
+
+        narrow_to = min(first_day + timedelta(days=6), last_day)
+        cases = [
+            ("narrow_port", RatesParams(orig_code, dest_code, first_day, narrow_to), True),
+            ("wide_port", RatesParams(orig_code, dest_code, first_day, last_day), True),
+            ("narrow_region", RatesParams(orig_region, dest_region, first_day, narrow_to), True),
+            ("wide_top_region", RatesParams(*top_regions, first_day, last_day), False),
+        ]
+        return [case for case in cases if case[1].origin and case[1].destination]
+
+    def explain(self, params):
+        """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) of the query, returns the top plan dict."""
+        args = RateAPIDataFormat().create_avg_price_query_args(params, self.region_index)
+        query = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + self.query
+        result = DB().execute_query(query, args)[0][0]
+        # psycopg2 decodes the json column unless it is returned as text
+        return (json.loads(result) if isinstance(result, str) else result)[0]
+
+    def run(self):
+        """
+        Returns:
+            List of dicts with name, params, execution time (ms), shared buffers,
+            sequentially scanned tables and whether the plan regressed.
+        """
+        results = []
+        for name, params, index_expected in self.cases():
+            explained = self.explain(params)
+            plan = explained["Plan"]
+            seq_scans = find_seq_scans(plan)
+            results.append(
+                {
+                    "name": name,
+                    "params": params.to_dict(),
+                    "execution_ms": explained.get("Execution Time"),
+                    "shared_hit": plan.get("Shared Hit Blocks", 0),
+                    "shared_read": plan.get("Shared Read Blocks", 0),
+                    "seq_scans": seq_scans,
+                    "regressed": index_expected and bool(seq_scans),
+                }
+            )
+        return results
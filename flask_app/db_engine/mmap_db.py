@@ -0,0 +1,195 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from utils.logger import configure_logger
+from custom.errors import DBError, PriceEngineError
+from db_engine.db import DB
+from db_engine.numpy_db import NumpyPriceDB, PriceSnapshot, np
+from queries.sql_queries import REGIONS_QUERY
+
+logger = configure_logger(__name__)
+
+# Magic, format version and metadata length, followed by the JSON metadata and the arrays
+MAGIC = b"RATESNAP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sII")
+# Arrays start at multiples of ALIGNMENT so they can be viewed in place
+ALIGNMENT = 64
+
+# Name and little endian dtype of the arrays of a PriceSnapshot
+SNAPSHOT_ARRAYS = (("keys", "<i8"), ("prices", "<i4"), ("has_price", "|b1"))
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def export_snapshot(path, snapshot, regions):
+    """
+    Writes a snapshot file and atomically replaces path with it.
+
+    The file is written next to path and renamed over it, so processes mapping
+    the previous version keep reading it until they switch to the new one.
+
+    Args:
+        path (str): Snapshot file.
+        snapshot (PriceSnapshot): Prices and routes to write.
+        regions (list): (slug, parent_slug) rows of the region tree.
+
+    Returns:
+        Metadata of the written snapshot
+    """
+    arrays = [
+        (name, np.ascontiguousarray(getattr(snapshot, name), dtype))
+        for name, dtype in SNAPSHOT_ARRAYS
+    ]
+    metadata = {
+        "version": time.time_ns(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rows": len(snapshot),
+        "state": list(snapshot.state),
+        "routes": [list(route) for route in snapshot.routes],
+        "regions": [list(region) for region in regions],
+        "arrays": {},
+    }
+
+    # Offsets are relative to the aligned end of the metadata
+    offset = 0
+    for name, array in arrays:
+        metadata["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "offset": offset,
+            "length": len(array),
+        }
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(metadata).encode()
+    data_start = _aligned(HEADER.size + len(encoded))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".snapshot-", delete=False) as tmp:
+        try:
+            tmp.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            tmp.write(encoded)
+            for name, array in arrays:
+                tmp.seek(data_start + metadata["arrays"][name]["offset"])
+                tmp.write(array.tobytes())
+            # Empty trailing arrays still need their offset inside the file
+            tmp.truncate(data_start + offset)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    os.chmod(tmp.name, 0o644)
+    os.replace(tmp.name, path)
+    logger.info(
+        "Exported price snapshot %s with %s rows to %s", metadata["version"], len(snapshot), path
+    )
+    return metadata
+
+
+def open_snapshot(path):
+    """
+    Maps a snapshot file read-only, its arrays are views on the shared page cache.
+
+    Returns:
+        PriceSnapshot with the ``version`` and ``regions`` of the file
+    """
+    try:
+        with open(path, "rb") as snapshot_file:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        logger.error("Error opening price snapshot %s Error: %s", path, e)
+        raise DBError("Price snapshot is not available")
+
+    magic, format_version, metadata_length = (
+        HEADER.unpack_from(mapped, 0) if len(mapped) >= HEADER.size else (None, None, 0)
+    )
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise PriceEngineError(
+            f"{path} is not a version {FORMAT_VERSION} price snapshot, export it again"
+        )
+    metadata = json.loads(mapped[HEADER.size : HEADER.size + metadata_length])
+    data_start = _aligned(HEADER.size + metadata_length)
+
+    arrays = {
+        name: np.frombuffer(
+            mapped, dtype=spec["dtype"], count=spec["length"], offset=data_start + spec["offset"]
+        )
+        for name, spec in metadata["arrays"].items()
+    }
+    snapshot = PriceSnapshot(
+        arrays["keys"],
+        arrays["prices"],
+        arrays["has_price"],
+        [tuple(route) for route in metadata["routes"]],
+        tuple(metadata["state"]),
+    )
+    snapshot.version = metadata["version"]
+    snapshot.regions = [tuple(region) for region in metadata["regions"]]
+    return snapshot
+
+
+def region_index_rows(snapshot):
+    """(region rows, port code rows) of a mapped snapshot, as RegionIndex.load takes them."""
+    port_codes = {route[1] for route in snapshot.routes} | {route[2] for route in snapshot.routes}
+    return snapshot.regions, [(code,) for code in port_codes]
+
+
+def export_from_database(path):
+    """Reads price_detail, route and regions from Postgres and exports them to path."""
+    snapshot = NumpyPriceDB(refresh_interval=None).load()
+    return export_snapshot(path, snapshot, DB().execute_query(REGIONS_QUERY))
+
+
+class MmapPriceDB(NumpyPriceDB):
+    """
+    Serves AVG_PRICE_QUERY from a snapshot file mapped read-only.
+
+    Every worker maps the same file, so the prices live once in the page cache
+    instead of once per process, and opening it costs no parsing. The file is
+    written by ``flask snapshot export``, workers check it every
+    ``refresh_interval`` seconds and map the new version once it was replaced.
+
+    Args:
+        path (str): Snapshot file.
+        refresh_interval (float): Seconds between checks of the file. ``None`` disables them.
+    """
+
+    name = "mmap"
+
+    def __init__(self, path, refresh_interval=60):
+        super().__init__(refresh_interval)
+        self.path = path
+        self._file_id = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """Maps the current snapshot file."""
+        file_id = self._stat()
+        snapshot = open_snapshot(self.path)
+        # In flight requests keep the previous mapping alive until they are done
+        self._snapshot, self._file_id, self._loaded_at = snapshot, file_id, time.monotonic()
+        logger.info("Mapped price snapshot %s with %s rows", snapshot.version, len(snapshot))
+        return snapshot
+
+    def refresh(self):
+        """Maps the snapshot file again if it was replaced."""
+        file_id = self._stat()
+        if file_id is None or file_id == self._file_id:
+            # Keep serving the mapped version while the file is missing
+            self._loaded_at = time.monotonic()
+            return self._snapshot
+        return self.load()
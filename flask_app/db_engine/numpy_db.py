@@ -0,0 +1,381 @@
+import io
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import psycopg2
+from flask import current_app
+
+from utils.logger import configure_logger
+from custom.errors import DBError, PriceEngineError
+from db_engine.base_class import DBBaseClass
+from db_engine.db import DB, ReadDB
+from utils.data_processor import bucket_starts
+from utils.metrics import record_query
+from queries.sql_queries import (
+    AVG_PRICE_QUERY,
+    AVG_PRICE_ROLLUP_QUERY,
+    AVG_PRICE_BUCKET_QUERIES,
+    AVG_PRICE_BUCKET_ROLLUP_QUERIES,
+    PRICE_SNAPSHOT_COPY,
+    PRICE_SNAPSHOT_ROUTES_QUERY,
+    PRICE_SNAPSHOT_STATE_QUERY,
+)
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only needed for PRICE_ENGINE=numpy
+    np = None
+
+logger = configure_logger(__name__)
+
+# Queries answered from the snapshot and the granularity of their rows
+SNAPSHOT_QUERIES = {
+    AVG_PRICE_QUERY: "day",
+    AVG_PRICE_ROLLUP_QUERY: "day",
+    **{query: unit for unit, query in AVG_PRICE_BUCKET_QUERIES.items()},
+    **{query: unit for unit, query in AVG_PRICE_BUCKET_ROLLUP_QUERIES.items()},
+}
+
+EPOCH = date(1970, 1, 1)
+# Days are stored as days since EPOCH, shifted to be non negative inside the sort key
+DAY_OFFSET = 1 << 31
+
+# Binary COPY framing: 11 byte signature, flags and header extension length
+COPY_HEADER_SIZE = 19
+COPY_TRAILER_SIZE = 2
+
+
+def _copy_row_dtype():
+    # Every row is a field count followed by (length, value) per field, big endian
+    return np.dtype(
+        [
+            ("fields", ">i2"),
+            ("route_id_len", ">i4"),
+            ("route_id", ">i8"),
+            ("day_len", ">i4"),
+            ("day", ">i4"),
+            ("price_len", ">i4"),
+            ("price", ">i4"),
+            ("null_len", ">i4"),
+            ("price_is_null", "u1"),
+        ]
+    )
+
+
+def read_snapshot_copy(data):
+    """
+    Parses the binary COPY output of PRICE_SNAPSHOT_COPY.
+
+    The selected columns are never NULL, so every row has the same size and
+    the whole output is read as one structured array.
+
+    Returns:
+        (route_ids, days, prices, has_price) arrays
+    """
+    dtype = _copy_row_dtype()
+    body = memoryview(data)[COPY_HEADER_SIZE : len(data) - COPY_TRAILER_SIZE]
+    rows = np.frombuffer(body, dtype=dtype)
+    return (
+        rows["route_id"].astype(np.int64),
+        rows["day"].astype(np.int32),
+        rows["price"].astype(np.int32),
+        rows["price_is_null"] == 0,
+    )
+
+
+def sort_keys(route_ids, days):
+    """(route_id, day) packed into one int64, ordering like the tuple."""
+    return (route_ids << 32) | (days.astype(np.int64) + DAY_OFFSET)
+
+
+def key_days(keys):
+    """Days since EPOCH of sort keys, the inverse of the day part of ``sort_keys``."""
+    return (keys & 0xFFFFFFFF) - DAY_OFFSET
+
+
+def round_half_away(sums, counts):
+    """ROUND(sum / count) of Postgres numerics, in exact integer arithmetic."""
+    magnitude = (2 * np.abs(sums) + counts) // (2 * counts)
+    return np.where(sums < 0, -magnitude, magnitude)
+
+
+class PriceSnapshot:
+    """
+    Immutable prices of price_detail sorted by (route_id, day).
+
+    Days are not stored on their own, ``key_days`` reads them from the sort keys.
+
+    Args:
+        keys: Sort keys, see ``sort_keys``.
+        prices: Prices as int32 like the integer column, 0 where has_price is False.
+        has_price: Whether the price of the row is not NULL.
+        routes: (id, orig_code, dest_code, orig_region, dest_region) rows.
+        state: (count, max id, checksum of the rows) of price_detail when it was loaded.
+    """
+
+    def __init__(self, keys, prices, has_price, routes, state):
+        self.keys = keys
+        self.prices = prices
+        self.has_price = has_price
+        self.routes = routes
+        self.state = state
+        self.route_ids = np.array([row[0] for row in routes], dtype=np.int64)
+        # NULL codes/regions as "", which no origin or destination expands to
+        self.route_columns = [
+            np.array([row[column] or "" for row in routes], dtype=str) for column in range(1, 5)
+        ]
+
+    @classmethod
+    def build(cls, route_ids, days, prices, has_price, routes, state):
+        order = np.argsort(sort_keys(route_ids, days), kind="stable")
+        keys = sort_keys(route_ids[order], days[order])
+        return cls(keys, prices[order], has_price[order], routes, state)
+
+    def merge(self, route_ids, days, prices, has_price, routes, state):
+        """New snapshot with the rows added, without sorting the existing ones again."""
+        order = np.argsort(sort_keys(route_ids, days), kind="stable")
+        keys = sort_keys(route_ids[order], days[order])
+        positions = np.searchsorted(self.keys, keys, side="right")
+        return PriceSnapshot(
+            np.insert(self.keys, positions, keys),
+            np.insert(self.prices, positions, prices[order]),
+            np.insert(self.has_price, positions, has_price[order]),
+            routes,
+            state,
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def matching_routes(self, orig_codes, orig_regions, dest_codes, dest_regions):
+        """Ids of the routes matched by the expanded origin and destination."""
+        orig_code, dest_code, orig_region, dest_region = self.route_columns
+        matches = (np.isin(orig_code, orig_codes) | np.isin(orig_region, orig_regions)) & (
+            np.isin(dest_code, dest_codes) | np.isin(dest_region, dest_regions)
+        )
+        return np.unique(self.route_ids[matches])
+
+    def row_indexes(self, route_ids, first_day, last_day):
+        """Indexes of the rows of the routes between first_day and last_day (days since EPOCH)."""
+        starts = np.searchsorted(
+            self.keys, sort_keys(route_ids, np.full_like(route_ids, first_day))
+        )
+        ends = np.searchsorted(
+            self.keys, sort_keys(route_ids, np.full_like(route_ids, last_day)), side="right"
+        )
+        lengths = ends - starts
+        # Concatenated aranges of every [start, end) range
+        shifts = starts - np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.arange(lengths.sum()) + np.repeat(shifts, lengths)
+
+    def avg_prices(
+        self,
+        date_from,
+        date_to,
+        orig_codes,
+        orig_regions,
+        dest_codes,
+        dest_regions,
+        granularity="day",
+    ):
+        """
+        Average prices per day, week or month with the semantics of AVG_PRICE_QUERY
+        and AVG_PRICE_BUCKET_QUERIES.
+
+        Returns:
+            (day, average_price, sample_count) rows for every day (or bucket, labelled with its
+            first day) of the range, average_price is a Decimal rounded half away from zero,
+            None with fewer than 3 samples.
+        """
+        first_day = (date_from - EPOCH).days
+        day_count = (date_to - EPOCH).days - first_day + 1
+        if day_count <= 0:
+            return []
+
+        route_ids = self.matching_routes(orig_codes, orig_regions, dest_codes, dest_regions)
+        rows = self.row_indexes(route_ids, first_day, first_day + day_count - 1)
+        positions = key_days(self.keys[rows]) - first_day
+
+        starts = bucket_starts(date_from, date_to, granularity)
+        if granularity != "day":
+            # Rows belong to the last bucket starting on or before their day
+            offsets = np.array([(start - date_from).days for start in starts])
+            positions = np.searchsorted(offsets, positions, side="right") - 1
+        bucket_count = len(starts)
+
+        samples = np.bincount(positions, minlength=bucket_count)
+        price_counts = np.bincount(positions, weights=self.has_price[rows], minlength=bucket_count)
+        # Float sums are exact below 2**53
+        price_sums = np.bincount(positions, weights=self.prices[rows], minlength=bucket_count)
+        price_counts = price_counts.astype(np.int64)
+        averages = round_half_away(price_sums.astype(np.int64), np.maximum(price_counts, 1))
+        valid = (samples >= 3) & (price_counts > 0)
+
+        return [
+            (
+                start.isoformat(),
+                Decimal(int(average)) if is_valid else None,
+                int(sample_count),
+            )
+            for start, average, is_valid, sample_count in zip(
+                starts, averages.tolist(), valid.tolist(), samples.tolist()
+            )
+        ]
+
+
+class NumpyPriceDB(DBBaseClass):
+    """
+    Serves AVG_PRICE_QUERY (its rollup and weekly / monthly variants) from an in-memory snapshot
+    of price_detail, every other query goes to Postgres.
+
+    The snapshot is loaded through a binary COPY and refreshed after
+    ``refresh_interval`` seconds. When price_detail only got new rows since the
+    last load, only those are loaded and merged, otherwise (deletes, updates,
+    rows without id) the whole snapshot is reloaded.
+
+    Args:
+        refresh_interval (float): Seconds after which the snapshot is refreshed. ``None`` disables it.
+    """
+
+    # Label of the engine in the db metrics
+    name = "numpy"
+
+    def __init__(self, refresh_interval=60):
+        if np is None:
+            raise PriceEngineError(f"The numpy package is required for PRICE_ENGINE={self.name}")
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = None
+
+    def get_db_connection(self, **kwargs):
+        return DB().get_db_connection(**kwargs)
+
+    def execute_command(self, query, params=()):
+        return DB().execute_command(query, params)
+
+    def stream_query(self, query, params=(), batch_size=1000, budget=None):
+        return ReadDB().stream_query(query, params, batch_size, budget)
+
+    def execute_query(self, query, params=()):
+        granularity = SNAPSHOT_QUERIES.get(query)
+        if granularity is None:
+            return ReadDB().execute_query(query, params)
+
+        snapshot = self.ensure_fresh()
+        start = time.perf_counter()
+        # Same arguments as the Postgres queries, see create_avg_price_query_args
+        rows = snapshot.avg_prices(granularity=granularity, **params)
+        record_query(self.name, time.perf_counter() - start, len(rows))
+        return rows
+
+    def _read(self, snapshot=None):
+        """
+        Reads price_detail into a new snapshot, only the added rows if snapshot can be extended.
+
+        State and rows are read in one repeatable read transaction, so rows
+        added meanwhile are neither missed nor loaded twice.
+        """
+        max_id = None if snapshot is None else snapshot.state[1]
+        params = {"max_id": -1 if max_id is None else max_id}
+        try:
+            conn = DB().get_db_connection()
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        except psycopg2.Error as e:
+            logger.error("Error connecting to Postgres Error: %s", e)
+            raise DBError("Failed connecting to Postgres")
+        try:
+            with conn.cursor() as cur:
+                cur.execute(PRICE_SNAPSHOT_STATE_QUERY, params)
+                count, new_max_id, checksum, added_count, added_checksum = cur.fetchone()
+                state = (count, new_max_id, checksum)
+                if snapshot is not None and state == snapshot.state:
+                    return snapshot
+                # Only rows above the last max id were inserted since the last read
+                incremental = (
+                    snapshot is not None
+                    and count - added_count == snapshot.state[0]
+                    and checksum - added_checksum == snapshot.state[2]
+                )
+                condition = "id > %(max_id)s" if incremental else "true"
+                data = io.BytesIO()
+                copy_query = PRICE_SNAPSHOT_COPY.format(condition=condition)
+                cur.copy_expert(cur.mogrify(copy_query, params).decode(), data)
+                cur.execute(PRICE_SNAPSHOT_ROUTES_QUERY)
+                routes = cur.fetchall()
+            conn.rollback()
+        except psycopg2.Error as e:
+            logger.error("Error reading price snapshot Error: %s", e, exc_info=True)
+            raise DBError("Failed reading price snapshot")
+        finally:
+            conn.close()
+
+        arrays = read_snapshot_copy(data.getbuffer())
+        if incremental:
+            logger.info("Adding %s rows to the price snapshot", added_count)
+            return snapshot.merge(*arrays, routes, state)
+        return PriceSnapshot.build(*arrays, routes, state)
+
+    def load(self):
+        """Loads the whole snapshot."""
+        start = time.perf_counter()
+        snapshot = self._read()
+        self._snapshot, self._loaded_at = snapshot, time.monotonic()
+        logger.info(
+            "Loaded price snapshot with %s rows in %.2fs",
+            len(snapshot),
+            time.perf_counter() - start,
+        )
+        return snapshot
+
+    def refresh(self):
+        """Loads the rows added since the last load, or everything if rows changed otherwise."""
+        snapshot = self._read(self._snapshot)
+        self._snapshot, self._loaded_at = snapshot, time.monotonic()
+        return snapshot
+
+    def is_stale(self):
+        return (
+            self.refresh_interval is not None
+            and time.monotonic() - self._loaded_at > self.refresh_interval
+        )
+
+    def ensure_fresh(self):
+        """Load the snapshot on first use and refresh it once the interval expired.
+
+        While a stale snapshot is being refreshed other threads keep using the old one.
+        """
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.load()
+        elif self.is_stale() and self._lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+
+def create_price_engine(engine, refresh_interval=60, snapshot_path=None):
+    """Create the price engine configured by engine (postgres, numpy or mmap).
+
+    Returns:
+        Engine instance or None to query Postgres directly.
+    """
+    if not engine or engine == "postgres":
+        return None
+    if engine == "numpy":
+        return NumpyPriceDB(refresh_interval)
+    if engine == "mmap":
+        from db_engine.mmap_db import MmapPriceDB
+
+        return MmapPriceDB(snapshot_path, refresh_interval)
+    raise PriceEngineError(f"Unknown price engine {engine}")
+
+
+def get_price_db():
+    """Return the price engine of the current app, ReadDB() if prices are queried from Postgres."""
+    return current_app.extensions.get("price_engine") or ReadDB()
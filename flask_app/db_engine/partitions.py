@@ -0,0 +1,205 @@
+from datetime import date
+
+from psycopg2 import sql
+
+from utils.logger import configure_logger
+from custom.errors import PartitionError
+from db_engine.db import DB
+from queries.sql_queries import (
+    CREATE_PRICE_ROLLUP,
+    PRICE_DATE_RANGE_QUERY,
+    PRICE_DETAIL_PARTITIONED_QUERY,
+    PRICE_DETAIL_PARTITIONS_QUERY,
+    PRICE_DETAIL_INDEXES_QUERY,
+    PRICE_DETAIL_CONSTRAINTS_QUERY,
+    PRICE_ROLLUP_TRIGGER_QUERY,
+    PRICE_DETAIL_DEFAULT_DAYS_QUERY,
+)
+
+logger = configure_logger(__name__)
+
+INTERVALS = ("month", "year")
+DEFAULT_PARTITION = "price_detail_default"
+
+# Serializes partition maintenance of concurrent workers / cron runs
+PARTITION_LOCK_ID = 73190001
+
+
+def period_start(day, interval):
+    """First day of the month or year containing day."""
+    return date(day.year, day.month if interval == "month" else 1, 1)
+
+
+def next_period(start, interval):
+    if interval == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    """price_detail_pYYYYMM for months, price_detail_pYYYY for years."""
+    return f"price_detail_p{start:%Y%m}" if interval == "month" else f"price_detail_p{start:%Y}"
+
+
+def periods(first_day, last_day, interval):
+    """Start days of the periods covering first_day to last_day."""
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        yield start
+        start = next_period(start, interval)
+
+
+class PricePartitions:
+    """
+    Range partitioning of price_detail by day.
+
+    ``convert`` turns the plain table into a partitioned one, ``ensure`` creates
+    the partitions of the coming periods ahead of time. Rows outside of every
+    partition land in a default partition and are moved out by ``ensure``.
+
+    Args:
+        interval (str): month or year.
+        premake (int): Number of periods after the current one to create ahead.
+    """
+
+    def __init__(self, interval="month", premake=3):
+        if interval not in INTERVALS:
+            raise PartitionError(f"Partition interval should be one of {', '.join(INTERVALS)}")
+        self.interval = interval
+        self.premake = premake
+
+    def is_partitioned(self):
+        return DB().execute_query(PRICE_DETAIL_PARTITIONED_QUERY)[0][0]
+
+    def partitions(self):
+        """(name, bound, estimated rows) of every partition."""
+        return DB().execute_query(PRICE_DETAIL_PARTITIONS_QUERY)
+
+    def _premake_until(self, today=None):
+        start = period_start(today or date.today(), self.interval)
+        for _ in range(self.premake):
+            start = next_period(start, self.interval)
+        return start
+
+    def _create_partition(self, start):
+        return sql.SQL(
+            "CREATE TABLE {} PARTITION OF price_detail FOR VALUES FROM ({}) TO ({});"
+        ).format(
+            sql.Identifier(partition_name(start, self.interval)),
+            sql.Literal(start),
+            sql.Literal(next_period(start, self.interval)),
+        )
+
+    def convert(self, today=None):
+        """
+        Replaces price_detail by a partitioned table holding the same rows.
+
+        Runs in one transaction holding an exclusive lock on price_detail. Indexes,
+        check/foreign key constraints and the rollup triggers are re-created on
+        the partitioned table.
+
+        Returns:
+            Number of created partitions, the default one excluded.
+        """
+        if self.is_partitioned():
+            raise PartitionError("price_detail is already partitioned")
+
+        first_day, last_day = DB().execute_query(PRICE_DATE_RANGE_QUERY)[0]
+        today = today or date.today()
+        first_day = first_day or today
+        last_day = max(last_day or today, self._premake_until(today))
+        starts = list(periods(first_day, last_day, self.interval))
+
+        index_defs = [row[0] for row in DB().execute_query(PRICE_DETAIL_INDEXES_QUERY)]
+        constraints = DB().execute_query(PRICE_DETAIL_CONSTRAINTS_QUERY)
+        has_rollup = DB().execute_query(PRICE_ROLLUP_TRIGGER_QUERY)[0][0]
+
+        statements = [
+            sql.SQL("LOCK TABLE price_detail IN ACCESS EXCLUSIVE MODE;"),
+            sql.SQL("ALTER TABLE price_detail RENAME TO price_detail_unpartitioned;"),
+            sql.SQL(
+                "CREATE TABLE price_detail (LIKE price_detail_unpartitioned"
+                " INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE (day);"
+            ),
+        ]
+        statements += [self._create_partition(start) for start in starts]
+        statements += [
+            sql.SQL("CREATE TABLE {} PARTITION OF price_detail DEFAULT;").format(
+                sql.Identifier(DEFAULT_PARTITION)
+            ),
+            sql.SQL("INSERT INTO price_detail SELECT * FROM price_detail_unpartitioned;"),
+            # Frees the index and constraint names for the partitioned table
+            sql.SQL("DROP TABLE price_detail_unpartitioned;"),
+        ]
+        statements += [sql.SQL(index_def + ";") for index_def in index_defs]
+        statements += [
+            sql.SQL("ALTER TABLE price_detail ADD CONSTRAINT {} {};").format(
+                sql.Identifier(name), sql.SQL(definition)
+            )
+            for name, definition in constraints
+        ]
+        if has_rollup:
+            # Rows were copied as is, the rollup content stays valid
+            statements.append(sql.SQL(CREATE_PRICE_ROLLUP))
+        statements.append(sql.SQL("ANALYZE price_detail;"))
+
+        DB().execute_command(sql.SQL("\n").join(statements))
+        logger.info("Partitioned price_detail by %s into %s partitions", self.interval, len(starts))
+        return len(starts)
+
+    def ensure(self, today=None):
+        """
+        Creates the missing partitions up to ``premake`` periods ahead, and the
+        ones for rows which landed in the default partition.
+
+        Returns:
+            Names of the created partitions.
+        """
+        if not self.is_partitioned():
+            return []
+
+        starts = set(
+            periods(
+                period_start(today or date.today(), self.interval),
+                self._premake_until(today),
+                self.interval,
+            )
+        )
+        first_day, last_day = DB().execute_query(PRICE_DETAIL_DEFAULT_DAYS_QUERY)[0]
+        if first_day is not None:
+            starts.update(periods(first_day, last_day, self.interval))
+
+        existing = {name for name, _, _ in self.partitions()}
+        created = []
+        for start in sorted(starts):
+            name = partition_name(start, self.interval)
+            if name in existing:
+                continue
+            self._attach_partition(start)
+            created.append(name)
+        if created:
+            logger.info("Created price_detail partitions %s", ", ".join(created))
+        return created
+
+    def _attach_partition(self, start):
+        """Creates the partition of a period, moving its rows out of the default partition."""
+        name = sql.Identifier(partition_name(start, self.interval))
+        bounds = {"start": start, "end": next_period(start, self.interval)}
+        DB().execute_command(
+            sql.SQL("""
+                SELECT pg_advisory_xact_lock({lock_id});
+                CREATE TABLE IF NOT EXISTS {name}
+                    (LIKE price_detail INCLUDING DEFAULTS INCLUDING STORAGE);
+                WITH moved AS (
+                    DELETE FROM {default} WHERE day >= %(start)s AND day < %(end)s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved;
+                ALTER TABLE price_detail ATTACH PARTITION {name}
+                    FOR VALUES FROM (%(start)s) TO (%(end)s);
+                """).format(
+                lock_id=sql.Literal(PARTITION_LOCK_ID),
+                name=name,
+                default=sql.Identifier(DEFAULT_PARTITION),
+            ),
+            bounds,
+        )
@@ -0,0 +1,257 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from utils.logger import configure_logger
+from custom.errors import PoolError, PoolTimeoutError
+from utils.metrics import record_stage
+
+logger = configure_logger(__name__)
+
+
+class _PoolEntry:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Thread safe pool of reusable DB connections.
+
+    Connections are created lazily up to ``max_size`` and handed out LIFO so
+    that hot connections are reused. A checkout blocks at most ``timeout``
+    seconds when every connection is in use.
+
+    Args:
+        connect (callable): Zero argument callable returning a new DB connection.
+        min_size (int): Number of connections opened when the pool is created.
+        max_size (int): Upper limit of open connections.
+        timeout (float): Seconds to wait for a free connection on checkout.
+        max_lifetime (float): Seconds after which a connection is closed and replaced.
+        health_check (bool): Ping idle connections with ``SELECT 1`` on checkout.
+        health_check_interval (float): Only ping connections idle for longer than this.
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size=1,
+        max_size=10,
+        timeout=5.0,
+        max_lifetime=1800.0,
+        health_check=True,
+        health_check_interval=30.0,
+    ):
+        if min_size > max_size:
+            raise PoolError("Pool min_size can not be greater than max_size")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+
+        # Stats
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+        self._prefill()
+
+    def _prefill(self):
+        for _ in range(self.min_size):
+            try:
+                entry = self._new_entry()
+            except Exception as e:
+                logger.warning("Failed to prefill connection pool Error: %s", e)
+                return
+            with self._cond:
+                self._size += 1
+                self._idle.append(entry)
+
+    def _new_entry(self):
+        entry = _PoolEntry(self._connect())
+        with self._cond:
+            self._created += 1
+        return entry
+
+    def _discard(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._discarded += 1
+
+    def _is_expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _is_healthy(self, entry, now):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if self.health_check and now - entry.last_used > self.health_check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        """Checkout a connection from the pool.
+
+        Raises:
+            PoolTimeoutError: If no connection is free within ``timeout`` seconds.
+            PoolError: If the pool is closed.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve a slot, the connection is opened outside the lock
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a DB connection"
+                    )
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+
+        now = time.monotonic()
+        if entry is not None and (self._is_expired(entry, now) or not self._is_healthy(entry, now)):
+            self._discard(entry)
+            entry = None
+
+        if entry is None:
+            try:
+                entry = self._new_entry()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self._in_use[id(entry.conn)] = entry
+        # Waiting, health check and connecting count as the db_connect stage
+        record_stage("db_connect", time.monotonic() - start)
+        return entry.conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool.
+
+        Args:
+            conn: Connection previously returned by ``getconn``.
+            discard (bool): Close the connection instead of reusing it.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            raise PoolError("Connection does not belong to this pool")
+
+        if not discard and not conn.closed:
+            try:
+                # End the read transaction so the connection is reusable
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        now = time.monotonic()
+        if discard or conn.closed or self._closed or self._is_expired(entry, now):
+            self._discard(entry)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager checking out a connection and returning it afterwards."""
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            # Includes GeneratorExit of a closed streaming generator
+            self.putconn(conn, discard=conn.closed)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        """Snapshot of pool usage, useful for sizing the pool per worker."""
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_time_total": self._wait_time_total,
+                "wait_time_avg": (
+                    self._wait_time_total / self._checkouts if self._checkouts else 0.0
+                ),
+                "wait_time_max": self._wait_time_max,
+            }
+
+    def close(self):
+        """Close idle connections and refuse new checkouts.
+
+        Connections still in use are closed when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
@@ -1,22 +1,114 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import psycopg2
-from typing import Any, Tuple
+from typing import Any, List, Tuple
 from flask import current_app
 
 from utils.logger import configure_logger
-from custom.errors import DBError
+from psycopg2.extensions import QueryCanceledError
+from custom.errors import DBError, PoolError, QueryCancelledError
 from db_engine.base_class import DBBaseClass
+from db_engine.pool import ConnectionPool
+from db_engine.prepared import PreparedConnection, plan_cache_options, prepared_statements
+from utils.admission import query_budget_var, watchdog
+from utils.metrics import metrics, record_query
+from queries.sql_queries import SET_STATEMENT_TIMEOUT
 
 logger = configure_logger(__name__)
 
+# Process wide connection pools keyed by pid and connection parameters.
+# Keying by pid makes sure a forked worker never reuses the parent's sockets.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pools_stats():
+    """Stats of every connection pool of the current process, keyed by host/database."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if key[0] == pid]
+    return {f"{key[1]}/{key[4]}": pool.stats() for key, pool in pools}
+
+
+@contextmanager
+def budgeted(conn, cur, budget=None):
+    """
+    Applies the query budget of the current request to the statements run in the block.
+
+    The statement timeout is set for the current transaction only, the pool rolls it
+    back with the transaction. Queries of a disconnected client are cancelled.
+
+    Args:
+        budget (QueryBudget): Budget to apply, the one of the current request if None.
+
+    Raises:
+        QueryCancelledError: If a statement was cancelled.
+    """
+    if budget is None:
+        budget = query_budget_var.get()
+    if budget is None:
+        yield
+        return
+    if budget.timeout:
+        cur.execute(SET_STATEMENT_TIMEOUT, (int(budget.timeout * 1000),))
+    try:
+        if budget.is_disconnected is None:
+            yield
+        else:
+            with watchdog.watch(conn.cancel, budget.is_disconnected) as query:
+                yield
+    except QueryCanceledError:
+        if budget.is_disconnected is not None and query.cancelled:
+            raise QueryCancelledError("Query cancelled, the client disconnected", "disconnect")
+        metrics.inc("db_queries_cancelled_total", reason="timeout")
+        raise QueryCancelledError(
+            f"Query cancelled after its time budget of {budget.timeout:g}s", "timeout"
+        )
+
+
+def forget_inherited_pools():
+    """
+    Drops the pools a forked worker inherited from its parent, without closing them.
+
+    Closing the inherited connections would end the parent's sessions, the
+    sockets belong to the parent.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        for key in [key for key in _pools if key[0] != pid]:
+            del _pools[key]
+
+
+def close_pools():
+    """Close every connection pool owned by the current process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
 
 class PostGresDB(DBBaseClass):
-    def __init__(self):
+    """
+    Postgres access on the process wide connection pool of a host.
+
+    Args:
+        db_host (str): Host to connect to, DB_HOST by default, e.g. a read replica.
+        db_port (str): Port to connect to, DB_PORT by default.
+    """
+
+    def __init__(self, db_host=None, db_port=None):
         self.dbms = current_app.config["DBMS"]
-        self.db_host = current_app.config["DB_HOST"]
-        self.db_port = current_app.config["DB_PORT"]
+        self.db_host = db_host or current_app.config["DB_HOST"]
+        self.db_port = db_port or current_app.config["DB_PORT"]
         self.db_user_name = current_app.config["DB_USER"]
         self.db_password = current_app.config["DB_PASSWORD"]
         self.db_name = current_app.config["DB_NAME"]
+        self.use_prepared_statements = current_app.config["DB_PREPARED_STATEMENTS"]
+        self.connect_options = plan_cache_options(current_app.config["DB_PLAN_CACHE_MODE"])
 
     def get_db_connection(self, **kwargs):
         """
@@ -29,31 +121,190 @@ class PostGresDB(DBBaseClass):
         db_user_name = kwargs.get("db_user_name") or self.db_user_name
 
         conn = psycopg2.connect(
-            dbname=db_name, user=db_user_name, password=db_password, host=db_host, port=db_port
+            dbname=db_name,
+            user=db_user_name,
+            password=db_password,
+            host=db_host,
+            port=db_port,
+            options=self.connect_options,
+            connection_factory=PreparedConnection,
         )
         return conn
 
+    def get_pool(self):
+        """Return the process wide connection pool for the configured database.
+
+        The pool is created on first use with the ``DB_POOL_*`` settings of the app config.
+        """
+        key = (os.getpid(), self.db_host, self.db_port, self.db_user_name, self.db_name)
+        pool = _pools.get(key)
+        if pool is not None:
+            return pool
+
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                config = current_app.config
+                pool = ConnectionPool(
+                    self.get_db_connection,
+                    min_size=config["DB_POOL_MIN_SIZE"],
+                    max_size=config["DB_POOL_MAX_SIZE"],
+                    timeout=config["DB_POOL_TIMEOUT"],
+                    max_lifetime=config["DB_POOL_MAX_LIFETIME"],
+                    health_check=config["DB_POOL_HEALTH_CHECK"],
+                    health_check_interval=config["DB_POOL_HEALTH_CHECK_INTERVAL"],
+                )
+                _pools[key] = pool
+                logger.info(
+                    "Created Postgres connection pool for %s/%s", self.db_host, self.db_name
+                )
+        return pool
+
+    def get_pool_stats(self):
+        """Usage stats (in use, idle, wait time) of the connection pool."""
+        return self.get_pool().stats()
+
+    @contextmanager
+    def connection(self):
+        """Checks out a pooled connection and returns it afterwards."""
+        with self.get_pool().connection() as conn:
+            yield conn
+
     def execute_query(self, query: str, params: Tuple[Any] = ()):
         """Execute PostGres Query
 
+        Queries of PREPARED_QUERIES run as prepared statements if DB_PREPARED_STATEMENTS is set.
+
         query : Raw sql query
-        params: Tuple
+        params: Tuple, or dict for named parameters
 
         Returns:
             Query Result
         """
+        start = None
         try:
-            conn = self.get_db_connection()
-            with conn.cursor() as cur:
-                # Execute a query
-                cur.execute(query, params)
-
-                rows = cur.fetchall()
-                logger.info("Successfully Executed Postgres Query")
-            conn.close()
+            with self.connection() as conn:
+                with conn.cursor() as cur, budgeted(conn, cur):
+                    # Execute a query
+                    start = time.perf_counter()
+                    statement = self.use_prepared_statements and prepared_statements.get(query)
+                    if statement:
+                        statement.execute(conn, cur, params)
+                    else:
+                        cur.execute(query, params)
+
+                    rows = cur.fetchall()
+                    record_query("postgres", time.perf_counter() - start, len(rows))
+                    logger.debug("Successfully Executed Postgres Query")
             return rows
+        except PoolError:
+            logger.error("No pooled Postgres connection available", exc_info=True)
+            raise
+        except QueryCancelledError as e:
+            record_query("postgres", time.perf_counter() - start, failed=True)
+            logger.warning("Cancelled Postgres Query: %s %s. Reason %s", query, params, e.reason)
+            raise
         except Exception as e:
+            if start is not None:
+                record_query("postgres", time.perf_counter() - start, failed=True)
             logger.error(
-                f"Error executing Postgres Query: {query} {params}. Error {e}", exc_info=True
+                "Error executing Postgres Query: %s %s. Error %s", query, params, e, exc_info=True
             )
             raise DBError("Failed executing Postgres Query")
+
+    def stream_query(self, query: str, params: Any = (), batch_size: int = 1000, budget=None):
+        """Execute PostGres Query on a server side cursor and yield the rows in batches
+
+        Only ``batch_size`` rows are held in memory at a time. The pooled connection
+        is returned once the generator is exhausted or closed.
+
+        query : Raw sql query
+        params: Tuple or dict
+        batch_size: Rows fetched per round trip
+        budget: QueryBudget of the request, the generator runs after the view returned
+            so the budget of the current context is gone by then
+
+        Yields:
+            Lists of at most batch_size rows
+        """
+        start = time.perf_counter()
+        row_count = 0
+        try:
+            with self.connection() as conn:
+                try:
+                    # The timeout is set on a regular cursor, before DECLARE
+                    with conn.cursor() as budget_cur, budgeted(conn, budget_cur, budget):
+                        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                            cur.itersize = batch_size
+                            cur.execute(query, params)
+                            while True:
+                                rows = cur.fetchmany(batch_size)
+                                if not rows:
+                                    break
+                                row_count += len(rows)
+                                yield rows
+                except GeneratorExit:
+                    # Consumer went away (e.g. client disconnected), stop the query
+                    conn.cancel()
+                    raise
+            # Includes the time the consumer spent on the batches
+            record_query("postgres", time.perf_counter() - start, row_count)
+            logger.debug("Successfully Streamed Postgres Query")
+        except PoolError:
+            logger.error("No pooled Postgres connection available", exc_info=True)
+            raise
+        except QueryCancelledError as e:
+            record_query("postgres", time.perf_counter() - start, failed=True)
+            logger.warning("Cancelled Postgres Query: %s %s. Reason %s", query, params, e.reason)
+            raise
+        except Exception as e:
+            record_query("postgres", time.perf_counter() - start, failed=True)
+            logger.error(
+                "Error streaming Postgres Query: %s %s. Error %s", query, params, e, exc_info=True
+            )
+            raise DBError("Failed executing Postgres Query")
+
+    def execute_command(self, query: str, params: Any = ()):
+        """Execute a write statement in its own transaction and commit it
+
+        query : Raw sql statement(s)
+        params: Tuple or dict
+
+        Returns:
+            Number of affected rows of the last statement
+        """
+        return self.execute_commands([(query, params)])
+
+    def execute_commands(self, statements: List[Tuple[str, Any]]):
+        """Execute write statements in one transaction and commit them together
+
+        statements: (query, params) tuples, with params None the query is sent as is,
+            without interpreting ``%``
+
+        Returns:
+            Number of affected rows of the last statement
+        """
+        try:
+            with self.get_pool().connection() as conn:
+                start = time.perf_counter()
+                try:
+                    with conn.cursor() as cur:
+                        for query, params in statements:
+                            cur.execute(query, params)
+                        rowcount = cur.rowcount
+                    conn.commit()
+                    record_query("postgres", time.perf_counter() - start)
+                except Exception:
+                    record_query("postgres", time.perf_counter() - start, failed=True)
+                    conn.rollback()
+                    raise
+            logger.debug("Successfully Executed Postgres Command")
+            return rowcount
+        except PoolError:
+            logger.error("No pooled Postgres connection available", exc_info=True)
+            raise
+        except Exception as e:
+            logger.error(
+                "Error executing Postgres Command: %s. Error %s", statements, e, exc_info=True
+            )
+            raise DBError("Failed executing Postgres Command")
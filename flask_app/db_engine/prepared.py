@@ -0,0 +1,97 @@
+import re
+import time
+
+from psycopg2 import errors, extensions
+
+from custom.errors import DBError
+from utils.metrics import metrics
+from queries.sql_queries import PREPARED_QUERIES
+
+PLAN_CACHE_MODES = ("auto", "force_generic_plan", "force_custom_plan")
+
+_PLACEHOLDER_REGEX = re.compile(r"%\((\w+)\)s|%%")
+
+
+def plan_cache_options(mode):
+    """
+    libpq ``options`` setting plan_cache_mode for the session, None for the server default.
+
+    Raises:
+        DBError: If mode is not one of PLAN_CACHE_MODES.
+    """
+    if mode not in PLAN_CACHE_MODES:
+        raise DBError(f"Unknown plan cache mode {mode}, expected one of {PLAN_CACHE_MODES}")
+    return None if mode == "auto" else f"-c plan_cache_mode={mode}"
+
+
+class PreparedConnection(extensions.connection):
+    """psycopg2 connection remembering the statements prepared on its session.
+
+    A connection replacing a broken or expired one starts without any, so the
+    statements are prepared again on their first use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Statement name to the seconds its PREPARE took
+        self.prepared = {}
+
+
+class PreparedStatement:
+    """Server side prepared statement of a query with ``%(name)s`` parameters.
+
+    Every named parameter becomes one ``$n`` placeholder, bound once however
+    often the query uses it. The statement is prepared on the first execution
+    per connection, later executions skip parsing and, with a generic plan,
+    planning. The PREPARE time is counted as saved on every reuse.
+
+    Args:
+        name (str): Statement name, unique per session.
+        query (str): Query with named parameters only.
+    """
+
+    def __init__(self, name, query):
+        self.name = name
+        self.params = []
+
+        def replace(match):
+            if match.group(0) == "%%":
+                return "%"
+            param = match.group(1)
+            if param not in self.params:
+                self.params.append(param)
+            return f"${self.params.index(param) + 1}"
+
+        body = _PLACEHOLDER_REGEX.sub(replace, query).strip().rstrip(";")
+        self.prepare_sql = f"PREPARE {name} AS {body}"
+        self.execute_sql = f"EXECUTE {name}({', '.join(['%s'] * len(self.params))})"
+
+    def execute(self, conn, cur, params):
+        """
+        Executes the statement on the cursor, preparing it first if the connection did not yet.
+
+        Args:
+            conn (PreparedConnection): Connection of the cursor.
+            params (dict): Value of every named parameter.
+        """
+        prepare_seconds = conn.prepared.get(self.name)
+        if prepare_seconds is None:
+            start = time.perf_counter()
+            cur.execute(self.prepare_sql)
+            prepare_seconds = conn.prepared[self.name] = time.perf_counter() - start
+            metrics.inc("db_statements_prepared_total", statement=self.name)
+            metrics.observe("db_prepare_duration_seconds", prepare_seconds, statement=self.name)
+        else:
+            metrics.inc("db_prepare_seconds_saved_total", prepare_seconds, statement=self.name)
+        try:
+            cur.execute(self.execute_sql, [params[param] for param in self.params])
+        except errors.InvalidSqlStatementName:
+            # Deallocated behind our back (e.g. DISCARD ALL), prepared again on the next use
+            del conn.prepared[self.name]
+            raise
+
+
+# Prepared statements keyed by the query text they replace
+prepared_statements = {
+    query: PreparedStatement(name, query) for name, query in PREPARED_QUERIES.items()
+}
@@ -0,0 +1,227 @@
+import itertools
+import os
+import threading
+import time
+
+from utils.logger import configure_logger
+from custom.errors import DBError
+from utils.metrics import metrics
+from queries.sql_queries import REPLICATION_LAG_QUERY
+
+logger = configure_logger(__name__)
+
+BALANCE_MODES = ("round_robin", "least_outstanding")
+
+
+def parse_hosts(value):
+    """
+    Parse ``host:port,host`` into a list of (host, port) tuples, port is None if missing.
+
+    Unix socket directories (``/var/run/postgresql``) are valid hosts.
+    """
+    hosts = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        hosts.append((host, port or None))
+    return hosts
+
+
+class ReadEndpoint:
+    """A read replica and its health as seen by this worker."""
+
+    __slots__ = ("host", "port", "name", "outstanding", "errors", "ejected_until", "lag")
+
+    def __init__(self, host, port=None):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}" if port else host
+        # Queries in flight, consecutive failures and time until the endpoint is tried again
+        self.outstanding = 0
+        self.errors = 0
+        self.ejected_until = None
+        self.lag = 0.0
+
+    def is_available(self, now, max_lag):
+        if self.ejected_until is not None and now < self.ejected_until:
+            return False
+        return max_lag is None or self.lag <= max_lag
+
+
+class ReplicaSet:
+    """Balances the read-only queries of a worker over read replicas.
+
+    An endpoint failing ``max_errors`` queries in a row is ejected for
+    ``eject_seconds``. A background thread checks every endpoint each
+    ``health_check_interval`` seconds: endpoints answering are re-admitted,
+    the others ejected, and endpoints replaying more than ``max_lag`` seconds
+    behind the primary are skipped until they caught up. After an ejection
+    without health checks the endpoint gets one query on probation.
+
+    Args:
+        hosts (list): (host, port) of every read endpoint.
+        balance (str): round_robin or least_outstanding (fewest queries in flight).
+        max_errors (int): Consecutive failed queries ejecting an endpoint.
+        eject_seconds (float): Seconds an ejected endpoint is skipped.
+        max_lag (float): Replication lag bound in seconds, None disables it.
+        health_check_interval (float): Seconds between health checks, 0 disables them.
+        app: Flask app whose config the health checks connect with.
+    """
+
+    def __init__(
+        self,
+        hosts,
+        balance="round_robin",
+        max_errors=3,
+        eject_seconds=30.0,
+        max_lag=None,
+        health_check_interval=5.0,
+        app=None,
+    ):
+        if balance not in BALANCE_MODES:
+            raise DBError(f"Unknown read balance {balance}, expected one of {BALANCE_MODES}")
+        self.endpoints = [ReadEndpoint(host, port) for host, port in hosts]
+        self.balance = balance
+        self.max_errors = max_errors
+        self.eject_seconds = eject_seconds
+        self.max_lag = max_lag
+        self.health_check_interval = health_check_interval
+        self.app = app
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        self._checker_pid = None
+
+    def acquire(self, exclude=None):
+        """
+        Picks the endpoint of the next query, ``release`` it once the query finished.
+
+        Returns:
+            ReadEndpoint or None if no endpoint is available.
+        """
+        if self.health_check_interval and self._checker_pid != os.getpid():
+            self._start_health_checker()
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                endpoint
+                for endpoint in self.endpoints
+                if endpoint is not exclude and endpoint.is_available(now, self.max_lag)
+            ]
+            if not candidates:
+                return None
+            # Rotating the start keeps ties of least_outstanding spread over the endpoints
+            start = next(self._next) % len(candidates)
+            candidates = candidates[start:] + candidates[:start]
+            if self.balance == "least_outstanding":
+                endpoint = min(candidates, key=lambda candidate: candidate.outstanding)
+            else:
+                endpoint = candidates[0]
+            endpoint.outstanding += 1
+        return endpoint
+
+    def release(self, endpoint, seconds, failed=False):
+        """
+        Records a finished query of an endpoint.
+
+        Args:
+            seconds (float): Time the query held the endpoint.
+            failed (bool): The endpoint failed (connection or server error, not a query error).
+        """
+        metrics.inc("db_read_queries_total", host=endpoint.name)
+        metrics.observe("db_read_query_duration_seconds", seconds, host=endpoint.name)
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not failed:
+                endpoint.errors = 0
+                if endpoint.ejected_until is not None and self.health_check_interval == 0:
+                    # Passed its probation
+                    endpoint.ejected_until = None
+                return
+            endpoint.errors += 1
+            eject = endpoint.errors >= self.max_errors
+            if eject:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        metrics.inc("db_read_errors_total", host=endpoint.name)
+        if eject:
+            self._ejected(endpoint, f"{endpoint.errors} failed queries in a row")
+
+    def _ejected(self, endpoint, reason):
+        metrics.inc("db_replica_ejections_total", host=endpoint.name)
+        logger.warning(
+            "Ejected read replica %s for %ss, %s", endpoint.name, self.eject_seconds, reason
+        )
+
+    def check_health(self):
+        """Checks every endpoint once, called by the health check thread."""
+        from db_engine.db import DB
+
+        for endpoint in self.endpoints:
+            try:
+                with self.app.app_context():
+                    lag = DB(endpoint.host, endpoint.port).execute_query(REPLICATION_LAG_QUERY)
+                lag = float(lag[0][0] or 0.0)
+            except DBError as e:
+                with self._lock:
+                    was_available = endpoint.ejected_until is None
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                if was_available:
+                    self._ejected(endpoint, f"health check failed: {e}")
+                continue
+
+            with self._lock:
+                readmitted = endpoint.ejected_until is not None
+                endpoint.ejected_until = None
+                endpoint.errors = 0
+                endpoint.lag = lag
+            if readmitted:
+                logger.info("Re-admitted read replica %s", endpoint.name)
+            if self.max_lag is not None and lag > self.max_lag:
+                logger.warning("Read replica %s lags %.1fs behind", endpoint.name, lag)
+
+    def _start_health_checker(self):
+        with self._lock:
+            # Threads do not survive fork, every worker starts its own checker
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+        threading.Thread(target=self._run_health_checks, name="replica-health", daemon=True).start()
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error("Failed to check read replicas Error: %s", e, exc_info=True)
+
+    def stats(self):
+        """Health of every endpoint keyed by its name."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                endpoint.name: {
+                    "available": int(endpoint.is_available(now, self.max_lag)),
+                    "outstanding": endpoint.outstanding,
+                    "lag_seconds": endpoint.lag,
+                }
+                for endpoint in self.endpoints
+            }
+
+
+def create_replica_set(app):
+    """Create the replica set of the DB_READ_* config, None without read hosts."""
+    config = app.config
+    hosts = parse_hosts(config["DB_READ_HOSTS"])
+    if not hosts:
+        return None
+    return ReplicaSet(
+        hosts,
+        balance=config["DB_READ_BALANCE"],
+        max_errors=config["DB_READ_MAX_ERRORS"],
+        eject_seconds=config["DB_READ_EJECT_SECONDS"],
+        max_lag=config["DB_READ_MAX_LAG_SECONDS"] or None,
+        health_check_interval=config["DB_READ_HEALTH_CHECK_INTERVAL"],
+        app=app,
+    )
@@ -0,0 +1,46 @@
+from utils.logger import configure_logger
+from db_engine.db import DB
+from queries.sql_queries import CREATE_PRICE_ROLLUP, BACKFILL_PRICE_ROLLUP
+
+logger = configure_logger(__name__)
+
+
+class PriceRollup:
+    """
+    Maintains the per (route, day) price rollup read by AVG_PRICE_ROLLUP_QUERY.
+
+    Once created, triggers on price_detail keep the rollup in sync with new,
+    changed and deleted prices. ``backfill`` (re)builds it from existing rows.
+    """
+
+    def create(self):
+        """
+        Creates the rollup table and the triggers maintaining it.
+        """
+        DB().execute_command(CREATE_PRICE_ROLLUP)
+        logger.info("Created price rollup table and triggers")
+
+    def backfill(self, date_from=None, date_to=None):
+        """
+        Rebuilds the daily rollup from price_detail, then the weekly and monthly rows
+        of the periods overlapping the range from the daily rollup.
+
+        Args:
+            date_from (str): First day to rebuild (YYYY-MM-DD). Open ended if None.
+            date_to (str): Last day to rebuild (YYYY-MM-DD). Open ended if None.
+
+        Returns:
+            Number of (route, day) rows written.
+        """
+        rows = DB().execute_command(
+            BACKFILL_PRICE_ROLLUP, {"date_from": date_from, "date_to": date_to}
+        )
+        logger.info("Backfilled price rollup from %s to %s with %s rows", date_from, date_to, rows)
+        return rows
+
+    def build(self, date_from=None, date_to=None):
+        """
+        Creates the rollup if required and backfills it.
+        """
+        self.create()
+        return self.backfill(date_from, date_to)
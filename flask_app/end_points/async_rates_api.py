@@ -0,0 +1,161 @@
+from quart import Blueprint, current_app, g, request, jsonify
+
+from custom.errors import QueryCancelledError
+from utils.logger import configure_logger
+from db_engine.async_postgres_db import AsyncPostGresDB
+from utils.data_validator import rate_api_validation
+from utils.data_processor import RateAPIDataFormat
+from utils.data_fetcher import AsyncRateAPIDataFetcher
+from utils.metrics import begin_request, timed
+from utils.admission import query_budget
+
+logger = configure_logger(__name__)
+
+async_rates_bp = Blueprint("async_rates_bp", __name__)
+
+
+async def get_fetcher():
+    """Create the async fetcher of the current app with a fresh region index."""
+    db = AsyncPostGresDB(current_app.extensions["async_db_pool"])
+    region_index = await current_app.extensions["region_index"].ensure_fresh_async(db)
+    return AsyncRateAPIDataFetcher(
+        current_app.config,
+        db,
+        region_index,
+        current_app.extensions.get("rates_cache"),
+        current_app.extensions.get("single_flight"),
+    )
+
+
+@async_rates_bp.before_request
+async def start_request_timer():
+    g.request_timer = begin_request(current_app.extensions.get("slow_request_profiler"))
+
+
+@async_rates_bp.teardown_request
+async def release_request(exc):
+    tier = g.pop("rates_tier", None)
+    if tier is not None:
+        current_app.extensions["rates_tiers"].release(tier)
+
+
+def overloaded_response(message, status):
+    """Response of a shed request, clients should retry after Retry-After seconds."""
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(current_app.config["RATES_RETRY_AFTER"])
+    return response
+
+
+def acquire_tier(tier):
+    """Takes a slot of the tier for the request, released on teardown."""
+    if not current_app.extensions["rates_tiers"].acquire(tier):
+        return False
+    g.rates_tier = tier
+    return True
+
+
+@async_rates_bp.after_request
+async def add_server_timing(response):
+    timer = g.pop("request_timer", None)
+    if timer is not None:
+        server_timing = timer.end(request.endpoint, response.status_code)
+        if current_app.config["METRICS_SERVER_TIMING"]:
+            response.headers["Server-Timing"] = server_timing
+    return response
+
+
+@async_rates_bp.route("/")
+async def get_avg_price_daywise():
+    try:
+        fetcher = await get_fetcher()
+    except Exception as e:
+        logger.error("Failed to load region index Error %s", e)
+        return overloaded_response("Region index is unavailable, retry later", 503)
+
+    try:
+        with timed("validate"):
+            validated_data = rate_api_validation.validate_rates_args(
+                request.args, fetcher.region_index
+            )
+    except Exception as e:
+        logger.info("Failed to validate data %s Errors: %s", request.args, e)
+        return jsonify({"message": str(e)}), 400
+
+    tiers = current_app.extensions["rates_tiers"]
+    tier = tiers.classify(validated_data, fetcher.region_index)
+    error = tiers.check_range(tier, validated_data)
+    if error is not None:
+        return jsonify({"message": error}), 400
+    if not acquire_tier(tier):
+        return overloaded_response(f"Too many {tier} requests in flight, retry later", 429)
+
+    try:
+        with query_budget(tiers.timeout(tier)):
+            data, is_cached = await fetcher.fetch_avg_prices(validated_data)
+    except QueryCancelledError as e:
+        logger.warning("Cancelled Query %s Reason %s", request.args, e.reason)
+        return overloaded_response(e.message, 503)
+    except Exception as e:
+        logger.error("Failed to Execute Query %s Error %s", request.args, e)
+        return jsonify({"message": str(e)}), 400
+
+    with timed("format"):
+        final_output = RateAPIDataFormat().format_avg_price_query_data(data)
+    with timed("serialize"):
+        response = jsonify(final_output)
+    response.headers["X-Cache"] = "HIT" if is_cached else "MISS"
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["RATES_CACHE_CONTROL_MAX_AGE"]
+    await response.add_etag()
+    return await response.make_conditional(request)
+
+
+@async_rates_bp.route("/batch", methods=["POST"])
+async def get_avg_price_daywise_batch():
+    try:
+        fetcher = await get_fetcher()
+    except Exception as e:
+        logger.error("Failed to load region index Error %s", e)
+        return overloaded_response("Region index is unavailable, retry later", 503)
+
+    body = await request.get_json(silent=True)
+    lanes = body.get("lanes") if isinstance(body, dict) else None
+    try:
+        validated_lanes = rate_api_validation.validate_batch_lanes(
+            lanes, fetcher.region_index, current_app.config["RATES_BATCH_MAX_LANES"]
+        )
+    except Exception as e:
+        logger.info("Failed to validate batch Errors: %s", e)
+        return jsonify({"message": str(e)}), 400
+
+    tiers = current_app.extensions["rates_tiers"]
+    validated_lanes, tier = tiers.check_lanes(validated_lanes, fetcher.region_index)
+    if tier is not None and not acquire_tier(tier):
+        return overloaded_response(f"Too many {tier} requests in flight, retry later", 429)
+
+    valid_lanes = [
+        (lane_id, validated_data)
+        for lane_id, (validated_data, _) in enumerate(validated_lanes)
+        if validated_data is not None
+    ]
+    try:
+        with query_budget(tiers.timeout(tier)):
+            data = await fetcher.fetch_avg_prices_batch(valid_lanes)
+    except QueryCancelledError as e:
+        logger.warning("Cancelled Batch Query Reason %s", e.reason)
+        return overloaded_response(e.message, 503)
+    except Exception as e:
+        logger.error("Failed to Execute Batch Query Error %s", e)
+        return jsonify({"message": str(e)}), 400
+
+    # Per lane results, invalid lanes are reported without failing the batch
+    results = []
+    for lane_id, (validated_data, error) in enumerate(validated_lanes):
+        if error is not None:
+            results.append({"lane": lanes[lane_id], "status": 400, "message": error})
+        else:
+            output = RateAPIDataFormat().format_avg_price_query_data(data[lane_id])
+            results.append({"lane": validated_data.to_dict(), "status": 200, "data": output})
+
+    return jsonify({"results": results}), 200
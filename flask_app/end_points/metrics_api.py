@@ -0,0 +1,58 @@
+from flask import Blueprint, Response, current_app
+
+from db_engine.postgres_db import get_pools_stats
+from utils.cache import get_caches
+from utils.metrics import metrics
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4"
+
+# Monotonic pool and cache stats, exported as counters under these names
+POOL_COUNTERS = {
+    "created": "created_total",
+    "discarded": "discarded_total",
+    "checkouts": "checkouts_total",
+    "timeouts": "timeouts_total",
+    "wait_time_total": "wait_time_seconds_total",
+}
+CACHE_COUNTERS = {
+    "hits": "hits_total",
+    "misses": "misses_total",
+    "invalidations": "invalidations_total",
+    "evictions": "evictions_total",
+}
+
+
+def collect_gauges(extensions, pools_stats):
+    """
+    Current pool, cache and admission stats as (name, labels, value) samples.
+
+    Monotonic stats get ``_total`` names, their type comes from ``HELP``.
+
+    Args:
+        extensions (dict): Extensions of the app holding the caches.
+        pools_stats (dict): Stats per connection pool.
+    """
+    gauges = []
+    for pool, stats in pools_stats.items():
+        for stat, value in stats.items():
+            gauges.append((f"db_pool_{POOL_COUNTERS.get(stat, stat)}", {"pool": pool}, value))
+    for name, cache in get_caches(extensions):
+        for stat, value in cache.stats().items():
+            gauges.append((f"cache_{CACHE_COUNTERS.get(stat, stat)}", {"cache": name}, value))
+    if extensions.get("replica_set") is not None:
+        for host, stats in extensions["replica_set"].stats().items():
+            for stat, value in stats.items():
+                gauges.append((f"db_replica_{stat}", {"host": host}, value))
+    for name in ("rates_admission", "rates_tiers"):
+        if extensions.get(name) is not None:
+            for stat, value in extensions[name].stats().items():
+                gauges.append((f"{name}_{stat}", {}, value))
+    return gauges
+
+
+@metrics_bp.route("")
+def get_metrics():
+    gauges = collect_gauges(current_app.extensions, get_pools_stats())
+    return Response(metrics.render(gauges), mimetype=PROMETHEUS_MIMETYPE)
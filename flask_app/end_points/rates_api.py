@@ -1,33 +1,260 @@
-from flask import Blueprint, request, jsonify
+import itertools
 
-from utils.logger import configure_logger
-from db_engine.db import DB
-from utils.data_validator import RateAPIValidation
-from utils.data_processor import RateAPIDataFormat
-from queries.sql_queries import AVG_PRICE_QUERY
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+
+from custom.errors import QueryCancelledError
+from utils.logger import configure_logger, REQUEST_LOGGER
+from utils.data_validator import rate_api_validation
+from utils.data_processor import RateAPIDataFormat, pyarrow
+from utils.data_fetcher import RateAPIDataFetcher, count_rows
+from utils.region_index import get_region_index
+from utils.metrics import begin_request, timed
+from utils.admission import QueryBudget, query_budget, socket_disconnect_check
+from utils.cache_warmer import WARMUP_ENVIRON_KEY
 
 logger = configure_logger(__name__)
+request_logger = configure_logger(REQUEST_LOGGER)
 
 rates_bp = Blueprint("rates_bp", __name__)
 
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
+COLUMNAR_JSON_MIMETYPE = "application/vnd.rates.columnar+json"
+INT32_MIMETYPE = "application/vnd.rates.int32"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Response formats selected via the Accept header, Arrow only with pyarrow installed
+RATES_MIMETYPES = [JSON_MIMETYPE, NDJSON_MIMETYPE, COLUMNAR_JSON_MIMETYPE, INT32_MIMETYPE]
+if pyarrow is not None:
+    RATES_MIMETYPES.append(ARROW_MIMETYPE)
+
+
+@rates_bp.before_request
+def start_request_timer():
+    g.request_timer = begin_request(current_app.extensions.get("slow_request_profiler"))
+
+
+@rates_bp.before_request
+def admit_request():
+    admission = current_app.extensions.get("rates_admission")
+    if admission is not None:
+        if not admission.acquire():
+            return overloaded_response("Too many requests in flight, retry later", 503)
+        g.rates_admitted = True
+
+
+@rates_bp.teardown_request
+def release_request(exc):
+    # Streamed responses keep their slots until the stream is closed
+    if g.pop("rates_admitted", False):
+        current_app.extensions["rates_admission"].release()
+    tier = g.pop("rates_tier", None)
+    if tier is not None:
+        current_app.extensions["rates_tiers"].release(tier)
+
+
+@rates_bp.after_request
+def add_server_timing(response):
+    timer = g.pop("request_timer", None)
+    if timer is not None:
+        server_timing = timer.end(request.endpoint, response.status_code)
+        if current_app.config["METRICS_SERVER_TIMING"]:
+            response.headers["Server-Timing"] = server_timing
+    return response
+
+
+@rates_bp.after_request
+def log_request(response):
+    # Only responses that went through the result cache are worth warming
+    if (
+        current_app.config["RATES_REQUEST_LOG"]
+        and "X-Cache" in response.headers
+        and not request.environ.get(WARMUP_ENVIRON_KEY)
+    ):
+        request_logger.info(
+            "request",
+            extra={
+                "request": {
+                    "args": request.args.to_dict(),
+                    "status": response.status_code,
+                    "cache": response.headers["X-Cache"],
+                }
+            },
+        )
+    return response
+
+
+def overloaded_response(message, status):
+    """Response of a shed request, clients should retry after Retry-After seconds."""
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(current_app.config["RATES_RETRY_AFTER"])
+    return response
+
+
+def acquire_tier(tier):
+    """Takes a slot of the tier for the request, released on teardown."""
+    if not current_app.extensions["rates_tiers"].acquire(tier):
+        return False
+    g.rates_tier = tier
+    return True
+
+
+def stream_avg_prices(fetcher, validated_data, mimetype, budget):
+    """
+    Streams the prices as a chunked response, memory stays constant whatever the range.
+
+    The query runs under the budget captured by the view. Its first batch is fetched
+    before the status is sent, so that failing queries still get an error response.
+    Unlike the buffered response, every day is sent even without any price, and the
+    response has no ETag and is not cached.
+    """
+    formatter = RateAPIDataFormat()
+    row_batches = fetcher.stream_avg_prices(
+        validated_data, current_app.config["RATES_STREAM_BATCH_SIZE"], budget
+    )
+    row_batches = itertools.chain([next(row_batches, [])], row_batches)
+    if mimetype == NDJSON_MIMETYPE:
+        chunks = formatter.iter_avg_price_ndjson(row_batches)
+    else:
+        chunks = formatter.iter_avg_price_json(row_batches)
+    return Response(stream_with_context(chunks), mimetype=mimetype)
+
+
+def format_avg_price_response(data, mimetype):
+    """
+    Builds the response of the avg price rows in the negotiated format.
+    """
+    formatter = RateAPIDataFormat()
+    if mimetype == COLUMNAR_JSON_MIMETYPE:
+        with timed("format"):
+            output = formatter.format_avg_price_columnar(data)
+        with timed("serialize"):
+            response = jsonify(output)
+        response.mimetype = COLUMNAR_JSON_MIMETYPE
+    elif mimetype in (INT32_MIMETYPE, ARROW_MIMETYPE):
+        with timed("format"):
+            if mimetype == INT32_MIMETYPE:
+                body = formatter.format_avg_price_int32(data)
+            else:
+                body = formatter.format_avg_price_arrow(data)
+        response = Response(body, mimetype=mimetype)
+        response.headers["X-Start-Day"] = data[0][0] if data else ""
+        response.headers["X-Day-Count"] = str(len(data))
+    else:
+        with timed("format"):
+            output = formatter.format_avg_price_query_data(data)
+        with timed("serialize"):
+            response = jsonify(output)
+    return response
+
 
 @rates_bp.route("/")
 def get_avg_price_daywise():
     try:
-        validated_data = RateAPIValidation().validate_rates_args(request.args)
+        with timed("region_index"):
+            region_index = get_region_index()
+    except Exception as e:
+        logger.error("Failed to load region index Error %s", e)
+        return overloaded_response("Region index is unavailable, retry later", 503)
+
+    try:
+        with timed("validate"):
+            validated_data = rate_api_validation.validate_rates_args(request.args, region_index)
+    except Exception as e:
+        logger.info("Failed to validate data %s Errors: %s", request.args, e)
+        return jsonify({"message": str(e)}), 400
+
+    tiers = current_app.extensions["rates_tiers"]
+    tier = tiers.classify(validated_data, region_index)
+    error = tiers.check_range(tier, validated_data)
+    if error is not None:
+        return jsonify({"message": error}), 400
+    if not acquire_tier(tier):
+        return overloaded_response(f"Too many {tier} requests in flight, retry later", 429)
+
+    fetcher = RateAPIDataFetcher(region_index)
+    mimetype = request.accept_mimetypes.best_match(RATES_MIMETYPES, default=JSON_MIMETYPE)
+    if mimetype == NDJSON_MIMETYPE or (
+        mimetype == JSON_MIMETYPE
+        and count_rows(validated_data) >= current_app.config["RATES_STREAM_MIN_DAYS"]
+    ):
+        budget = QueryBudget(tiers.timeout(tier), socket_disconnect_check(request.environ))
+        try:
+            return stream_avg_prices(fetcher, validated_data, mimetype, budget)
+        except QueryCancelledError as e:
+            logger.warning("Cancelled Query %s Reason %s", request.args, e.reason)
+            return overloaded_response(e.message, 503)
+        except Exception as e:
+            logger.error("Failed to Stream Query %s Error %s", request.args, e)
+            return jsonify({"message": str(e)}), 400
+
+    try:
+        with query_budget(tiers.timeout(tier), socket_disconnect_check(request.environ)):
+            data, is_cached = fetcher.fetch_avg_prices(validated_data)
+    except QueryCancelledError as e:
+        logger.warning("Cancelled Query %s Reason %s", request.args, e.reason)
+        return overloaded_response(e.message, 503)
+    except Exception as e:
+        logger.error("Failed to Execute Query %s Error %s", request.args, e)
+        return jsonify({"message": str(e)}), 400
+
+    response = format_avg_price_response(data, mimetype)
+    response.vary.add("Accept")
+    response.headers["X-Cache"] = "HIT" if is_cached else "MISS"
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["RATES_CACHE_CONTROL_MAX_AGE"]
+    # Lets clients and proxies revalidate with If-None-Match and get a 304
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@rates_bp.route("/batch", methods=["POST"])
+def get_avg_price_daywise_batch():
+    try:
+        region_index = get_region_index()
+    except Exception as e:
+        logger.error("Failed to load region index Error %s", e)
+        return overloaded_response("Region index is unavailable, retry later", 503)
+
+    body = request.get_json(silent=True)
+    lanes = body.get("lanes") if isinstance(body, dict) else None
+    try:
+        validated_lanes = rate_api_validation.validate_batch_lanes(
+            lanes, region_index, current_app.config["RATES_BATCH_MAX_LANES"]
+        )
     except Exception as e:
-        logger.error(f"Failed to validate data {request.args} Errors:{e} ")
+        logger.info("Failed to validate batch Errors: %s", e)
         return jsonify({"message": str(e)}), 400
 
-    params = RateAPIDataFormat().create_avg_price_query_args(validated_data)
-    logger.info(f"Created Params for RateAPI {params}")
+    tiers = current_app.extensions["rates_tiers"]
+    validated_lanes, tier = tiers.check_lanes(validated_lanes, region_index)
+    if tier is not None and not acquire_tier(tier):
+        return overloaded_response(f"Too many {tier} requests in flight, retry later", 429)
 
+    valid_lanes = [
+        (lane_id, validated_data)
+        for lane_id, (validated_data, _) in enumerate(validated_lanes)
+        if validated_data is not None
+    ]
     try:
-        data = DB().execute_query(AVG_PRICE_QUERY, params)
+        with query_budget(tiers.timeout(tier), socket_disconnect_check(request.environ)):
+            data = RateAPIDataFetcher(region_index).fetch_avg_prices_batch(valid_lanes)
+    except QueryCancelledError as e:
+        logger.warning("Cancelled Batch Query Reason %s", e.reason)
+        return overloaded_response(e.message, 503)
     except Exception as e:
-        logger.error(f"Failed to Execute Query {request.args} Error {e}")
+        logger.error("Failed to Execute Batch Query Error %s", e)
         return jsonify({"message": str(e)}), 400
 
-    final_output = RateAPIDataFormat().format_avg_price_query_data(data)
+    # Per lane results, invalid lanes are reported without failing the batch
+    results = []
+    for lane_id, (validated_data, error) in enumerate(validated_lanes):
+        if error is not None:
+            results.append({"lane": lanes[lane_id], "status": 400, "message": error})
+        else:
+            output = RateAPIDataFormat().format_avg_price_query_data(data[lane_id])
+            results.append({"lane": validated_data.to_dict(), "status": 200, "data": output})
 
-    return jsonify(final_output), 200
+    logger.debug("Processed batch of %s lanes, %s valid", len(lanes), len(valid_lanes))
+    return jsonify({"results": results}), 200
@@ -0,0 +1,45 @@
+"""
+Gunicorn settings of the production server, read from ``Config``.
+
+Usage (from flask_app/):
+    gunicorn --config gunicorn.conf.py wsgi:app
+
+With SERVER_PRELOAD the app (region index, price snapshot) is loaded once in
+the master and shared by the forked workers. ``kill -HUP <master>`` replaces
+the workers gracefully, code changes then need a restart of the master.
+"""
+
+from config import Config
+
+bind = Config.SERVER_BIND
+workers = Config.SERVER_WORKERS
+threads = Config.SERVER_THREADS
+worker_class = "gthread" if Config.SERVER_THREADS > 1 else "sync"
+preload_app = Config.SERVER_PRELOAD
+max_requests = Config.SERVER_MAX_REQUESTS
+max_requests_jitter = Config.SERVER_MAX_REQUESTS_JITTER
+timeout = Config.SERVER_TIMEOUT
+graceful_timeout = Config.SERVER_GRACEFUL_TIMEOUT
+keepalive = Config.SERVER_KEEPALIVE
+# Request logs are written by the app
+accesslog = None
+
+
+def when_ready(server):
+    # Connections the master opened while preloading are not needed anymore
+    from db_engine.postgres_db import close_pools
+
+    close_pools()
+
+
+def post_worker_init(worker):
+    from app import init_worker
+
+    init_worker(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+
+    if getattr(worker, "wsgi", None) is not None:
+        shutdown_worker(worker.wsgi)
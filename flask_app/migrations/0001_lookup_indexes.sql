@@ -0,0 +1,25 @@
+-- Indexes of the lookups done by AVG_PRICE_QUERY and the region index.
+
+-- Prices of the matching routes within a date range, covering so the
+-- average is computed from the index alone (index only scan).
+CREATE INDEX IF NOT EXISTS price_detail_route_id_day_idx
+    ON price_detail (route_id, day) INCLUDE (price);
+
+-- price_detail is loaded in day order, a BRIN index keeps day range scans
+-- over many routes cheap at a fraction of the size of a btree.
+CREATE INDEX IF NOT EXISTS price_detail_day_brin_idx
+    ON price_detail USING brin (day);
+
+-- Route lookups by port code or region on either side of the lane.
+CREATE INDEX IF NOT EXISTS route_orig_code_dest_code_idx ON route (orig_code, dest_code);
+CREATE INDEX IF NOT EXISTS route_dest_code_idx ON route (dest_code);
+CREATE INDEX IF NOT EXISTS route_orig_region_idx ON route (orig_region);
+CREATE INDEX IF NOT EXISTS route_dest_region_idx ON route (dest_region);
+
+-- Children lookups of the regions tree.
+CREATE INDEX IF NOT EXISTS regions_parent_slug_idx ON regions (parent_slug);
+
+-- Planner statistics for the new indexes.
+ANALYZE price_detail;
+ANALYZE route;
+ANALYZE regions;
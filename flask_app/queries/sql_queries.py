@@ -1,29 +1,15 @@
+# Origin/destination are pre-expanded by utils.region_index.RegionIndex into
+# arrays of port codes and region slugs, so no recursive walk of the regions tree
+# is needed per request.
 AVG_PRICE_QUERY = """
-WITH RECURSIVE orig_region_tree AS (
-    SELECT slug, parent_slug
-    FROM regions
-    WHERE slug = %s
-    UNION ALL
-    SELECT r.slug, r.parent_slug
-    FROM regions r
-    JOIN orig_region_tree rt ON r.parent_slug = rt.slug
-),
-dest_region_tree AS (
-    SELECT slug, parent_slug
-    FROM regions
-    WHERE slug = %s
-    UNION ALL
-    SELECT r.slug, r.parent_slug
-    FROM regions r
-    JOIN dest_region_tree rt ON r.parent_slug = rt.slug
-),
-date_series AS (
-    SELECT generate_series(%s::date, %s::date, '1 day'::interval)::date AS day
+WITH date_series AS (
+    SELECT generate_series(%(date_from)s::date, %(date_to)s::date, '1 day'::interval)::date AS day
 )
 
 SELECT  
     TO_CHAR(ds.day, 'YYYY-MM-DD') AS day,
-    CASE WHEN COUNT(pd.day) < 3 THEN NULL ELSE ROUND(AVG(pd.price)) END AS average_price
+    CASE WHEN COUNT(pd.day) < 3 THEN NULL ELSE ROUND(AVG(pd.price)) END AS average_price,
+    COUNT(pd.day) AS sample_count
 FROM 
     date_series ds
 LEFT JOIN 
@@ -36,12 +22,620 @@ LEFT JOIN
     JOIN
         route r ON r.id = pd.route_id
     WHERE 
-        (r.orig_code = %s OR r.orig_region IN (SELECT slug FROM orig_region_tree))
-        AND (r.dest_code = %s OR r.dest_region IN (SELECT slug FROM dest_region_tree))
-        AND pd.day BETWEEN %s AND %s
+        (r.orig_code = ANY(%(orig_codes)s::text[]) OR r.orig_region = ANY(%(orig_regions)s::text[]))
+        AND (r.dest_code = ANY(%(dest_codes)s::text[]) OR r.dest_region = ANY(%(dest_regions)s::text[]))
+        AND pd.day BETWEEN %(date_from)s AND %(date_to)s
     ) AS pd ON ds.day = pd.day
 GROUP BY 
     ds.day
 ORDER BY 
     ds.day;
 """
+
+REGIONS_QUERY = """
+SELECT slug, parent_slug FROM regions;
+"""
+
+PORT_CODES_QUERY = """
+SELECT orig_code FROM route
+UNION
+SELECT dest_code FROM route;
+"""
+
+# Same semantics as AVG_PRICE_QUERY but reads the per (route, day) rollup.
+# row_count is COUNT(pd.day) and price_sum / price_count is AVG(pd.price).
+AVG_PRICE_ROLLUP_QUERY = """
+WITH date_series AS (
+    SELECT generate_series(%(date_from)s::date, %(date_to)s::date, '1 day'::interval)::date AS day
+)
+
+SELECT
+    TO_CHAR(ds.day, 'YYYY-MM-DD') AS day,
+    CASE
+        WHEN COALESCE(SUM(pr.row_count), 0) < 3 THEN NULL
+        ELSE ROUND(SUM(pr.price_sum)::numeric / NULLIF(SUM(pr.price_count), 0))
+    END AS average_price,
+    COALESCE(SUM(pr.row_count), 0) AS sample_count
+FROM
+    date_series ds
+LEFT JOIN
+    (
+    SELECT
+        pr.day,
+        pr.row_count,
+        pr.price_count,
+        pr.price_sum
+    FROM
+        price_daily_rollup pr
+    JOIN
+        route r ON r.id = pr.route_id
+    WHERE
+        (r.orig_code = ANY(%(orig_codes)s::text[]) OR r.orig_region = ANY(%(orig_regions)s::text[]))
+        AND (r.dest_code = ANY(%(dest_codes)s::text[]) OR r.dest_region = ANY(%(dest_regions)s::text[]))
+        AND pr.day BETWEEN %(date_from)s AND %(date_to)s
+    ) AS pr ON ds.day = pr.day
+GROUP BY
+    ds.day
+ORDER BY
+    ds.day;
+"""
+
+# Summary tables plus statement level triggers keeping them in sync with price_detail.
+# The transition tables let one bulk insert update the rollup with a single upsert.
+# Weekly and monthly rollups are maintained from the daily one, see AVG_PRICE_BUCKET_QUERIES.
+CREATE_PRICE_ROLLUP = """
+CREATE TABLE IF NOT EXISTS price_daily_rollup (
+    route_id bigint NOT NULL,
+    day date NOT NULL,
+    row_count bigint NOT NULL,
+    price_count bigint NOT NULL,
+    price_sum bigint NOT NULL,
+    PRIMARY KEY (route_id, day)
+);
+
+CREATE OR REPLACE FUNCTION price_daily_rollup_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE price_daily_rollup;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO price_daily_rollup AS pr (route_id, day, row_count, price_count, price_sum)
+        SELECT route_id, day, -COUNT(*), -COUNT(price), -COALESCE(SUM(price), 0)
+        FROM old_rows
+        WHERE route_id IS NOT NULL AND day IS NOT NULL
+        GROUP BY route_id, day
+        ON CONFLICT (route_id, day) DO UPDATE SET
+            row_count = pr.row_count + EXCLUDED.row_count,
+            price_count = pr.price_count + EXCLUDED.price_count,
+            price_sum = pr.price_sum + EXCLUDED.price_sum;
+
+        DELETE FROM price_daily_rollup pr
+        USING (SELECT DISTINCT route_id, day FROM old_rows) o
+        WHERE pr.route_id = o.route_id AND pr.day = o.day AND pr.row_count = 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO price_daily_rollup AS pr (route_id, day, row_count, price_count, price_sum)
+        SELECT route_id, day, COUNT(*), COUNT(price), COALESCE(SUM(price), 0)
+        FROM new_rows
+        WHERE route_id IS NOT NULL AND day IS NOT NULL
+        GROUP BY route_id, day
+        ON CONFLICT (route_id, day) DO UPDATE SET
+            row_count = pr.row_count + EXCLUDED.row_count,
+            price_count = pr.price_count + EXCLUDED.price_count,
+            price_sum = pr.price_sum + EXCLUDED.price_sum;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS price_daily_rollup_insert ON price_detail;
+CREATE TRIGGER price_daily_rollup_insert
+    AFTER INSERT ON price_detail
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_daily_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_daily_rollup_update ON price_detail;
+CREATE TRIGGER price_daily_rollup_update
+    AFTER UPDATE ON price_detail
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_daily_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_daily_rollup_delete ON price_detail;
+CREATE TRIGGER price_daily_rollup_delete
+    AFTER DELETE ON price_detail
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_daily_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_daily_rollup_truncate ON price_detail;
+CREATE TRIGGER price_daily_rollup_truncate
+    AFTER TRUNCATE ON price_detail
+    FOR EACH STATEMENT EXECUTE FUNCTION price_daily_rollup_apply();
+
+CREATE TABLE IF NOT EXISTS price_weekly_rollup (
+    route_id bigint NOT NULL,
+    period_start date NOT NULL,
+    row_count bigint NOT NULL,
+    price_count bigint NOT NULL,
+    price_sum bigint NOT NULL,
+    PRIMARY KEY (route_id, period_start)
+);
+
+CREATE TABLE IF NOT EXISTS price_monthly_rollup (LIKE price_weekly_rollup INCLUDING ALL);
+
+-- The weekly and monthly rollups sum up the changed rows of the daily one
+CREATE OR REPLACE FUNCTION price_period_rollup_apply() RETURNS trigger AS $$
+DECLARE
+    unit text;
+    target text;
+    delta text;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE price_weekly_rollup, price_monthly_rollup;
+        RETURN NULL;
+    END IF;
+
+    delta := CASE TG_OP
+        WHEN 'INSERT' THEN
+            'SELECT route_id, day, row_count, price_count, price_sum FROM new_rows'
+        WHEN 'DELETE' THEN
+            'SELECT route_id, day, -row_count, -price_count, -price_sum FROM old_rows'
+        ELSE
+            'SELECT route_id, day, row_count, price_count, price_sum FROM new_rows '
+            'UNION ALL SELECT route_id, day, -row_count, -price_count, -price_sum FROM old_rows'
+    END;
+
+    FOREACH unit IN ARRAY ARRAY['week', 'month'] LOOP
+        target := quote_ident(CASE unit WHEN 'week' THEN 'price_weekly_rollup' ELSE 'price_monthly_rollup' END);
+        EXECUTE
+            'INSERT INTO ' || target || ' AS pr (route_id, period_start, row_count, price_count, price_sum) '
+            'SELECT route_id, date_trunc($1, day::timestamp)::date, SUM(row_count), SUM(price_count), SUM(price_sum) '
+            'FROM (' || delta || ') AS delta (route_id, day, row_count, price_count, price_sum) '
+            'GROUP BY 1, 2 '
+            'ON CONFLICT (route_id, period_start) DO UPDATE SET '
+            '    row_count = pr.row_count + EXCLUDED.row_count, '
+            '    price_count = pr.price_count + EXCLUDED.price_count, '
+            '    price_sum = pr.price_sum + EXCLUDED.price_sum'
+            USING unit;
+        IF TG_OP <> 'INSERT' THEN
+            EXECUTE
+                'DELETE FROM ' || target || ' pr '
+                'USING (SELECT DISTINCT route_id, date_trunc($1, day::timestamp)::date AS period_start FROM old_rows) o '
+                'WHERE pr.route_id = o.route_id AND pr.period_start = o.period_start AND pr.row_count = 0'
+                USING unit;
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS price_period_rollup_insert ON price_daily_rollup;
+CREATE TRIGGER price_period_rollup_insert
+    AFTER INSERT ON price_daily_rollup
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_period_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_period_rollup_update ON price_daily_rollup;
+CREATE TRIGGER price_period_rollup_update
+    AFTER UPDATE ON price_daily_rollup
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_period_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_period_rollup_delete ON price_daily_rollup;
+CREATE TRIGGER price_period_rollup_delete
+    AFTER DELETE ON price_daily_rollup
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION price_period_rollup_apply();
+
+DROP TRIGGER IF EXISTS price_period_rollup_truncate ON price_daily_rollup;
+CREATE TRIGGER price_period_rollup_truncate
+    AFTER TRUNCATE ON price_daily_rollup
+    FOR EACH STATEMENT EXECUTE FUNCTION price_period_rollup_apply();
+"""
+
+# Rebuild of the weekly or monthly rows of the periods overlapping a day range from the
+# daily rollup. The triggers only apply deltas, rows missing or wrong beforehand (e.g.
+# period tables created after the daily one was filled) would stay wrong otherwise.
+_REBUILD_PERIOD_ROLLUP = """
+DELETE FROM {table}
+WHERE period_start BETWEEN
+    date_trunc('{unit}', COALESCE(%(date_from)s::date, '-infinity')::timestamp)::date
+    AND COALESCE(%(date_to)s::date, 'infinity');
+
+INSERT INTO {table} (route_id, period_start, row_count, price_count, price_sum)
+SELECT route_id, date_trunc('{unit}', day::timestamp)::date, SUM(row_count), SUM(price_count), SUM(price_sum)
+FROM price_daily_rollup
+WHERE day >= date_trunc('{unit}', COALESCE(%(date_from)s::date, '-infinity')::timestamp)::date
+    AND day < (date_trunc('{unit}', COALESCE(%(date_to)s::date, 'infinity')::timestamp) + '1 {unit}'::interval)::date
+GROUP BY 1, 2;
+"""
+
+# Backfill of the rollups for a day range. price_detail is locked so concurrent
+# inserts (and their triggers) can not interleave with the rebuild.
+BACKFILL_PRICE_ROLLUP = """
+LOCK TABLE price_detail IN SHARE MODE;
+
+DELETE FROM price_daily_rollup
+WHERE day BETWEEN COALESCE(%(date_from)s::date, '-infinity') AND COALESCE(%(date_to)s::date, 'infinity');
+
+INSERT INTO price_daily_rollup (route_id, day, row_count, price_count, price_sum)
+SELECT route_id, day, COUNT(*), COUNT(price), COALESCE(SUM(price), 0)
+FROM price_detail
+WHERE route_id IS NOT NULL
+    AND day BETWEEN COALESCE(%(date_from)s::date, '-infinity') AND COALESCE(%(date_to)s::date, 'infinity')
+GROUP BY route_id, day;
+""" + "".join(
+    _REBUILD_PERIOD_ROLLUP.format(table=table, unit=unit)
+    for table, unit in (("price_weekly_rollup", "week"), ("price_monthly_rollup", "month"))
+)
+
+# AVG_PRICE_QUERY per calendar week (starting on Monday) or month instead of per day.
+# Buckets are clipped to the range and labelled with their first day within it, the
+# fewer than 3 samples rule applies per bucket.
+_AVG_PRICE_BUCKET_SERIES = """
+WITH bucket_series AS (
+    SELECT generate_series(
+        date_trunc('{unit}', %(date_from)s::date::timestamp),
+        %(date_to)s::date::timestamp,
+        '1 {unit}'::interval
+    )::date AS bucket
+)"""
+
+_AVG_PRICE_BUCKET_QUERY = _AVG_PRICE_BUCKET_SERIES + """
+
+SELECT
+    TO_CHAR(GREATEST(bs.bucket, %(date_from)s::date), 'YYYY-MM-DD') AS day,
+    CASE WHEN COUNT(pd.day) < 3 THEN NULL ELSE ROUND(AVG(pd.price)) END AS average_price,
+    COUNT(pd.day) AS sample_count
+FROM
+    bucket_series bs
+LEFT JOIN
+    (
+    SELECT
+        date_trunc('{unit}', pd.day::timestamp)::date AS bucket,
+        pd.day,
+        pd.price
+    FROM
+        price_detail pd
+    JOIN
+        route r ON r.id = pd.route_id
+    WHERE
+        (r.orig_code = ANY(%(orig_codes)s::text[]) OR r.orig_region = ANY(%(orig_regions)s::text[]))
+        AND (r.dest_code = ANY(%(dest_codes)s::text[]) OR r.dest_region = ANY(%(dest_regions)s::text[]))
+        AND pd.day BETWEEN %(date_from)s AND %(date_to)s
+    ) AS pd ON bs.bucket = pd.bucket
+GROUP BY
+    bs.bucket
+ORDER BY
+    bs.bucket;
+"""
+
+# Periods entirely inside the range are read from the weekly / monthly rollup, only the
+# days of a partial first or last period from the daily one. The cost grows with the
+# number of buckets instead of the number of days.
+_AVG_PRICE_BUCKET_ROLLUP_QUERY = _AVG_PRICE_BUCKET_SERIES + """,
+full_periods AS (
+    -- Start of the first period inside the range and of the first one ending after it
+    SELECT
+        (date_trunc('{unit}', (%(date_from)s::date - 1)::timestamp) + '1 {unit}'::interval)::date
+            AS first_start,
+        date_trunc('{unit}', (%(date_to)s::date + 1)::timestamp)::date AS end_start
+),
+routes AS (
+    SELECT r.id
+    FROM route r
+    WHERE
+        (r.orig_code = ANY(%(orig_codes)s::text[]) OR r.orig_region = ANY(%(orig_regions)s::text[]))
+        AND (r.dest_code = ANY(%(dest_codes)s::text[]) OR r.dest_region = ANY(%(dest_regions)s::text[]))
+),
+samples AS (
+    SELECT pr.period_start AS bucket, pr.row_count, pr.price_count, pr.price_sum
+    FROM routes r
+    CROSS JOIN full_periods f
+    JOIN {table} pr ON pr.route_id = r.id
+        AND pr.period_start >= f.first_start AND pr.period_start < f.end_start
+    UNION ALL
+    SELECT date_trunc('{unit}', pr.day::timestamp)::date, pr.row_count, pr.price_count, pr.price_sum
+    FROM routes r
+    CROSS JOIN full_periods f
+    JOIN price_daily_rollup pr ON pr.route_id = r.id
+        AND pr.day BETWEEN %(date_from)s AND LEAST(%(date_to)s::date, f.first_start - 1)
+    UNION ALL
+    SELECT date_trunc('{unit}', pr.day::timestamp)::date, pr.row_count, pr.price_count, pr.price_sum
+    FROM routes r
+    CROSS JOIN full_periods f
+    JOIN price_daily_rollup pr ON pr.route_id = r.id
+        AND pr.day BETWEEN GREATEST(f.first_start, f.end_start) AND %(date_to)s
+)
+SELECT
+    TO_CHAR(GREATEST(bs.bucket, %(date_from)s::date), 'YYYY-MM-DD') AS day,
+    CASE
+        WHEN COALESCE(SUM(s.row_count), 0) < 3 THEN NULL
+        ELSE ROUND(SUM(s.price_sum)::numeric / NULLIF(SUM(s.price_count), 0))
+    END AS average_price,
+    COALESCE(SUM(s.row_count), 0) AS sample_count
+FROM
+    bucket_series bs
+LEFT JOIN
+    samples s ON s.bucket = bs.bucket
+GROUP BY
+    bs.bucket
+ORDER BY
+    bs.bucket;
+"""
+
+AVG_PRICE_BUCKET_QUERIES = {
+    unit: _AVG_PRICE_BUCKET_QUERY.format(unit=unit) for unit in ("week", "month")
+}
+AVG_PRICE_BUCKET_ROLLUP_QUERIES = {
+    unit: _AVG_PRICE_BUCKET_ROLLUP_QUERY.format(unit=unit, table=f"price_{unit}ly_rollup")
+    for unit in ("week", "month")
+}
+
+# Set based AVG_PRICE_QUERY for many lanes at once. Lanes and their expanded
+# port codes / region slugs are passed as parallel arrays and unnested.
+# Rows are (lane_id, day, average_price, sample_count) ordered by lane and day.
+_BATCH_LANES = """
+WITH lanes AS (
+    SELECT *
+    FROM unnest(%(lane_ids)s::int[], %(dates_from)s::date[], %(dates_to)s::date[])
+        AS l(lane_id, date_from, date_to)
+),
+orig AS (
+    SELECT *
+    FROM unnest(%(orig_lane_ids)s::int[], %(orig_keys)s::text[], %(orig_is_code)s::bool[])
+        AS o(lane_id, key, is_code)
+),
+dest AS (
+    SELECT *
+    FROM unnest(%(dest_lane_ids)s::int[], %(dest_keys)s::text[], %(dest_is_code)s::bool[])
+        AS d(lane_id, key, is_code)
+),
+lane_routes AS (
+    SELECT DISTINCT o.lane_id, r.id AS route_id
+    FROM orig o
+    JOIN route r
+        ON (o.is_code AND r.orig_code = o.key) OR (NOT o.is_code AND r.orig_region = o.key)
+    JOIN dest d
+        ON d.lane_id = o.lane_id
+        AND ((d.is_code AND r.dest_code = d.key) OR (NOT d.is_code AND r.dest_region = d.key))
+),
+lane_days AS (
+    SELECT l.lane_id, generate_series(l.date_from, l.date_to, '1 day'::interval)::date AS day
+    FROM lanes l
+)
+"""
+
+AVG_PRICE_BATCH_QUERY = _BATCH_LANES + """
+SELECT
+    ld.lane_id,
+    TO_CHAR(ld.day, 'YYYY-MM-DD') AS day,
+    CASE WHEN COUNT(lp.day) < 3 THEN NULL ELSE ROUND(AVG(lp.price)) END AS average_price,
+    COUNT(lp.day) AS sample_count
+FROM
+    lane_days ld
+LEFT JOIN
+    (
+    SELECT lr.lane_id, pd.day, pd.price
+    FROM lane_routes lr
+    JOIN lanes l ON l.lane_id = lr.lane_id
+    JOIN price_detail pd ON pd.route_id = lr.route_id AND pd.day BETWEEN l.date_from AND l.date_to
+    WHERE pd.day BETWEEN %(span_from)s AND %(span_to)s
+    ) AS lp ON lp.lane_id = ld.lane_id AND lp.day = ld.day
+GROUP BY
+    ld.lane_id, ld.day
+ORDER BY
+    ld.lane_id, ld.day;
+"""
+
+AVG_PRICE_ROLLUP_BATCH_QUERY = _BATCH_LANES + """
+SELECT
+    ld.lane_id,
+    TO_CHAR(ld.day, 'YYYY-MM-DD') AS day,
+    CASE
+        WHEN COALESCE(SUM(lp.row_count), 0) < 3 THEN NULL
+        ELSE ROUND(SUM(lp.price_sum)::numeric / NULLIF(SUM(lp.price_count), 0))
+    END AS average_price,
+    COALESCE(SUM(lp.row_count), 0) AS sample_count
+FROM
+    lane_days ld
+LEFT JOIN
+    (
+    SELECT lr.lane_id, pr.day, pr.row_count, pr.price_count, pr.price_sum
+    FROM lane_routes lr
+    JOIN lanes l ON l.lane_id = lr.lane_id
+    JOIN price_daily_rollup pr ON pr.route_id = lr.route_id AND pr.day BETWEEN l.date_from AND l.date_to
+    ) AS lp ON lp.lane_id = ld.lane_id AND lp.day = ld.day
+GROUP BY
+    ld.lane_id, ld.day
+ORDER BY
+    ld.lane_id, ld.day;
+"""
+
+CREATE_SCHEMA_MIGRATIONS = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version integer PRIMARY KEY,
+    name text NOT NULL,
+    checksum text NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+APPLIED_MIGRATIONS_QUERY = """
+SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version;
+"""
+
+# Runs in the transaction of the migration itself, so a failed migration is not recorded
+RECORD_MIGRATION = """
+INSERT INTO schema_migrations (version, name, checksum) VALUES (%(version)s, %(name)s, %(checksum)s);
+"""
+
+PRICE_DATE_RANGE_QUERY = """
+SELECT min(day), max(day) FROM price_detail;
+"""
+
+# Route with the most prices, a representative port to port lane
+BUSIEST_ROUTE_QUERY = """
+SELECT r.orig_code, r.dest_code, r.orig_region, r.dest_region
+FROM route r
+JOIN price_detail pd ON pd.route_id = r.id
+GROUP BY r.id, r.orig_code, r.dest_code, r.orig_region, r.dest_region
+ORDER BY count(*) DESC
+LIMIT 1;
+"""
+
+PRICE_DETAIL_PARTITIONED_QUERY = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('price_detail')
+);
+"""
+
+# Partitions of price_detail with their bounds and (estimated) number of rows
+PRICE_DETAIL_PARTITIONS_QUERY = """
+SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass('price_detail')
+ORDER BY c.relname;
+"""
+
+# Definitions re-created on the partitioned table, unique indexes would need the partition key
+PRICE_DETAIL_INDEXES_QUERY = """
+SELECT pg_get_indexdef(indexrelid)
+FROM pg_index
+WHERE indrelid = to_regclass('price_detail') AND NOT indisunique;
+"""
+
+PRICE_DETAIL_CONSTRAINTS_QUERY = """
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = to_regclass('price_detail') AND contype IN ('c', 'f');
+"""
+
+PRICE_ROLLUP_TRIGGER_QUERY = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_trigger
+    WHERE tgrelid = to_regclass('price_detail') AND tgname = 'price_daily_rollup_insert'
+);
+"""
+
+# Periods of the rows which ended up in the default partition
+PRICE_DETAIL_DEFAULT_DAYS_QUERY = """
+SELECT min(day), max(day) FROM price_detail_default WHERE day IS NOT NULL;
+"""
+
+# Staging table of `flask ingest`, rows are COPYed in chunks before being merged
+CREATE_PRICE_STAGING = """
+CREATE TEMP TABLE price_staging (
+    route_id bigint NOT NULL,
+    day date NOT NULL,
+    price integer
+) ON COMMIT DROP;
+"""
+
+COPY_PRICE_STAGING = "COPY price_staging (route_id, day, price) FROM STDIN WITH (FORMAT csv)"
+
+# Serializes ingestions, new ids continue from max(id)
+INGEST_LOCK = "SELECT pg_advisory_xact_lock(73190002);"
+
+# Counted per route so the log can name the unknown route ids
+DELETE_UNKNOWN_ROUTES = """
+WITH rejected AS (
+    DELETE FROM price_staging s
+    WHERE NOT EXISTS (SELECT 1 FROM route r WHERE r.id = s.route_id)
+    RETURNING s.route_id
+)
+SELECT route_id, count(*) FROM rejected GROUP BY route_id ORDER BY route_id;
+"""
+
+STAGING_DAYS_QUERY = "SELECT DISTINCT day FROM price_staging ORDER BY day;"
+
+# Days whose prices changed, polled by the workers to invalidate their in-process caches.
+# Rows are only needed until every worker polled them, older ones are pruned.
+CREATE_PRICE_DAY_CHANGES = """
+CREATE TABLE IF NOT EXISTS price_day_changes (
+    id bigserial PRIMARY KEY,
+    day date NOT NULL,
+    changed_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+RECORD_PRICE_DAY_CHANGES = """
+DELETE FROM price_day_changes WHERE changed_at < now() - interval '1 day';
+INSERT INTO price_day_changes (day) SELECT unnest(%(days)s::date[]);
+"""
+
+PRICE_DAY_CHANGES_EXIST_QUERY = "SELECT to_regclass('price_day_changes') IS NOT NULL;"
+
+PRICE_DAY_CHANGES_MAX_ID_QUERY = "SELECT COALESCE(max(id), 0) FROM price_day_changes;"
+
+PRICE_DAY_CHANGES_QUERY = """
+SELECT id, day::text FROM price_day_changes WHERE id > %(last_id)s ORDER BY id;
+"""
+
+# Upsert mode: the staged rows replace every price of their (route, day)
+DELETE_STAGED_ROUTE_DAYS = """
+DELETE FROM price_detail pd
+USING (SELECT DISTINCT route_id, day FROM price_staging) s
+WHERE pd.route_id = s.route_id AND pd.day = s.day;
+"""
+
+INSERT_STAGED_PRICES = """
+INSERT INTO price_detail (id, route_id, day, price)
+SELECT m.max_id + row_number() OVER (), s.route_id, s.day, s.price
+FROM price_staging s
+CROSS JOIN (SELECT COALESCE(max(id), 0) AS max_id FROM price_detail) m;
+"""
+
+# Snapshot of the in-memory price engine, fixed width binary rows (see db_engine/numpy_db.py).
+# Rows without route or day can never match AVG_PRICE_QUERY and are left out.
+PRICE_SNAPSHOT_COPY = """
+COPY (
+    SELECT route_id::bigint, (day - DATE '1970-01-01')::integer,
+           COALESCE(price, 0)::integer, price IS NULL
+    FROM price_detail
+    WHERE route_id IS NOT NULL AND day IS NOT NULL AND {condition}
+) TO STDOUT WITH (FORMAT binary)
+"""
+
+PRICE_SNAPSHOT_ROUTES_QUERY = """
+SELECT id, orig_code, dest_code, orig_region, dest_region FROM route WHERE id IS NOT NULL;
+"""
+
+# Tells whether price_detail only got new rows (ids above max_id) since the last snapshot.
+# The checksum sums a hash of every whole row, so updates keeping the column sums (swapped
+# values, +x/-x corrections, NULL to 0) change it as well.
+PRICE_SNAPSHOT_STATE_QUERY = """
+SELECT
+    count(*),
+    max(id),
+    COALESCE(sum(hashtext(ROW(id, route_id, day, price)::text)), 0),
+    count(*) FILTER (WHERE id > %(max_id)s),
+    COALESCE(sum(hashtext(ROW(id, route_id, day, price)::text)) FILTER (WHERE id > %(max_id)s), 0)
+FROM price_detail
+WHERE route_id IS NOT NULL AND day IS NOT NULL;
+"""
+
+# Per request query budget, only for the current transaction
+SET_STATEMENT_TIMEOUT = "SELECT set_config('statement_timeout', %s::text, true);"
+
+# Seconds a read replica is behind the primary, 0 on the primary or once every received WAL is replayed
+REPLICATION_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END;
+"""
+
+# Hot queries run as server side prepared statements (DB_PREPARED_STATEMENTS), keyed by
+# the statement name. Their parameters have to be named, each one is bound once.
+PREPARED_QUERIES = {
+    "avg_price": AVG_PRICE_QUERY,
+    "avg_price_rollup": AVG_PRICE_ROLLUP_QUERY,
+    "avg_price_week": AVG_PRICE_BUCKET_QUERIES["week"],
+    "avg_price_month": AVG_PRICE_BUCKET_QUERIES["month"],
+    "avg_price_week_rollup": AVG_PRICE_BUCKET_ROLLUP_QUERIES["week"],
+    "avg_price_month_rollup": AVG_PRICE_BUCKET_ROLLUP_QUERIES["month"],
+}
@@ -0,0 +1,113 @@
+import unittest
+
+from app import create_app
+from config import TestConfig
+from custom.errors import QueryCancelledError
+from db_engine.db import DB
+from utils.admission import AdmissionController, QueryBudget, parse_tier_limits, query_budget
+from utils.test import TestDBUtils
+
+
+class LimitedTestConfig(TestConfig):
+    RATES_MAX_CONCURRENT = 1
+    RATES_MAX_QUEUE = 0
+    RATES_TIER_MAX_DAYS = "port=30,region=30,top_region=3"
+    RATES_TIER_MAX_CONCURRENT = "port=0"
+
+
+class TestAdmission(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the query budgets and the load shedding of /rates/.
+    """
+
+    url = "rates/?date_from=2016-01-01&date_to=2016-01-06&origin={}&destination={}"
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(LimitedTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_admission_controller(self):
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+        self.assertTrue(admission.acquire())
+        # Waits for the queue timeout, then gives up
+        self.assertFalse(admission.acquire())
+        admission.release()
+        self.assertTrue(admission.acquire())
+        self.assertEqual(admission.stats(), {"in_flight": 1, "waiting": 0})
+
+    def test_parse_tier_limits(self):
+        self.assertEqual(parse_tier_limits("port=10, top_region=2"), {"port": 10, "top_region": 2})
+        with self.assertRaises(ValueError):
+            parse_tier_limits("continent=1")
+
+    def test_tier_limits(self):
+        # scandinavia has a parent, china_main is a top level region
+        response = self.client.get(self.url.format("china_south_main", "scandinavia"))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url.format("china_main", "scandinavia"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json["message"], "Date range of top_region requests is limited to 3 days"
+        )
+
+        # Port requests are not allowed in flight at all by the config
+        response = self.client.get(self.url.format("CNCWN", "NOGJM"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+    def test_saturated_worker(self):
+        admission = self.app.extensions["rates_admission"]
+        self.assertTrue(admission.acquire())
+        try:
+            response = self.client.get(self.url.format("china_south_main", "scandinavia"))
+        finally:
+            admission.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        # Slots of finished requests are released
+        response = self.client.get(self.url.format("china_south_main", "scandinavia"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_statement_timeout(self):
+        with query_budget(timeout=0.05):
+            with self.assertRaises(QueryCancelledError) as raised:
+                DB().execute_query("SELECT pg_sleep(5);")
+        self.assertEqual(raised.exception.reason, "timeout")
+
+        # The timeout ends with the transaction, pooled connections are not affected
+        self.assertEqual(DB().execute_query("SELECT 1 FROM pg_sleep(0.1);"), [(1,)])
+
+    def test_cancel_on_disconnect(self):
+        with query_budget(is_disconnected=lambda: True):
+            with self.assertRaises(QueryCancelledError) as raised:
+                DB().execute_query("SELECT pg_sleep(5);")
+        self.assertEqual(raised.exception.reason, "disconnect")
+
+    def test_streamed_query_budget(self):
+        rows = DB().stream_query("SELECT 1 FROM pg_sleep(5);", budget=QueryBudget(timeout=0.05))
+        with self.assertRaises(QueryCancelledError) as raised:
+            next(rows)
+        self.assertEqual(raised.exception.reason, "timeout")
+
+        rows = DB().stream_query(
+            "SELECT 1 FROM pg_sleep(5);", budget=QueryBudget(is_disconnected=lambda: True)
+        )
+        with self.assertRaises(QueryCancelledError) as raised:
+            next(rows)
+        self.assertEqual(raised.exception.reason, "disconnect")
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+
+from app import create_app
+from async_app import create_async_app
+from config import TestConfig
+from db_engine.async_postgres_db import AsyncPostGresDB, to_asyncpg_query
+from utils.region_index import RegionIndex
+from utils.test import TestDBUtils
+
+
+class CountingDB:
+    """Async DB counting the queries it runs."""
+
+    def __init__(self, db):
+        self.db = db
+        self.queries = 0
+
+    async def execute_query(self, query, *args):
+        self.queries += 1
+        return await self.db.execute_query(query, *args)
+
+
+class TestAsyncRateAPI(unittest.IsolatedAsyncioTestCase, TestDBUtils):
+    """
+    Unit tests for the async app, compared against the sync app.
+    """
+
+    urls = [
+        "/rates/?date_from=2016-01-01&date_to=2016-01-01&origin=CNCWN&destination=NOGJM",
+        "/rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia",
+        "/rates/?date_from=2016-01-01&date_to=2016-01-01&origin=CNYTN&destination=NOFRO",
+        "/rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNSGH&destination=CNSGH",
+    ]
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        self.async_app = create_async_app(TestConfig)
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_to_asyncpg_query(self):
+        """
+        Test if psycopg2 placeholders are converted and named ones bound once.
+        """
+        query, args = to_asyncpg_query("SELECT %s, %s, '100%%'", ("a", "b"))
+        self.assertEqual((query, args), ("SELECT $1, $2, '100%'", ["a", "b"]))
+
+        query, args = to_asyncpg_query("SELECT %(x)s, %(y)s, %(x)s", {"x": 1, "y": 2})
+        self.assertEqual((query, args), ("SELECT $1, $2, $1", [1, 2]))
+
+    async def test_async_matches_sync(self):
+        """
+        Test if the async endpoints return the same responses as the sync ones.
+        """
+        async with self.async_app.test_app() as test_app:
+            client = test_app.test_client()
+            for url in self.urls:
+                async_response = await client.get(url)
+                sync_response = self.client.get(url)
+                self.assertEqual(async_response.status_code, sync_response.status_code, url)
+                self.assertEqual(await async_response.get_json(), sync_response.json, url)
+
+            lanes = [
+                {
+                    "date_from": "2016-01-01",
+                    "date_to": "2016-01-06",
+                    "origin": "china_main",
+                    "destination": "NOGJM",
+                },
+                {
+                    "date_from": "2016-01-01",
+                    "date_to": "2016-01-01",
+                    "origin": "CNSGH",
+                    "destination": "NOGJM",
+                },
+            ]
+            async_response = await client.post("/rates/batch", json={"lanes": lanes})
+            sync_response = self.client.post("/rates/batch", json={"lanes": lanes})
+            self.assertEqual(await async_response.get_json(), sync_response.json)
+
+    async def test_concurrent_region_index_load(self):
+        """
+        Test if concurrent requests load the region index once.
+        """
+        async with self.async_app.test_app():
+            db = CountingDB(AsyncPostGresDB(self.async_app.extensions["async_db_pool"]))
+            region_index = RegionIndex(ttl=60)
+            await asyncio.gather(*(region_index.ensure_fresh_async(db) for _ in range(5)))
+            self.assertEqual(db.queries, 2)
+            self.assertTrue(region_index.is_region("scandinavia"))
@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from app import create_app
+from config import TestConfig
+from utils.cache_warmer import warm_rates_cache
+from utils.logger import REQUEST_LOG_FILE, start_log_listener, stop_log_listener
+from utils.metrics import metrics
+from utils.test import TestDBUtils
+
+PORT_LANE = {"origin": "CNCWN", "destination": "NOGJM"}
+REGION_LANE = {"origin": "china_main", "destination": "scandinavia"}
+JANUARY = {"date_from": "2016-01-01", "date_to": "2016-01-10"}
+
+
+class WarmupTestConfig(TestConfig):
+    RATES_CACHE_BACKEND = "memory"
+    RATES_WARMUP_CONCURRENCY = 2
+
+
+class TestCacheWarmer(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for warming the result cache from the request log.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        metrics.clear()
+        self.app = create_app(WarmupTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.log_dir.name, "requests.jsonl")
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.log_dir.cleanup()
+        self.drop_test_database()
+        self.context.pop()
+
+    def write_log(self, records):
+        now = datetime.now(timezone.utc)
+        with open(self.log_path, "w") as log_file:
+            for hours_ago, args in records:
+                time = (now - timedelta(hours=hours_ago)).isoformat()
+                log_file.write(json.dumps({"time": time, "args": args}) + "\n")
+            log_file.write('{"time": "2016-01-0')
+
+    def test_warm_top_lanes(self):
+        self.write_log(
+            [(1, {**PORT_LANE, **JANUARY})] * 3
+            + [(2, {**REGION_LANE, **JANUARY, "granularity": "week"})] * 2
+            # Outside of the window, unknown lane and a lane requested once only
+            + [(48, {**REGION_LANE, "date_from": "2016-01-05", "date_to": "2016-01-06"})] * 5
+            + [(1, {"origin": "XXXXX", "destination": "NOGJM", **JANUARY})] * 5
+            + [(1, {**PORT_LANE, "date_from": "2016-01-02", "date_to": "2016-01-03"})]
+        )
+
+        results = warm_rates_cache(self.app, top_n=2, log_path=self.log_path)
+        self.assertEqual(results, {"warmed": 2, "cached": 0, "skipped": 0, "failed": 0})
+        self.assertEqual(metrics.get("rates_warmup_lanes_total", result="warmed"), 2)
+
+        response = self.client.get("rates/", query_string={**PORT_LANE, **JANUARY})
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+        self.assertEqual(metrics.get("rates_warmed_lookups_total", result="hit"), 1)
+        response = self.client.get(
+            "rates/", query_string={**PORT_LANE, **JANUARY, "granularity": "week"}
+        )
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+
+    def test_requests_are_logged(self):
+        query = {**REGION_LANE, **JANUARY, "granularity": "month"}
+        self.assertEqual(self.client.get("rates/", query_string=query).status_code, 200)
+        self.assertEqual(self.client.get("rates/?origin=CNCWN").status_code, 400)
+
+        # Flushes the queued records
+        stop_log_listener()
+        start_log_listener()
+        with open(REQUEST_LOG_FILE) as log_file:
+            record = json.loads(log_file.readlines()[-1])
+        self.assertEqual(record["args"], query)
+        self.assertEqual(record["cache"], "MISS")
+
+        # Lanes of the warm-up itself are not logged again
+        results = warm_rates_cache(self.app, log_path=REQUEST_LOG_FILE)
+        self.assertGreaterEqual(results["cached"], 1)
+        stop_log_listener()
+        start_log_listener()
+        with open(REQUEST_LOG_FILE) as log_file:
+            self.assertEqual(json.loads(log_file.readlines()[-1]), record)
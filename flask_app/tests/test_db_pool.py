@@ -0,0 +1,94 @@
+import os
+import unittest
+
+from app import create_app, init_worker
+from db_engine.db import DB
+from config import TestConfig
+from custom.errors import PoolTimeoutError
+from utils.test import TestDBUtils
+
+
+class TestDBPool(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the pooled Postgres connections.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_connection_is_reused(self):
+        """
+        Test if consecutive queries share one backend connection.
+        """
+        first_pid = DB().execute_query("SELECT pg_backend_pid();")[0][0]
+        second_pid = DB().execute_query("SELECT pg_backend_pid();")[0][0]
+        self.assertEqual(first_pid, second_pid)
+
+        stats = DB().get_pool_stats()
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["idle"], stats["size"])
+
+    def test_checkout_timeout(self):
+        """
+        Test if checkout fails once every connection is in use.
+        """
+        pool = DB().get_pool()
+        pool.timeout = 0.1
+        conns = [pool.getconn() for _ in range(pool.max_size)]
+        try:
+            with self.assertRaises(PoolTimeoutError):
+                pool.getconn()
+            self.assertEqual(pool.stats()["timeouts"], 1)
+        finally:
+            for conn in conns:
+                pool.putconn(conn)
+
+    def test_broken_connection_is_replaced(self):
+        """
+        Test if a closed connection is not handed out again.
+        """
+        pool = DB().get_pool()
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+
+        self.assertEqual(DB().execute_query("SELECT 1;")[0][0], 1)
+        self.assertGreaterEqual(pool.stats()["discarded"], 1)
+
+    def test_forked_worker_opens_own_pool(self):
+        """
+        Test if a forked worker gets its own connections and leaves the parent's intact.
+        """
+        parent_pid = DB().execute_query("SELECT pg_backend_pid();")[0][0]
+        read_fd, write_fd = os.pipe()
+        child = os.fork()
+        if child == 0:
+            # Worker process, never returns into the test runner
+            try:
+                os.close(read_fd)
+                init_worker(self.app)
+                with self.app.app_context():
+                    pid = DB().execute_query("SELECT pg_backend_pid();")[0][0]
+                os.write(write_fd, str(pid).encode())
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            worker_pid = int(pipe.read() or 0)
+        os.waitpid(child, 0)
+        self.assertNotIn(worker_pid, (0, parent_pid))
+        self.assertEqual(DB().execute_query("SELECT pg_backend_pid();")[0][0], parent_pid)
@@ -0,0 +1,146 @@
+import itertools
+import unittest
+from datetime import date
+
+from app import create_app
+from config import TestConfig
+from db_engine.db import DB
+from db_engine.numpy_db import NumpyPriceDB, np
+from db_engine.rollup import PriceRollup
+from queries.sql_queries import (
+    AVG_PRICE_QUERY,
+    AVG_PRICE_BUCKET_QUERIES,
+    AVG_PRICE_BUCKET_ROLLUP_QUERIES,
+)
+from utils.data_processor import RateAPIDataFormat, bucket_starts
+from utils.data_validator import RatesParams
+from utils.region_index import get_region_index
+from utils.test import TestDBUtils
+
+# Prices of every route around the test data days, a tenth of them NULL
+INSERT_PRICES = """
+INSERT INTO price_detail (route_id, price, day)
+SELECT
+    (ARRAY[30, 650, 651, 652])[1 + i %% 4],
+    CASE WHEN i %% 10 = 0 THEN NULL ELSE (i * 37) %% 5000 END,
+    DATE '2015-11-20' + (i * 7) %% 150
+FROM generate_series(1, 600) AS i;
+"""
+
+# Schema of a database whose daily rollup predates the weekly and monthly ones
+DROP_PERIOD_ROLLUPS = """
+DROP TRIGGER price_period_rollup_insert ON price_daily_rollup;
+DROP TRIGGER price_period_rollup_update ON price_daily_rollup;
+DROP TRIGGER price_period_rollup_delete ON price_daily_rollup;
+DROP TRIGGER price_period_rollup_truncate ON price_daily_rollup;
+DROP FUNCTION price_period_rollup_apply();
+DROP TABLE price_weekly_rollup, price_monthly_rollup;
+"""
+
+LANES = [("china_main", "scandinavia"), ("CNCWN", "NOGJM"), ("CNYTN", "northern_europe")]
+RANGES = [
+    (date(2015, 11, 20), date(2016, 4, 10)),
+    (date(2015, 12, 1), date(2016, 2, 29)),
+    (date(2016, 1, 3), date(2016, 1, 20)),
+    (date(2016, 1, 6), date(2016, 1, 6)),
+]
+
+
+class TestGranularity(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the weekly and monthly averages and their rollups.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        DB().execute_command(INSERT_PRICES)
+        PriceRollup().build()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def assert_buckets_match(self, engine=None):
+        region_index = get_region_index()
+        for (origin, destination), (date_from, date_to), granularity in itertools.product(
+            LANES, RANGES, ("week", "month")
+        ):
+            params = RateAPIDataFormat().create_avg_price_query_args(
+                RatesParams(origin, destination, date_from, date_to), region_index
+            )
+            case = (origin, destination, date_from, date_to, granularity)
+            raw = DB().execute_query(AVG_PRICE_BUCKET_QUERIES[granularity], params)
+            rollup = DB().execute_query(AVG_PRICE_BUCKET_ROLLUP_QUERIES[granularity], params)
+            self.assertEqual(rollup, raw, case)
+            if engine is not None:
+                self.assertEqual(
+                    engine.execute_query(AVG_PRICE_BUCKET_QUERIES[granularity], params), raw, case
+                )
+
+            starts = bucket_starts(date_from, date_to, granularity)
+            self.assertEqual([row[0] for row in raw], [start.isoformat() for start in starts])
+            days = DB().execute_query(AVG_PRICE_QUERY, params)
+            self.assertEqual(sum(row[2] for row in raw), sum(row[2] for row in days), case)
+
+    def test_buckets_match_days(self):
+        self.assertEqual(
+            bucket_starts(date(2015, 12, 30), date(2016, 2, 1), "month"),
+            [date(2015, 12, 30), date(2016, 1, 1), date(2016, 2, 1)],
+        )
+        self.assertEqual(
+            bucket_starts(date(2016, 1, 6), date(2016, 1, 18), "week"),
+            [date(2016, 1, 6), date(2016, 1, 11), date(2016, 1, 18)],
+        )
+        self.assert_buckets_match()
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_numpy_engine(self):
+        engine = NumpyPriceDB(refresh_interval=None)
+        engine.load()
+        self.assert_buckets_match(engine)
+
+    def test_rollups_follow_price_changes(self):
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) "
+            "VALUES (652, 1000, '2016-01-01'), (30, 1500, '2016-02-06');"
+        )
+        DB().execute_command("UPDATE price_detail SET price = price + 1 WHERE route_id = 651;")
+        DB().execute_command("DELETE FROM price_detail WHERE route_id = 30 AND day < '2016-01-01';")
+        self.assert_buckets_match()
+
+    def test_granularity_argument(self):
+        url = "rates/?date_from=2015-12-15&date_to=2016-02-10&origin=china_main&destination=scandinavia"
+        response = self.client.get(url + "&granularity=month")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["day"] for row in response.json], ["2015-12-15", "2016-01-01", "2016-02-01"]
+        )
+
+        self.app.config["USE_PRICE_ROLLUP"] = True
+        self.assertEqual(self.client.get(url + "&granularity=month").json, response.json)
+
+        response = self.client.get(url + "&granularity=year")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json["message"],
+            "Invalid granularity year. It should be one of day, week, month",
+        )
+
+    def test_upgrade_with_filled_daily_rollup(self):
+        DB().execute_command(DROP_PERIOD_ROLLUPS)
+        PriceRollup().build()
+        self.assert_buckets_match()
+
+        PriceRollup().backfill("2016-01-06", "2016-02-03")
+        self.assert_buckets_match()
@@ -0,0 +1,116 @@
+import io
+import unittest
+
+from app import create_app
+from db_engine.db import DB
+from db_engine.ingest import PriceIngest
+from db_engine.rollup import PriceRollup
+from config import TestConfig
+from utils.test import TestDBUtils
+
+PRICES_QUERY = (
+    "SELECT route_id, day::text, price FROM price_detail "
+    "WHERE day >= '2016-01-20' ORDER BY route_id, day, price;"
+)
+
+
+class CachedTestConfig(TestConfig):
+    RATES_CACHE_BACKEND = "memory"
+    RATES_DAY_CACHE_BACKEND = "memory"
+
+
+class TestIngest(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the COPY based price ingestion.
+    """
+
+    url = "rates/?date_from=2016-01-01&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(CachedTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_csv_append(self):
+        lines = io.StringIO(
+            "day,route_id,price\n"
+            "2016-01-20,30,1000\n"
+            "2016-01-21,650,\n"
+            "2016-01-21,999,1200\n"
+            "2016-13-01,30,1300\n"
+            "2016-01-22,30,abc\n"
+        )
+        stats = PriceIngest("append", chunk_rows=1).ingest(lines, "csv")
+
+        self.assertEqual(stats["rows_read"], 5)
+        self.assertEqual(stats["rows_rejected"], 2)
+        self.assertEqual(stats["unknown_route_rows"], 1)
+        self.assertEqual(stats["rows_inserted"], 2)
+        self.assertEqual([str(day) for day in stats["days"]], ["2016-01-20", "2016-01-21"])
+        self.assertEqual(
+            DB().execute_query(PRICES_QUERY), [(30, "2016-01-20", 1000), (650, "2016-01-21", None)]
+        )
+
+    def test_ndjson_upsert(self):
+        PriceRollup().build()
+        self.app.config["USE_PRICE_ROLLUP"] = True
+        lines = io.StringIO(
+            '{"route_id": 30, "day": "2016-01-06", "price": 1000}\n'
+            "\n"
+            "not json\n"
+            '{"route_id": 30, "day": "2016-01-06", "price": 2000}\n'
+        )
+        stats = PriceIngest("upsert").ingest(lines, "ndjson")
+        self.assertEqual(stats["rows_rejected"], 1)
+        self.assertEqual(stats["rows_inserted"], 2)
+
+        prices = DB().execute_query(
+            "SELECT price FROM price_detail WHERE route_id = 30 AND day = '2016-01-06' ORDER BY 1;"
+        )
+        self.assertEqual(prices, [(1000,), (2000,)])
+        # The rollup triggers followed the replaced prices
+        rollup = self.client.get(self.url).json
+        self.app.config["USE_PRICE_ROLLUP"] = False
+        self.assertEqual(rollup, self.client.get(self.url).json)
+
+    def test_cli_invalidates_caches(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url).headers["X-Cache"], "HIT")
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(
+            args=["ingest", "prices", "-", "--format", "csv"],
+            input="route_id,day,price\n30,2016-01-06,1500\n",
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Inserted 1 rows", result.output)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(response.json[5].get("average_price"), "1980")
+
+    def test_workers_drop_ingested_days(self):
+        listener = self.app.extensions["rates_cache_invalidations"]
+        listener.interval = 0
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url).headers["X-Cache"], "HIT")
+
+        # Ingested by another process, the worker learns about it on its next poll
+        PriceIngest().ingest(io.StringIO("route_id,day,price\n30,2016-01-06,1500\n"))
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(response.json[5].get("average_price"), "1980")
+        self.assertEqual(self.client.get(self.url).headers["X-Cache"], "HIT")
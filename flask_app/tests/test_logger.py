@@ -0,0 +1,83 @@
+import json
+import logging
+import sys
+import unittest
+
+from app import create_app
+from config import TestConfig
+from utils.logger import (
+    JsonFormatter,
+    RequestContextFilter,
+    _QueueHandler,
+    configure_logger,
+    log_sampled_var,
+    parse_log_levels,
+    request_id_var,
+)
+
+
+def make_record(level, msg, *args):
+    return logging.LogRecord("tests", level, __file__, 1, msg, args, None)
+
+
+class TestLogger(unittest.TestCase):
+    """
+    Unit tests for the queue based structured logging.
+    """
+
+    def test_handler_attached_once(self):
+        first = configure_logger("tests.logger")
+        second = configure_logger("tests.logger")
+        self.assertIs(first, second)
+        self.assertEqual(len(second.handlers), 1)
+
+    def test_json_record(self):
+        token = request_id_var.set("abc123")
+        try:
+            record = make_record(logging.INFO, "Served %s of %s days", 3, 5)
+            self.assertTrue(RequestContextFilter().filter(record))
+        finally:
+            request_id_var.reset(token)
+
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "Served 3 of 5 days")
+        self.assertEqual(data["request_id"], "abc123")
+        self.assertEqual(data["level"], "INFO")
+
+    def test_queued_record_snapshot(self):
+        days = [1, 2]
+        try:
+            raise ValueError("bad day")
+        except ValueError:
+            record = make_record(logging.ERROR, "Failed days %s", days)
+            record.exc_info = sys.exc_info()
+        queued = _QueueHandler(None).prepare(record)
+        # Mutating the args after the call does not change the queued message
+        days.append(3)
+
+        data = json.loads(JsonFormatter().format(queued))
+        self.assertEqual(data["message"], "Failed days [1, 2]")
+        self.assertIn("ValueError: bad day", data["exception"])
+        self.assertIn("ValueError: bad day", logging.Formatter().format(queued))
+
+    def test_unsampled_request_keeps_warnings(self):
+        token = log_sampled_var.set(False)
+        try:
+            self.assertFalse(RequestContextFilter().filter(make_record(logging.INFO, "info")))
+            self.assertTrue(RequestContextFilter().filter(make_record(logging.WARNING, "warn")))
+        finally:
+            log_sampled_var.reset(token)
+
+    def test_parse_log_levels(self):
+        levels = parse_log_levels("db_engine.postgres_db=warning, utils.cache=DEBUG")
+        self.assertEqual(levels, {"db_engine.postgres_db": "WARNING", "utils.cache": "DEBUG"})
+
+    def test_request_id_header(self):
+        client = create_app(TestConfig).test_client()
+
+        response = client.get("rates/", headers={"X-Request-ID": "req-42"})
+        self.assertEqual(response.headers["X-Request-ID"], "req-42")
+
+        # Missing or malformed ids are replaced by a generated one
+        response = client.get("rates/", headers={"X-Request-ID": "bad id;"})
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from app import create_app
+from config import TestConfig
+from utils.metrics import Metrics, metrics
+from utils.test import TestDBUtils
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Unit tests for the Prometheus style metrics registry.
+    """
+
+    def test_render_histogram(self):
+        registry = Metrics()
+        registry.observe("latency_seconds", 0.003, buckets=(0.001, 0.01), stage="db")
+        registry.observe("latency_seconds", 0.5, buckets=(0.001, 0.01), stage="db")
+        registry.inc("queries_total", 2)
+        text = registry.render([("pool_idle", {"pool": "main"}, 1)])
+
+        self.assertIn('latency_seconds_bucket{stage="db",le="0.001"} 0', text)
+        self.assertIn('latency_seconds_bucket{stage="db",le="0.01"} 1', text)
+        self.assertIn('latency_seconds_bucket{stage="db",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{stage="db"} 2', text)
+        self.assertIn("queries_total 2", text)
+        self.assertIn('pool_idle{pool="main"} 1', text)
+        self.assertIn("# TYPE pool_idle gauge", text)
+
+
+class ProfiledTestConfig(TestConfig):
+    METRICS_PROFILE_SAMPLE_RATE = 1.0
+    METRICS_PROFILE_SLOW_MS = 0
+    METRICS_PROFILE_DIR = tempfile.mkdtemp()
+
+
+class TestRequestMetrics(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the instrumented /rates/ requests.
+    """
+
+    url = "rates/?date_from=2016-01-01&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(ProfiledTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.url, headers={"X-Request-ID": "timed-request"})
+        self.assertEqual(response.status_code, 200)
+        stages = [item.split(";")[0] for item in response.headers["Server-Timing"].split(", ")]
+        for stage in ("validate", "db_connect", "db_query", "format", "serialize", "total"):
+            self.assertIn(stage, stages)
+
+        # Every request is slower than 0 ms, so its profile is kept
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(ProfiledTestConfig.METRICS_PROFILE_DIR, "timed-request.prof")
+            )
+        )
+
+    def test_metrics_endpoint(self):
+        queries = metrics.get("db_queries_total", db="postgres")
+        self.client.get(self.url)
+        self.assertGreater(metrics.get("db_queries_total", db="postgres"), queries)
+
+        response = self.client.get("metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('rates_stage_duration_seconds_count{stage="db_query"}', text)
+        self.assertIn("http_request_duration_seconds_bucket", text)
+        self.assertIn("# TYPE db_pool_checkouts_total counter", text)
+        self.assertIn("# TYPE db_pool_in_use gauge", text)
+        # Every metric family is rendered in one block
+        names = [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")]
+        self.assertEqual(len(names), len(set(names)))
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# TYPE"):
+                family = line.split()[2]
+            elif not line.startswith("#"):
+                self.assertTrue(line.startswith(family), line)
@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from app import create_app
+from db_engine.db import DB
+from config import TestConfig
+from custom.errors import MigrationError
+from db_engine.migrations import Migrations, PlanCheck, find_seq_scans
+from utils.region_index import get_region_index
+from utils.test import TestDBUtils
+
+INDEXES_QUERY = "SELECT indexname FROM pg_indexes WHERE tablename IN ('price_detail', 'route');"
+
+
+class TestMigrations(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the versioned schema migrations and the plan check.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_apply_once(self):
+        applied = Migrations().apply()
+        self.assertGreater(len(applied), 0)
+        indexes = {row[0] for row in DB().execute_query(INDEXES_QUERY)}
+        self.assertIn("price_detail_route_id_day_idx", indexes)
+        self.assertIn("route_orig_region_idx", indexes)
+
+        # Applied migrations are recorded and skipped afterwards
+        self.assertEqual(Migrations().apply(), [])
+        self.assertTrue(all(applied_at for _, applied_at, _ in Migrations().status()))
+
+    def test_changed_migration(self):
+        directory = Path(tempfile.mkdtemp())
+        migration_file = directory / "0001_test_table.sql"
+        migration_file.write_text("CREATE TABLE migration_test (id int);\n")
+        Migrations(directory).apply()
+
+        migration_file.write_text("CREATE TABLE migration_test (id bigint);\n")
+        self.assertTrue(Migrations(directory).status()[0][2])
+        with self.assertRaises(MigrationError):
+            Migrations(directory).apply()
+
+    def test_percent_signs_and_missing_semicolon(self):
+        directory = Path(tempfile.mkdtemp())
+        (directory / "0001_percent.sql").write_text(
+            "CREATE TABLE migration_test AS SELECT format('%s%%', 5) AS share "
+            "WHERE 'a%' LIKE 'a%'"
+        )
+        self.assertEqual(len(Migrations(directory).apply()), 1)
+        self.assertEqual(DB().execute_query("SELECT share FROM migration_test;"), [("5%",)])
+        self.assertTrue(all(applied_at for _, applied_at, _ in Migrations(directory).status()))
+
+    def test_plan_check(self):
+        Migrations().apply()
+        results = PlanCheck(get_region_index()).run()
+        self.assertEqual(
+            [result["name"] for result in results],
+            ["narrow_port", "wide_port", "narrow_region", "wide_top_region"],
+        )
+        self.assertTrue(all(result["execution_ms"] is not None for result in results))
+
+    def test_find_seq_scans(self):
+        plan = {
+            "Node Type": "Hash Join",
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "price_detail"},
+                {"Node Type": "Seq Scan", "Relation Name": "route"},
+            ],
+        }
+        self.assertEqual(find_seq_scans(plan), ["price_detail"])
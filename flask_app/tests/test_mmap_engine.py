@@ -0,0 +1,117 @@
+import itertools
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from app import create_app
+from db_engine.db import DB
+from db_engine.mmap_db import MmapPriceDB, export_from_database, open_snapshot
+from db_engine.numpy_db import np
+from config import TestConfig
+from custom.errors import PriceEngineError
+from queries.sql_queries import AVG_PRICE_QUERY
+from utils.data_processor import RateAPIDataFormat
+from utils.data_validator import RatesParams
+from utils.region_index import get_region_index
+from utils.test import TestDBUtils
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestMmapEngine(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the memory mapped price snapshot.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        self.path = os.path.join(tempfile.mkdtemp(), "prices.snap")
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def assert_same_results(self, engine):
+        region_index = get_region_index()
+        locations = ("CNCWN", "CNYTN", "NOGJM", "china_main", "scandinavia", "northern_europe")
+        for origin, destination in itertools.permutations(locations, 2):
+            params = RateAPIDataFormat().create_avg_price_query_args(
+                RatesParams(origin, destination, date(2015, 12, 30), date(2016, 1, 10)),
+                region_index,
+            )
+            self.assertEqual(
+                engine.execute_query(AVG_PRICE_QUERY, params),
+                DB().execute_query(AVG_PRICE_QUERY, params),
+                (origin, destination),
+            )
+
+    def test_export_and_map(self):
+        metadata = export_from_database(self.path)
+        snapshot = open_snapshot(self.path)
+        self.assertEqual(snapshot.version, metadata["version"])
+        self.assertEqual(len(snapshot), metadata["rows"])
+        self.assertIn(("scandinavia", "northern_europe"), snapshot.regions)
+        # Arrays are read-only views on the mapped file
+        self.assertFalse(snapshot.keys.flags.writeable)
+        self.assertEqual(snapshot.prices.dtype, np.int32)
+        self.assertEqual(set(metadata["arrays"]), {"keys", "prices", "has_price"})
+
+        engine = MmapPriceDB(self.path, refresh_interval=None)
+        engine.load()
+        self.assert_same_results(engine)
+
+    def test_swap_version(self):
+        export_from_database(self.path)
+        engine = MmapPriceDB(self.path, refresh_interval=0)
+        first = engine.load()
+        self.assertIs(engine.refresh(), first)
+
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) VALUES (30, 1000, '2016-01-06');"
+        )
+        export_from_database(self.path)
+        second = engine.refresh()
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(len(second), len(first) + 1)
+        self.assert_same_results(engine)
+        # The replaced version stays readable for requests still using it
+        self.assertEqual(first.keys[-1], first.keys.max())
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(b"not a snapshot file")
+        with self.assertRaises(PriceEngineError):
+            open_snapshot(self.path)
+
+    def test_corrupt_file_at_startup(self):
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(b"not a snapshot file")
+
+        class CorruptSnapshotConfig(TestConfig):
+            PRICE_ENGINE = "mmap"
+            PRICE_ENGINE_PRELOAD = True
+            PRICE_SNAPSHOT_PATH = self.path
+
+        app = create_app(CorruptSnapshotConfig)
+        # Falls back to Postgres instead of failing every request
+        self.assertIsNone(app.extensions["price_engine"])
+        url = "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=china_main&destination=scandinavia"
+        self.assertEqual(app.test_client().get(url).json, self.client.get(url).json)
+
+    def test_rates_api(self):
+        url = "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=china_main&destination=scandinavia"
+        expected = self.client.get(url).json
+        export_from_database(self.path)
+        self.app.extensions["price_engine"] = MmapPriceDB(self.path)
+        self.assertEqual(self.client.get(url).json, expected)
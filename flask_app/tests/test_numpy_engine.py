@@ -0,0 +1,152 @@
+import itertools
+import random
+import unittest
+from datetime import date, timedelta
+
+from app import create_app
+from db_engine.db import DB
+from db_engine.numpy_db import NumpyPriceDB, np
+from config import TestConfig
+from queries.sql_queries import AVG_PRICE_QUERY
+from utils.data_processor import RateAPIDataFormat
+from utils.data_validator import RatesParams
+from utils.region_index import get_region_index
+from utils.test import TestDBUtils
+
+LOCATIONS = (
+    "CNCWN",
+    "CNYTN",
+    "NOGJM",
+    "NOFRO",
+    "NOMJM",
+    "china_main",
+    "china_south_main",
+    "scandinavia",
+    "norway_south_west",
+    "northern_europe",
+)
+
+
+def random_prices(seed, count):
+    """INSERT of random prices, a tenth of them NULL, around the test data days."""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count):
+        day = date(2015, 12, 25) + timedelta(days=rng.randint(0, 40))
+        price = "NULL" if rng.random() < 0.1 else rng.randint(-50, 5000)
+        route_id = "NULL" if rng.random() < 0.02 else rng.choice((30, 650, 651, 652))
+        values.append(f"({route_id}, {price}, '{day}')")
+    return "INSERT INTO price_detail (route_id, price, day) VALUES " + ", ".join(values) + ";"
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestNumpyEngine(unittest.TestCase, TestDBUtils):
+    """
+    Differential tests of the in-memory price engine against AVG_PRICE_QUERY.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        DB().execute_command(random_prices(0, 3000))
+        # Halves rounded away from zero, NULL only prices and too few samples
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) VALUES "
+            "(652, 1, '2016-01-20'), (652, 2, '2016-01-20'), (652, 1, '2016-01-20'), "
+            "(652, 2, '2016-01-20'), (652, -1, '2016-01-21'), (652, -2, '2016-01-21'), "
+            "(652, NULL, '2016-01-21'), (652, NULL, '2016-01-22'), (652, NULL, '2016-01-22'), "
+            "(652, NULL, '2016-01-22'), (652, 7, '2016-01-23'), (652, 8, '2016-01-23');"
+        )
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def assert_same_results(self, engine):
+        region_index = get_region_index()
+        ranges = [
+            (date(2016, 1, 1), date(2016, 1, 31)),
+            (date(2015, 12, 20), date(2016, 1, 3)),
+            (date(2016, 1, 20), date(2016, 1, 23)),
+            (date(2016, 2, 10), date(2016, 2, 12)),
+        ]
+        for origin, destination in itertools.permutations(LOCATIONS, 2):
+            for date_from, date_to in ranges:
+                params = RateAPIDataFormat().create_avg_price_query_args(
+                    RatesParams(origin, destination, date_from, date_to), region_index
+                )
+                expected = DB().execute_query(AVG_PRICE_QUERY, params)
+                actual = engine.execute_query(AVG_PRICE_QUERY, params)
+                self.assertEqual(actual, expected, (origin, destination, date_from, date_to))
+
+    def test_matches_sql(self):
+        engine = NumpyPriceDB(refresh_interval=None)
+        engine.load()
+        self.assert_same_results(engine)
+
+    def test_refresh(self):
+        engine = NumpyPriceDB(refresh_interval=None)
+        size = len(engine.load())
+
+        # Rows with ids above the loaded ones are merged into the snapshot
+        DB().execute_command(
+            "INSERT INTO price_detail (id, route_id, price, day) VALUES "
+            "(100001, 30, 1000, '2016-01-06'), (100002, 651, NULL, '2016-01-07');"
+        )
+        merged = engine.refresh()
+        self.assertEqual(len(merged), size + 2)
+        self.assertIs(engine.refresh(), merged)
+        self.assert_same_results(engine)
+
+        # Anything else reloads the whole snapshot
+        DB().execute_command("DELETE FROM price_detail WHERE price < 100;")
+        DB().execute_command("UPDATE price_detail SET price = price + 1 WHERE route_id = 30;")
+        self.assertLess(len(engine.refresh()), size)
+        self.assert_same_results(engine)
+
+        # Moving prices to another day or route keeps their count and sum
+        DB().execute_command("UPDATE price_detail SET day = day + 1 WHERE route_id = 652;")
+        engine.refresh()
+        self.assert_same_results(engine)
+        DB().execute_command("UPDATE price_detail SET route_id = 30 WHERE route_id = 651;")
+        engine.refresh()
+        self.assert_same_results(engine)
+
+        # Compensating updates keep count and sums of every column
+        (first, first_price), *_, (last, last_price) = DB().execute_query(
+            "SELECT id, price FROM price_detail WHERE route_id = 30 AND price IS NOT NULL "
+            "ORDER BY day, id;"
+        )
+        DB().execute_command(
+            "UPDATE price_detail SET price = CASE WHEN id = %(first)s THEN %(last_price)s "
+            "ELSE %(first_price)s END WHERE id IN (%(first)s, %(last)s);",
+            {"first": first, "last": last, "first_price": first_price, "last_price": last_price},
+        )
+        engine.refresh()
+        self.assert_same_results(engine)
+        DB().execute_command(
+            "UPDATE price_detail SET price = price + CASE WHEN id = %(first)s THEN 500 ELSE -500 "
+            "END WHERE id IN (%(first)s, %(last)s);",
+            {"first": first, "last": last},
+        )
+        engine.refresh()
+        self.assert_same_results(engine)
+        DB().execute_command("UPDATE price_detail SET price = 0 WHERE price IS NULL;")
+        engine.refresh()
+        self.assert_same_results(engine)
+
+    def test_rates_api(self):
+        url = "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=china_main&destination=scandinavia"
+        expected = self.client.get(url).json
+        self.app.extensions["price_engine"] = NumpyPriceDB()
+        self.assertEqual(self.client.get(url).json, expected)
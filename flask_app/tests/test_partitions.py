@@ -0,0 +1,117 @@
+import json
+import unittest
+from datetime import date
+
+from app import create_app
+from db_engine.db import DB
+from db_engine.partitions import PricePartitions, partition_name, periods
+from db_engine.rollup import PriceRollup
+from config import TestConfig
+from custom.errors import PartitionError
+from queries.sql_queries import AVG_PRICE_QUERY
+from utils.test import TestDBUtils
+
+TODAY = date(2016, 1, 15)
+
+
+def scanned_tables(plan):
+    """Relations scanned by a JSON plan."""
+    tables = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", ()):
+        tables |= scanned_tables(child)
+    return tables
+
+
+class TestPartitions(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the range partitioning of price_detail.
+    """
+
+    urls = [
+        "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=china_main&destination=scandinavia",
+        "rates/?date_from=2015-12-30&date_to=2016-01-06&origin=CNYTN&destination=NOFRO",
+    ]
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_periods(self):
+        starts = list(periods(date(2015, 11, 20), date(2016, 2, 1), "month"))
+        self.assertEqual(
+            starts, [date(2015, 11, 1), date(2015, 12, 1), date(2016, 1, 1), date(2016, 2, 1)]
+        )
+        self.assertEqual(partition_name(starts[1], "month"), "price_detail_p201512")
+        self.assertEqual(partition_name(starts[1], "year"), "price_detail_p2015")
+
+    def test_convert_keeps_results(self):
+        before = [self.client.get(url).json for url in self.urls]
+
+        price_partitions = PricePartitions("month", premake=2)
+        # January 2016 up to March 2016
+        self.assertEqual(price_partitions.convert(TODAY), 3)
+        self.assertTrue(price_partitions.is_partitioned())
+        with self.assertRaises(PartitionError):
+            price_partitions.convert(TODAY)
+
+        self.assertEqual([self.client.get(url).json for url in self.urls], before)
+
+    def test_partition_pruning(self):
+        PricePartitions("month", premake=2).convert(TODAY)
+        params = {
+            "date_from": "2016-01-01",
+            "date_to": "2016-01-05",
+            "orig_codes": ["CNYTN"],
+            "orig_regions": [],
+            "dest_codes": ["NOFRO"],
+            "dest_regions": [],
+        }
+        plan = DB().execute_query("EXPLAIN (FORMAT JSON) " + AVG_PRICE_QUERY, params)[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        tables = scanned_tables(plan[0]["Plan"])
+        self.assertIn("price_detail_p201601", tables)
+        self.assertNotIn("price_detail_p201602", tables)
+        self.assertNotIn("price_detail_default", tables)
+
+    def test_rollup_after_convert(self):
+        PriceRollup().build()
+        PricePartitions("year", premake=1).convert(TODAY)
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) VALUES (30, 1500, '2016-01-06');"
+        )
+        url = self.urls[0].replace("2016-01-01", "2016-01-06").replace("2016-01-10", "2016-01-06")
+        self.app.config["USE_PRICE_ROLLUP"] = True
+        rollup = self.client.get(url).json
+        self.app.config["USE_PRICE_ROLLUP"] = False
+        self.assertEqual(rollup, self.client.get(url).json)
+
+    def test_ensure_moves_default_rows(self):
+        price_partitions = PricePartitions("month", premake=0)
+        price_partitions.convert(TODAY)
+        # No partition covers 2018, the row lands in the default partition
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) VALUES (30, 1500, '2018-03-02');"
+        )
+
+        self.assertEqual(price_partitions.ensure(TODAY), ["price_detail_p201803"])
+        self.assertEqual(price_partitions.ensure(TODAY), [])
+        counts = DB().execute_query(
+            "SELECT tableoid::regclass::text, count(*) FROM price_detail "
+            "WHERE day = '2018-03-02' GROUP BY 1;"
+        )
+        self.assertEqual(counts, [("price_detail_p201803", 1)])
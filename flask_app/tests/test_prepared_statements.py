@@ -0,0 +1,80 @@
+import unittest
+
+from app import create_app
+from config import TestConfig
+from db_engine.db import DB
+from db_engine.postgres_db import close_pools
+from db_engine.prepared import PreparedStatement
+from queries.sql_queries import AVG_PRICE_QUERY
+from utils.metrics import metrics
+from utils.test import TestDBUtils
+
+
+class GenericPlanTestConfig(TestConfig):
+    DB_PLAN_CACHE_MODE = "force_generic_plan"
+
+
+class TestPreparedStatements(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the server side prepared statements of the hot queries.
+    """
+
+    url = "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=CNCWN&destination=scandinavia"
+    config = TestConfig
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        metrics.clear()
+        self.app = create_app(self.config)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_parameters_bound_once(self):
+        statement = PreparedStatement("avg_price", AVG_PRICE_QUERY)
+        self.assertEqual(
+            statement.params,
+            ["date_from", "date_to", "orig_codes", "orig_regions", "dest_codes", "dest_regions"],
+        )
+        self.assertIn("BETWEEN $1 AND $2", statement.prepare_sql)
+        self.assertEqual(statement.execute_sql, "EXECUTE avg_price(%s, %s, %s, %s, %s, %s)")
+
+    def test_prepared_once_per_connection(self):
+        first = self.client.get(self.url).json
+        self.assertEqual(self.client.get(self.url).json, first)
+        self.assertEqual(metrics.get("db_statements_prepared_total", statement="avg_price"), 1)
+        self.assertGreater(metrics.get("db_prepare_seconds_saved_total", statement="avg_price"), 0)
+        self.assertEqual(
+            DB().execute_query("SELECT name FROM pg_prepared_statements;"), [("avg_price",)]
+        )
+
+        # New connections prepare the statement again
+        close_pools()
+        self.assertEqual(self.client.get(self.url).json, first)
+        self.assertEqual(metrics.get("db_statements_prepared_total", statement="avg_price"), 2)
+
+        self.app.config["DB_PREPARED_STATEMENTS"] = False
+        self.assertEqual(self.client.get(self.url).json, first)
+        self.assertEqual(metrics.get("db_statements_prepared_total", statement="avg_price"), 2)
+
+
+class TestGenericPlans(TestPreparedStatements):
+    """
+    Same tests with generic plans, which are planned once per connection.
+    """
+
+    config = GenericPlanTestConfig
+
+    def test_plan_cache_mode(self):
+        self.assertEqual(DB().execute_query("SHOW plan_cache_mode;"), [("force_generic_plan",)])
@@ -0,0 +1,77 @@
+import unittest
+
+from app import create_app
+from db_engine.db import DB
+from db_engine.rollup import PriceRollup
+from config import TestConfig
+from utils.test import TestDBUtils
+
+
+class TestPriceRollup(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the daily price rollup.
+    """
+
+    urls = [
+        "rates/?date_from=2016-01-01&date_to=2016-01-01&origin=CNCWN&destination=NOGJM",
+        "rates/?date_from=2016-01-01&date_to=2016-01-01&origin=CNYTN&destination=NOFRO",
+        "rates/?date_from=2016-01-01&date_to=2016-01-10&origin=china_main&destination=scandinavia",
+        "rates/?date_from=2015-12-30&date_to=2016-01-06&origin=china_main&destination=northern_europe",
+    ]
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+        PriceRollup().build()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def get_both(self, url):
+        """
+        Returns the responses of the raw and the rollup query.
+        """
+        self.app.config["USE_PRICE_ROLLUP"] = False
+        raw = self.client.get(url)
+        self.app.config["USE_PRICE_ROLLUP"] = True
+        rollup = self.client.get(url)
+        return raw, rollup
+
+    def test_rollup_matches_raw_query(self):
+        """
+        Test if the rollup gives exactly the same results as price_detail.
+        """
+        for url in self.urls:
+            raw, rollup = self.get_both(url)
+            self.assertEqual(raw.status_code, rollup.status_code)
+            self.assertEqual(raw.json, rollup.json, url)
+
+    def test_rollup_follows_price_changes(self):
+        """
+        Test if inserts, updates and deletes are applied incrementally.
+        """
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) "
+            "VALUES (652, 1000, '2016-01-01'), (30, 1500, '2016-01-06');"
+        )
+        DB().execute_command("UPDATE price_detail SET price = price + 1 WHERE route_id = 651;")
+        DB().execute_command("DELETE FROM price_detail WHERE route_id = 30 AND price = 1768;")
+
+        for url in self.urls:
+            raw, rollup = self.get_both(url)
+            self.assertEqual(raw.json, rollup.json, url)
+
+        # 2016-01-06 has 3 prices now
+        url = "rates/?date_from=2016-01-06&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        self.assertEqual(self.get_both(url)[1].json[0].get("average_price"), "1980")
@@ -1,9 +1,11 @@
-from pathlib import Path
+import json
+import struct
 import unittest
 
 from app import create_app
 from db_engine.db import DB
 from config import TestConfig
+from utils.data_processor import pyarrow
 from utils.test import TestDBUtils
 
 
@@ -12,22 +14,6 @@ class TestRateAPI(unittest.TestCase, TestDBUtils):
     Unit tests for API responses with database operations.
     """
 
-    def load_rateapi_data(self):
-        """
-        Loads data into the test database from an SQL file.
-        """
-        sql_file_path = Path("tests/sql_data/test_sql.sql")
-
-        # Open and read the SQL file
-        with sql_file_path.open(mode="r") as sql_file:
-            # Execute the SQL commands in the file
-            conn = DB().get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql_file.read())
-            conn.commit()
-        cursor.close()
-        conn.close()
-
     def setup_method(self, method):
         """
         Setup method to initialize test environment.
@@ -85,6 +71,22 @@ class TestRateAPI(unittest.TestCase, TestDBUtils):
         message = "The Value of Origin/Dest have possible SQL injection"
         self.assertEqual(response.json["message"], message)
 
+    def test_location_grammar(self):
+        """
+        Test if origin/destination outside of the port code / region slug grammar are rejected.
+        """
+        url = "rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNSGH&destination=x%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09%09x"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        message = "The Value of Origin/Dest have possible SQL injection"
+        self.assertEqual(response.json["message"], message)
+
+        url = "rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNSGH&destination=North_Europe"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        message = "The Value of Origin/Dest should be a port code or region slug"
+        self.assertEqual(response.json["message"], message)
+
     def test_non_ordered_date(self):
         """
         Test if SQL injection is prevented.
@@ -97,14 +99,76 @@ class TestRateAPI(unittest.TestCase, TestDBUtils):
 
     def test_non_available_regions_data(self):
         """
-        Test if SQL injection is prevented.
+        Test response when no prices exist for the given period and regions.
         """
-        url = "rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNSGH&destination=CNSGH"
+        url = "rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNYTX&destination=NOMJM"
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         message = "Average price is not available for given period and regions"
         self.assertEqual(response.json["message"], message)
 
+    def test_unknown_regions(self):
+        """
+        Test if unknown origin/destination are rejected.
+        """
+        url = "rates/?date_from=2016-01-03&date_to=2016-01-03&origin=CNSGH&destination=CNSGH"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        message = "Unknown Origin/Dest CNSGH. It should be a port code or region slug"
+        self.assertEqual(response.json["message"], message)
+
+    def test_region_index_expansion(self):
+        """
+        Test if region slugs are expanded to all of their descendants.
+        """
+        region_index = self.app.extensions["region_index"].ensure_fresh()
+        codes, regions = region_index.expand("northern_europe")
+        self.assertEqual(codes, [])
+        self.assertEqual(
+            regions,
+            [
+                "kattegat",
+                "northern_europe",
+                "norway_north_west",
+                "norway_south_east",
+                "norway_south_west",
+                "scandinavia",
+            ],
+        )
+        self.assertEqual(region_index.expand("NOGJM"), (["NOGJM"], []))
+
+    def test_region_index_reload_failure(self):
+        """
+        Test if a failed first load of the region index is a 503 and a failed reload keeps the old index.
+        """
+        url = "rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        region_index = self.app.extensions["region_index"]
+        db_host, db_port = self.app.config["DB_HOST"], self.app.config["DB_PORT"]
+        # Nothing listens on port 1, connecting fails right away
+        self.app.config.update(DB_HOST="127.0.0.1", DB_PORT="1")
+        try:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Retry-After", response.headers)
+            response = self.client.post("rates/batch", json={"lanes": []})
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(region_index.is_loaded)
+        finally:
+            self.app.config.update(DB_HOST=db_host, DB_PORT=db_port)
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        region_index._loaded_at -= region_index.ttl + 1
+        self.app.config.update(DB_HOST="127.0.0.1", DB_PORT="1")
+        try:
+            region_index.ensure_fresh()
+        finally:
+            self.app.config.update(DB_HOST=db_host, DB_PORT=db_port)
+        # The stale index is kept and the reload is retried after the backoff
+        self.assertTrue(region_index.is_region("scandinavia"))
+        self.assertFalse(region_index.is_stale())
+        region_index._loaded_at -= region_index.RELOAD_RETRY + 1
+        self.assertTrue(region_index.is_stale())
+
     def test_table_counts(self):
         """
         Test the counts of tables in the database.
@@ -176,3 +240,154 @@ class TestRateAPI(unittest.TestCase, TestDBUtils):
 
         # 2016-01-06 have 2 prices
         self.assertIsNone(sorted_json[4].get("average_price"))
+
+    def test_batch_matches_single_requests(self):
+        """
+        Test if the batch endpoint returns the same prices as single requests.
+        """
+        lanes = [
+            {
+                "date_from": "2016-01-01",
+                "date_to": "2016-01-01",
+                "origin": "CNCWN",
+                "destination": "NOGJM",
+            },
+            {
+                "date_from": "2016-01-02",
+                "date_to": "2016-01-06",
+                "origin": "china_main",
+                "destination": "scandinavia",
+            },
+            {
+                "date_from": "2016-01-01",
+                "date_to": "2016-01-01",
+                "origin": "CNYTN",
+                "destination": "NOFRO",
+            },
+        ]
+        response = self.client.post("rates/batch", json={"lanes": lanes})
+        self.assertEqual(response.status_code, 200)
+
+        results = response.json["results"]
+        self.assertEqual(len(results), 3)
+        for lane, result in zip(lanes, results):
+            single = self.client.get("rates/", query_string=lane)
+            self.assertEqual(result["status"], 200)
+            self.assertEqual(result["data"], single.json)
+
+    def test_batch_reports_invalid_lanes(self):
+        """
+        Test if invalid lanes are reported without failing the batch.
+        """
+        lanes = [
+            {
+                "date_from": "2016-01-01",
+                "date_to": "2016-01-01",
+                "origin": "CNCWN",
+                "destination": "NOGJM",
+            },
+            {
+                "date_from": "2016-01-03",
+                "date_to": "2016-01-01",
+                "origin": "CNCWN",
+                "destination": "NOGJM",
+            },
+            {
+                "date_from": "2016-01-01",
+                "date_to": "2016-01-01",
+                "origin": "CNSGH",
+                "destination": "NOGJM",
+            },
+            "CNCWN",
+        ]
+        response = self.client.post("rates/batch", json={"lanes": lanes})
+        self.assertEqual(response.status_code, 200)
+
+        statuses = [result["status"] for result in response.json["results"]]
+        self.assertEqual(statuses, [200, 400, 400, 400])
+        self.assertEqual(response.json["results"][0]["data"][0].get("average_price"), "2144")
+
+    def test_batch_without_lanes(self):
+        """
+        Test if a batch without lanes is rejected.
+        """
+        response = self.client.post("rates/batch", json={"lanes": []})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json["message"], "Request should contain a non empty list of lanes."
+        )
+
+    def test_ndjson_stream(self):
+        """
+        Test if NDJSON is streamed one day per line.
+        """
+        url = "rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        response = self.client.get(url, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines, self.client.get(url).json)
+
+    def test_json_stream_for_wide_range(self):
+        """
+        Test if wide ranges are streamed as the same JSON array.
+        """
+        url = "rates/?date_from=2015-12-01&date_to=2016-01-31&origin=china_main&destination=scandinavia"
+        expected = self.client.get(url)
+        self.assertEqual(len(expected.json), 62)
+
+        self.app.config["RATES_STREAM_MIN_DAYS"] = 30
+        self.app.config["RATES_STREAM_BATCH_SIZE"] = 7
+        response = self.client.get(url)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.json, expected.json)
+
+    def test_failed_stream(self):
+        """
+        Test if a streamed query failing to start gets an error response instead of a cut body.
+        """
+        url = "rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        # Loads the region index first
+        self.assertEqual(self.client.get(url).status_code, 200)
+        db_host, db_port = self.app.config["DB_HOST"], self.app.config["DB_PORT"]
+        # Nothing listens on port 1, connecting fails right away
+        self.app.config.update(DB_HOST="127.0.0.1", DB_PORT="1")
+        try:
+            response = self.client.get(url, headers={"Accept": "application/x-ndjson"})
+        finally:
+            self.app.config.update(DB_HOST=db_host, DB_PORT=db_port)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {"message": "Failed executing Postgres Query"})
+
+    def test_columnar_formats(self):
+        """
+        Test if the columnar JSON and the packed int32 formats carry the same prices.
+        """
+        url = "rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        expected = [2171, None, None, 2066, None]
+
+        response = self.client.get(url, headers={"Accept": "application/vnd.rates.columnar+json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"start_day": "2016-01-02", "average_price": expected})
+        self.assertIn("Accept", response.headers["Vary"])
+
+        response = self.client.get(url, headers={"Accept": "application/vnd.rates.int32"})
+        self.assertEqual(response.headers["X-Start-Day"], "2016-01-02")
+        count = int(response.headers["X-Day-Count"])
+        body = response.get_data()
+        prices = struct.unpack(f"<{count}i", body[: 4 * count])
+        bitmap = body[4 * count :]
+        decoded = [prices[i] if bitmap[i >> 3] & (1 << (i & 7)) else None for i in range(count)]
+        self.assertEqual(decoded, expected)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow_format(self):
+        """
+        Test if the Arrow IPC stream carries the same prices.
+        """
+        url = "rates/?date_from=2016-01-02&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+        response = self.client.get(url, headers={"Accept": "application/vnd.apache.arrow.stream"})
+        table = pyarrow.ipc.open_stream(response.get_data()).read_all()
+        self.assertEqual(table.column("average_price").to_pylist(), [2171, None, None, 2066, None])
+        self.assertEqual(str(table.column("day")[0]), "2016-01-02")
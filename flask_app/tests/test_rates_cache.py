@@ -0,0 +1,168 @@
+import time
+import unittest
+
+from app import create_app
+from db_engine.db import DB
+from config import TestConfig
+from utils.cache import LRUCache
+from utils.data_fetcher import missing_day_ranges
+from utils.test import TestDBUtils
+
+
+class CachedTestConfig(TestConfig):
+    RATES_CACHE_BACKEND = "memory"
+
+
+class TestLRUCache(unittest.TestCase):
+    """
+    Unit tests for the in-process LRU cache.
+    """
+
+    def test_ttl_expiry(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("key", [1, 2, 3])
+        self.assertEqual(cache.get("key"), [1, 2, 3])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_max_bytes_eviction(self):
+        cache = LRUCache(max_bytes=300)
+        for key in range(5):
+            cache.set(key, "x" * 100)
+            # Keep the first entry recently used
+            cache.get(0)
+        self.assertLessEqual(cache.stats()["bytes"], 300)
+        self.assertIsNotNone(cache.get(0))
+        self.assertIsNone(cache.get(1))
+
+    def test_invalidate_day(self):
+        cache = LRUCache()
+        cache.set("january", 1, days=("2016-01-01", "2016-01-31"))
+        cache.set("february", 2, days=("2016-02-01", "2016-02-29"))
+        self.assertEqual(cache.invalidate_day("2016-01-15"), 1)
+        self.assertIsNone(cache.get("january"))
+        self.assertEqual(cache.get("february"), 2)
+
+
+class TestRatesCache(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for the cached /rates/ responses.
+    """
+
+    url = "rates/?date_from=2016-01-01&date_to=2016-01-06&origin=china_main&destination=scandinavia"
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(CachedTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_cache_hit(self):
+        """
+        Test if identical requests are served from the cache.
+        """
+        first = self.client.get(self.url)
+        second = self.client.get(self.url.replace("origin=china_main", "origin= china_main"))
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(first.json, second.json)
+        self.assertIn("max-age", second.headers["Cache-Control"])
+
+    def test_etag_not_modified(self):
+        """
+        Test if a matching If-None-Match gives a 304.
+        """
+        etag = self.client.get(self.url).headers["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidate_loaded_day(self):
+        """
+        Test if invalidating a day drops the cached results covering it.
+        """
+        self.client.get(self.url)
+        DB().execute_command(
+            "INSERT INTO price_detail (route_id, price, day) VALUES (30, 1500, '2016-01-06');"
+        )
+        self.app.extensions["rates_cache"].invalidate_day("2016-01-06")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(response.json[5].get("average_price"), "1980")
+
+
+class DayCachedTestConfig(TestConfig):
+    RATES_DAY_CACHE_BACKEND = "memory"
+    RATES_DAY_CACHE_MAX_QUERIES = 2
+
+
+class TestDayCache(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for serving overlapping date ranges from the day cache.
+    """
+
+    url = "rates/?date_from={}&date_to={}&origin=china_main&destination=scandinavia"
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        self.app = create_app(DayCachedTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_missing_day_ranges(self):
+        """
+        Test if missing days are grouped into a bounded number of ranges.
+        """
+        days = ["d1", "d2", "d3", "d4", "d5", "d6", "d7"]
+        is_missing = [True, True, False, True, False, False, True]
+        self.assertEqual(
+            missing_day_ranges(days, is_missing, 3), [("d1", "d2"), ("d4", "d4"), ("d7", "d7")]
+        )
+        self.assertEqual(missing_day_ranges(days, is_missing, 2), [("d1", "d4"), ("d7", "d7")])
+        self.assertEqual(missing_day_ranges(days, [False] * 7, 2), [])
+
+    def test_overlapping_ranges(self):
+        """
+        Test if a sliding window only queries the new days and keeps the results.
+        """
+        day_cache = self.app.extensions["rates_day_cache"]
+        first = self.client.get(self.url.format("2016-01-01", "2016-01-04"))
+        self.assertEqual(day_cache.stats()["misses"], 4)
+
+        second = self.client.get(self.url.format("2016-01-03", "2016-01-06"))
+        self.assertEqual(day_cache.stats()["hits"], 2)
+        self.assertEqual(first.json[2:], second.json[:2])
+
+        # Stitched result equals the uncached one, including the < 3 samples nulls
+        cached = self.client.get(self.url.format("2016-01-01", "2016-01-06"))
+        self.app.extensions["rates_day_cache"] = None
+        uncached = self.client.get(self.url.format("2016-01-01", "2016-01-06"))
+        self.assertEqual(uncached.json, cached.json)
+        self.assertEqual(cached.json[0]["day"], "2016-01-01")
+        self.assertIsNone(cached.json[5].get("average_price"))
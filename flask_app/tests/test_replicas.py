@@ -0,0 +1,122 @@
+import time
+import unittest
+
+import psycopg2
+
+from app import create_app
+from config import TestConfig
+from custom.errors import DBError, PoolTimeoutError
+from db_engine.db import ReadDB, is_host_failure
+from db_engine.replicas import ReplicaSet, parse_hosts
+from utils.metrics import metrics
+from utils.test import TestDBUtils
+
+# Nothing listens on port 1, connecting fails right away
+DOWN_HOST = "127.0.0.1:1"
+
+
+class ReplicaTestConfig(TestConfig):
+    DB_READ_HOSTS = f"{DOWN_HOST},{TestConfig.DB_HOST}"
+    DB_READ_MAX_ERRORS = 1
+    DB_READ_HEALTH_CHECK_INTERVAL = 0
+
+
+class TestReplicaSet(unittest.TestCase):
+    """
+    Unit tests for the read replica selection.
+    """
+
+    def setup_method(self, method):
+        metrics.clear()
+
+    def test_parse_hosts(self):
+        self.assertEqual(
+            parse_hosts("replica-1:5433, replica-2,/var/run/postgresql"),
+            [("replica-1", "5433"), ("replica-2", None), ("/var/run/postgresql", None)],
+        )
+
+    def test_is_host_failure(self):
+        self.assertTrue(is_host_failure(psycopg2.OperationalError("connection refused")))
+        # A saturated pool of this worker says nothing about the replica
+        self.assertFalse(is_host_failure(PoolTimeoutError("Timed out")))
+        self.assertFalse(is_host_failure(psycopg2.errors.QueryCanceled()))
+
+    def test_balance(self):
+        replicas = ReplicaSet([("a", None), ("b", None), ("c", None)], health_check_interval=0)
+        names = [replicas.acquire().name for _ in range(6)]
+        self.assertEqual(names, ["a", "b", "c", "a", "b", "c"])
+
+        replicas = ReplicaSet(
+            [("a", None), ("b", None)], balance="least_outstanding", health_check_interval=0
+        )
+        busy = replicas.acquire()
+        # The other endpoint has no query in flight
+        self.assertIsNot(replicas.acquire(), busy)
+        self.assertEqual(replicas.stats()[busy.name]["outstanding"], 1)
+
+    def test_ejection_and_probation(self):
+        replicas = ReplicaSet(
+            [("a", None), ("b", None)], max_errors=2, eject_seconds=0.05, health_check_interval=0
+        )
+        a = replicas.endpoints[0]
+        for _ in range(2):
+            replicas.release(replicas.acquire(exclude=replicas.endpoints[1]), 0.01, failed=True)
+        self.assertEqual(replicas.stats()["a"]["available"], 0)
+        self.assertEqual(metrics.get("db_replica_ejections_total", host="a"), 1)
+        self.assertEqual({replicas.acquire().name for _ in range(4)}, {"b"})
+
+        # Back on probation after the ejection, a success re-admits it for good
+        time.sleep(0.06)
+        self.assertIs(replicas.acquire(exclude=replicas.endpoints[1]), a)
+        replicas.release(a, 0.01)
+        self.assertIsNone(a.ejected_until)
+
+
+class TestReadDB(unittest.TestCase, TestDBUtils):
+    """
+    Unit tests for read queries over a failing and a healthy replica.
+    """
+
+    def setup_method(self, method):
+        """
+        Setup method to initialize test environment.
+        """
+        metrics.clear()
+        self.app = create_app(ReplicaTestConfig)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.create_test_database()
+        self.load_rateapi_data()
+
+    def teardown_method(self, method):
+        """
+        Teardown method to clean up test environment.
+        """
+        self.drop_test_database()
+        self.context.pop()
+
+    def test_failed_replica_is_ejected(self):
+        url = "rates/?date_from=2016-01-01&date_to=2016-01-06&origin=CNCWN&destination=NOGJM"
+        for _ in range(4):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        # The first read failed over to the healthy replica, later ones skip the ejected one
+        self.assertEqual(metrics.get("db_read_errors_total", host=DOWN_HOST), 1)
+        replicas = self.app.extensions["replica_set"]
+        self.assertEqual(replicas.stats()[DOWN_HOST]["available"], 0)
+        self.assertEqual(replicas.stats()[TestConfig.DB_HOST]["available"], 1)
+
+    def test_health_check(self):
+        replicas = self.app.extensions["replica_set"]
+        replicas.max_lag = 10
+        replicas.check_health()
+        stats = replicas.stats()
+        self.assertEqual(stats[DOWN_HOST]["available"], 0)
+        self.assertEqual(
+            stats[TestConfig.DB_HOST], {"available": 1, "outstanding": 0, "lag_seconds": 0.0}
+        )
+
+        # Only the primary accepts writes
+        with self.assertRaises(DBError):
+            ReadDB().execute_command("SELECT 1;")
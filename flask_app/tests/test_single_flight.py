@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import unittest
+
+from utils.metrics import metrics
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Unit tests for the coalescing of concurrent identical queries.
+    """
+
+    def setup_method(self, method):
+        metrics.clear()
+
+    def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight("tests")
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def query(value):
+            calls.append(value)
+            started.set()
+            release.wait(5)
+            return [value]
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(single_flight.do("key", query, 1)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(single_flight.do("key", query, 2)))
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        # Followers are waiting once they are counted
+        while metrics.get("single_flight_coalesced_total", group="tests") < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [[1]] * 4)
+        self.assertEqual(metrics.get("single_flight_calls_total", group="tests"), 1)
+
+        # Finished calls are not cached
+        self.assertEqual(single_flight.do("key", query, 3), [3])
+
+    def test_error_is_shared(self):
+        single_flight = SingleFlight("tests")
+        release = threading.Event()
+
+        def query():
+            release.wait(5)
+            raise ValueError("failed")
+
+        errors = []
+
+        def call():
+            try:
+                single_flight.do("key", query)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while metrics.get("single_flight_coalesced_total", group="tests") < 1:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(errors), 2)
+
+    def test_async_calls_share_result(self):
+        single_flight = AsyncSingleFlight("tests")
+        calls = []
+
+        async def query(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return [value]
+
+        async def run():
+            same = [single_flight.do("key", query, value) for value in range(3)]
+            return await asyncio.gather(*same, single_flight.do("other", query, 9))
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [[0], [0], [0], [9]])
+        self.assertEqual(calls, [0, 9])
+        self.assertEqual(metrics.get("single_flight_coalesced_total", group="tests"), 2)
+
+    def test_async_leader_cancelled(self):
+        single_flight = AsyncSingleFlight("tests")
+        calls = []
+
+        async def query(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return [value]
+
+        async def run():
+            leader = asyncio.ensure_future(single_flight.do("key", query, 1))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do("key", query, 2))
+            await asyncio.sleep(0)
+            leader.cancel()
+            # The follower runs the query itself instead of failing
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), [2])
+        self.assertEqual(calls, [1, 2])
@@ -0,0 +1,314 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from utils.logger import configure_logger
+from utils.metrics import metrics
+
+logger = configure_logger(__name__)
+
+# Cost tiers of a /rates/ request, from the cheapest to the most expensive
+TIERS = ("port", "region", "top_region")
+
+# Budget of the queries of the current request, None outside of budgeted requests
+query_budget_var = ContextVar("query_budget", default=None)
+
+
+class QueryBudget:
+    """Limits of the queries sent on behalf of a request, see ``query_budget``."""
+
+    __slots__ = ("timeout", "is_disconnected")
+
+    def __init__(self, timeout=None, is_disconnected=None):
+        self.timeout = timeout
+        self.is_disconnected = is_disconnected
+
+
+@contextmanager
+def query_budget(timeout=None, is_disconnected=None):
+    """
+    Applies a budget to the queries sent within the block.
+
+    Args:
+        timeout (float): Seconds a query may run before Postgres cancels it, None for no limit.
+        is_disconnected (callable): Returns True once the client went away, its queries
+            are cancelled then.
+    """
+    token = query_budget_var.set(QueryBudget(timeout, is_disconnected))
+    try:
+        yield
+    finally:
+        query_budget_var.reset(token)
+
+
+def parse_tier_limits(value):
+    """
+    Parse ``tier=number,tier=number`` into a dict of tier to float.
+
+    Raises:
+        ValueError: If a tier is not one of TIERS.
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            tier, limit = item.split("=", 1)
+            tier = tier.strip()
+            if tier not in TIERS:
+                raise ValueError(f"Unknown rates tier {tier}, expected one of {', '.join(TIERS)}")
+            limits[tier] = float(limit)
+    return limits
+
+
+def socket_disconnect_check(environ):
+    """
+    Returns a callable telling if the client of a WSGI request closed its connection.
+
+    Works with the sockets gunicorn and the werkzeug server put in the environ,
+    None for any other server.
+    """
+    sock = environ.get("gunicorn.socket") or environ.get("werkzeug.socket")
+    if sock is None:
+        return None
+
+    def is_disconnected():
+        try:
+            # A closed connection reads as EOF, a waiting client sends nothing
+            return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    return is_disconnected
+
+
+class _WatchedQuery:
+    __slots__ = ("cancel", "is_disconnected", "cancelled")
+
+    def __init__(self, cancel, is_disconnected):
+        self.cancel = cancel
+        self.is_disconnected = is_disconnected
+        self.cancelled = False
+
+
+class QueryWatchdog:
+    """Cancels the running queries of clients that disconnected.
+
+    A blocking query can not notice that its client went away, so one daemon
+    thread per process polls the clients of the watched queries every
+    ``interval`` seconds and cancels the queries of the disconnected ones.
+
+    Args:
+        interval (float): Seconds between two polls.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._condition = threading.Condition()
+        self._queries = set()
+        self._thread = None
+
+    @contextmanager
+    def watch(self, cancel, is_disconnected):
+        """
+        Watches the block, ``cancel`` is called if ``is_disconnected`` returns True meanwhile.
+
+        Yields:
+            The watched query, its ``cancelled`` attribute tells if it was cancelled.
+        """
+        query = _WatchedQuery(cancel, is_disconnected)
+        with self._condition:
+            # Threads do not survive fork, a forked worker starts its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="query-watchdog", daemon=True
+                )
+                self._thread.start()
+            self._queries.add(query)
+            self._condition.notify()
+        try:
+            yield query
+        finally:
+            with self._condition:
+                self._queries.discard(query)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queries:
+                    self._condition.wait()
+            time.sleep(self.interval)
+            with self._condition:
+                queries = list(self._queries)
+            for query in queries:
+                if not query.is_disconnected():
+                    continue
+                with self._condition:
+                    # Only cancel while the query still owns its connection
+                    if query in self._queries and not query.cancelled:
+                        query.cancelled = True
+                        try:
+                            query.cancel()
+                        except Exception as e:
+                            logger.warning("Failed to cancel query Error: %s", e)
+                            continue
+                        metrics.inc("db_queries_cancelled_total", reason="disconnect")
+                        logger.info("Cancelled the query of a disconnected client")
+
+
+watchdog = QueryWatchdog()
+
+
+class RateTiers:
+    """Limits of the /rates/ requests per cost tier.
+
+    A request costs as much as its widest side: port codes are ``port``, regions
+    ``region`` and regions without parent (whole continents) ``top_region``.
+    Tiers missing from a limit dict are not limited.
+
+    Args:
+        max_days (dict): Widest date range per tier.
+        timeouts (dict): Seconds a query of the tier may run.
+        max_concurrent (dict): Requests of the tier in flight at once per worker.
+    """
+
+    def __init__(self, max_days=None, timeouts=None, max_concurrent=None):
+        self.max_days = max_days or {}
+        self.timeouts = timeouts or {}
+        self.max_concurrent = max_concurrent or {}
+        self._lock = threading.Lock()
+        self._in_flight = dict.fromkeys(TIERS, 0)
+
+    @staticmethod
+    def location_tier(value, region_index):
+        if region_index.is_top_level(value):
+            return "top_region"
+        if region_index.is_region(value):
+            return "region"
+        return "port"
+
+    def classify(self, validated_data, region_index):
+        """Tier of the request, the most expensive one of origin and destination."""
+        return max(
+            self.location_tier(validated_data.origin, region_index),
+            self.location_tier(validated_data.destination, region_index),
+            key=TIERS.index,
+        )
+
+    def check_range(self, tier, validated_data):
+        """
+        Returns the error message of a range wider than the tier allows, None if it is allowed.
+        """
+        max_days = self.max_days.get(tier)
+        days = (validated_data.date_to - validated_data.date_from).days + 1
+        if max_days is not None and days > max_days:
+            return f"Date range of {tier} requests is limited to {int(max_days)} days"
+        return None
+
+    def check_lanes(self, validated_lanes, region_index):
+        """
+        Applies the range limits to the lanes of a batch.
+
+        Args:
+            validated_lanes (list): (validated_data, error message) tuples of the lanes.
+
+        Returns:
+            (validated lanes with the too wide ranges as errors, most expensive tier or None)
+        """
+        checked = []
+        tier = None
+        for validated_data, error in validated_lanes:
+            if validated_data is not None:
+                lane_tier = self.classify(validated_data, region_index)
+                error = self.check_range(lane_tier, validated_data)
+                if error is not None:
+                    validated_data = None
+                elif tier is None or TIERS.index(lane_tier) > TIERS.index(tier):
+                    tier = lane_tier
+            checked.append((validated_data, error))
+        return checked, tier
+
+    def timeout(self, tier):
+        return self.timeouts.get(tier)
+
+    def acquire(self, tier):
+        """Takes a slot of the tier without waiting, False if every slot is in use."""
+        limit = self.max_concurrent.get(tier)
+        with self._lock:
+            if limit is not None and self._in_flight[tier] >= limit:
+                metrics.inc("rates_rejected_total", reason="tier", tier=tier)
+                return False
+            self._in_flight[tier] += 1
+        return True
+
+    def release(self, tier):
+        with self._lock:
+            self._in_flight[tier] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {f"in_flight_{tier}": count for tier, count in self._in_flight.items()}
+
+
+def create_rate_tiers(config):
+    """Create the tier limits from the RATES_TIER_* config."""
+    timeouts = parse_tier_limits(config["RATES_TIER_TIMEOUT_MS"])
+    return RateTiers(
+        max_days=parse_tier_limits(config["RATES_TIER_MAX_DAYS"]),
+        timeouts={tier: timeout / 1000 for tier, timeout in timeouts.items()},
+        max_concurrent=parse_tier_limits(config["RATES_TIER_MAX_CONCURRENT"]),
+    )
+
+
+class AdmissionController:
+    """Bounds the /rates/ requests a worker serves at once.
+
+    Requests beyond ``max_concurrent`` wait up to ``queue_timeout`` seconds for
+    a slot, at most ``max_queue`` of them. The others are rejected right away
+    instead of piling up on the connection pool.
+
+    Args:
+        max_concurrent (int): Requests served at once.
+        max_queue (int): Requests waiting for a slot.
+        queue_timeout (float): Seconds a request waits for a slot.
+    """
+
+    def __init__(self, max_concurrent, max_queue=0, queue_timeout=0.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+
+    def acquire(self):
+        """Takes a slot, False if the worker is saturated."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    metrics.inc("rates_rejected_total", reason="queue_full")
+                    return False
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                metrics.inc("rates_rejected_total", reason="queue_timeout")
+                return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "waiting": self._waiting}
@@ -0,0 +1,393 @@
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from utils.logger import configure_logger
+from custom.errors import CacheError, DBError
+from db_engine.db import DB
+from queries.sql_queries import (
+    CREATE_PRICE_DAY_CHANGES,
+    RECORD_PRICE_DAY_CHANGES,
+    PRICE_DAY_CHANGES_EXIST_QUERY,
+    PRICE_DAY_CHANGES_MAX_ID_QUERY,
+    PRICE_DAY_CHANGES_QUERY,
+)
+
+try:
+    import redis
+except ImportError:  # Optional, only needed for the shared backend
+    redis = None
+
+logger = configure_logger(__name__)
+
+# App extensions holding the result caches, see create_app
+CACHE_EXTENSIONS = ("rates_cache", "rates_day_cache")
+
+
+class BaseCache(ABC):
+    """Interface of the result caches.
+
+    Every entry can carry the (first_day, last_day) range its value was computed
+    for, so that loading prices for a day can invalidate all entries covering it.
+    """
+
+    # Whether every worker sees the same entries, in-process caches learn about
+    # changed days through CacheInvalidationListener instead
+    shared = False
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, attr, value=1):
+        with self._stats_lock:
+            setattr(self, attr, getattr(self, attr) + value)
+
+    @abstractmethod
+    def get(self, key):
+        "Return the cached value or None"
+
+    @abstractmethod
+    def set(self, key, value, days=None):
+        "Cache value, days is the (first_day, last_day) range it covers"
+
+    @abstractmethod
+    def invalidate_day(self, day):
+        "Drop every entry covering day, returns number of dropped entries"
+
+    @abstractmethod
+    def clear(self):
+        "Drop every entry"
+
+    def after_fork(self):
+        """Drops the state a forked worker must not share with its parent, e.g. connections."""
+
+    def close(self):
+        """Releases the connections of the cache."""
+
+    def get_many(self, keys):
+        """Return the cached values of keys, None for every missing key."""
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items):
+        """Cache (key, value, days) items."""
+        for key, value, days in items:
+            self.set(key, value, days=days)
+
+    def invalidate_days(self, days):
+        return sum(self.invalidate_day(day) for day in days)
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+class _CacheEntry:
+    __slots__ = ("value", "size", "expires_at", "days")
+
+    def __init__(self, value, size, expires_at, days):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.days = days
+
+
+class LRUCache(BaseCache):
+    """In process LRU cache with TTL and max-bytes eviction.
+
+    Args:
+        ttl (float): Seconds an entry stays valid.
+        max_bytes (int): Upper limit of the (pickled) size of all cached values.
+    """
+
+    def __init__(self, ttl=300, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._count("misses" if entry is None else "hits")
+        return None if entry is None else entry.value
+
+    def set(self, key, value, days=None):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        days = tuple(str(day) for day in days) if days else None
+        entry = _CacheEntry(value, size, time.monotonic() + self.ttl, days)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at < now:
+                    self._pop(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                values.append(None if entry is None else entry.value)
+        hits = sum(1 for value in values if value is not None)
+        self._count("hits", hits)
+        self._count("misses", len(values) - hits)
+        return values
+
+    def invalidate_day(self, day):
+        day = str(day)
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if entry.days and entry.days[0] <= day <= entry.days[1]
+            ]
+            for key in keys:
+                self._pop(key)
+        self._count("invalidations", len(keys))
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(
+                {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+            )
+        return stats
+
+
+class RedisCache(BaseCache):
+    """Cache shared by all workers, backed by Redis.
+
+    A sorted set (scored by expiry) keeps the day range of every entry so that
+    ``invalidate_day`` can find the entries covering a day.
+
+    Args:
+        url (str): Redis connection url.
+        ttl (int): Seconds an entry stays valid.
+        prefix (str): Prefix of all keys written by this cache.
+    """
+
+    shared = True
+
+    def __init__(self, url, ttl=300, prefix="rates"):
+        super().__init__()
+        if redis is None:
+            raise CacheError("The redis package is required for the redis cache backend")
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+        self._client = redis.Redis.from_url(url)
+
+    def _redis_key(self, key):
+        return f"{self.prefix}:" + ":".join(str(part) for part in key)
+
+    def get(self, key):
+        try:
+            value = self._client.get(self._redis_key(key))
+        except redis.RedisError as e:
+            logger.warning("Failed reading from redis cache Error: %s", e)
+            value = None
+        self._count("misses" if value is None else "hits")
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, days=None):
+        redis_key = self._redis_key(key)
+        try:
+            pipe = self._client.pipeline()
+            pipe.setex(redis_key, self.ttl, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            if days:
+                member = f"{days[0]}|{days[1]}|{redis_key}"
+                pipe.zadd(self.index_key, {member: time.time() + self.ttl})
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Failed writing to redis cache Error: %s", e)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        try:
+            values = self._client.mget([self._redis_key(key) for key in keys])
+        except redis.RedisError as e:
+            logger.warning("Failed reading from redis cache Error: %s", e)
+            values = [None] * len(keys)
+        hits = sum(1 for value in values if value is not None)
+        self._count("hits", hits)
+        self._count("misses", len(values) - hits)
+        return [None if value is None else pickle.loads(value) for value in values]
+
+    def invalidate_day(self, day):
+        day = str(day)
+        # Entries which already expired do not need to be tracked anymore
+        self._client.zremrangebyscore(self.index_key, "-inf", time.time())
+        members = []
+        for member in self._client.zrange(self.index_key, 0, -1):
+            first, last, redis_key = member.decode().split("|", 2)
+            if first <= day <= last:
+                members.append((member, redis_key))
+        if members:
+            pipe = self._client.pipeline()
+            pipe.delete(*[redis_key for _, redis_key in members])
+            pipe.zrem(self.index_key, *[member for member, _ in members])
+            pipe.execute()
+        self._count("invalidations", len(members))
+        return len(members)
+
+    def after_fork(self):
+        # Forgets the parent's sockets instead of shutting them down
+        self._client.connection_pool.reset()
+
+    def close(self):
+        self._client.close()
+
+    def clear(self):
+        keys = list(self._client.scan_iter(f"{self.prefix}:*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+def create_cache(backend, ttl, max_bytes=None, redis_url=None, prefix="rates"):
+    """Create the result cache configured by backend (memory, redis or none).
+
+    Returns:
+        Cache instance or None if caching is disabled.
+    """
+    if not backend or backend == "none":
+        return None
+    if backend == "memory":
+        return LRUCache(ttl=ttl, max_bytes=max_bytes)
+    if backend == "redis":
+        return RedisCache(redis_url, ttl=ttl, prefix=prefix)
+    raise CacheError(f"Unknown cache backend {backend}")
+
+
+def get_caches(extensions):
+    """(name, cache) of every enabled result cache of an app."""
+    return [
+        (name, extensions[name]) for name in CACHE_EXTENSIONS if extensions.get(name) is not None
+    ]
+
+
+def invalidate_cached_days(extensions, days):
+    """
+    Drops the entries of every result cache covering one of days.
+
+    Returns:
+        Number of dropped entries
+    """
+    return sum(cache.invalidate_days(days) for _, cache in get_caches(extensions))
+
+
+def record_day_changes(days):
+    """Records changed days in price_day_changes, for the in-process caches of the workers."""
+    DB().execute_commands(
+        [(CREATE_PRICE_DAY_CHANGES, None), (RECORD_PRICE_DAY_CHANGES, {"days": list(days)})]
+    )
+
+
+class CacheInvalidationListener:
+    """Applies the days recorded in price_day_changes to the in-process caches of a worker.
+
+    Writers (ingestion, ``cache invalidate``) record the changed days in the same
+    transaction as the prices. Every worker polls them at most every ``interval``
+    seconds from the request path, only one thread at a time, so cached results
+    are at most ``interval`` seconds older than the prices.
+
+    Args:
+        caches (list): In-process caches to invalidate.
+        interval (float): Seconds between two polls.
+    """
+
+    def __init__(self, caches, interval=5):
+        self.caches = caches
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_id = None
+        self._next_poll = 0.0
+
+    def _start(self):
+        # Caches start empty, only changes recorded from now on matter
+        if DB().execute_query(PRICE_DAY_CHANGES_EXIST_QUERY)[0][0]:
+            self._last_id = DB().execute_query(PRICE_DAY_CHANGES_MAX_ID_QUERY)[0][0]
+        else:
+            # Created by the first writer, every row it records is new
+            self._last_id = 0
+
+    def poll(self):
+        """
+        Invalidates the days changed since the last poll, if the interval is up.
+
+        Returns:
+            Number of dropped entries
+        """
+        now = time.monotonic()
+        if now < self._next_poll or not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_poll = now + self.interval
+            if self._last_id is None:
+                self._start()
+                return 0
+            if not self._last_id and not DB().execute_query(PRICE_DAY_CHANGES_EXIST_QUERY)[0][0]:
+                return 0
+            rows = DB().execute_query(PRICE_DAY_CHANGES_QUERY, {"last_id": self._last_id})
+            if not rows:
+                return 0
+            self._last_id = rows[-1][0]
+            days = sorted({day for _, day in rows})
+            count = sum(cache.invalidate_days(days) for cache in self.caches)
+            logger.info("Invalidated %s cached results of %s changed days", count, len(days))
+            return count
+        except DBError as e:
+            # Retried on the next poll, entries expire after their TTL meanwhile
+            logger.warning("Failed to poll changed days Error: %s", e)
+            return 0
+        finally:
+            self._lock.release()
+
+
+def create_invalidation_listener(extensions, interval):
+    """Listener of the in-process caches of an app, None if there is none or polling is off."""
+    caches = [cache for _, cache in get_caches(extensions) if not cache.shared]
+    if not caches or interval <= 0:
+        return None
+    return CacheInvalidationListener(caches, interval)
@@ -0,0 +1,142 @@
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from custom.errors import ValidationError
+from utils.logger import configure_logger
+from utils.data_fetcher import rates_cache_key
+from utils.data_validator import rate_api_validation
+from utils.metrics import metrics
+from utils.region_index import get_region_index
+
+logger = configure_logger(__name__)
+
+# WSGI environ key marking the requests of the warm-up, they are not logged again
+WARMUP_ENVIRON_KEY = "rates.warmup"
+
+# Upper bounds of the warm-up duration histogram in seconds
+WARMUP_BUCKETS = (1, 5, 10, 30, 60, 120, 300)
+
+# Lanes between two progress log records
+PROGRESS_INTERVAL = 100
+
+
+def read_request_log(path, since=None):
+    """
+    Yields the query arguments of the logged /rates/ requests.
+
+    Args:
+        path (str): Request log, one JSON object per line.
+        since (datetime): Requests served before it are skipped, all if None.
+    """
+    try:
+        log_file = open(path)
+    except FileNotFoundError:
+        logger.warning("Request log %s not found, nothing to warm", path)
+        return
+    with log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+                if since is not None and datetime.fromisoformat(record["time"]) < since:
+                    continue
+                yield record["args"]
+            except (ValueError, KeyError, TypeError):
+                # Line cut by a crash or written by another version
+                continue
+
+
+def top_lanes(requests, region_index, top_n):
+    """
+    Most requested distinct lanes, ranges and granularities, most requested first.
+
+    Args:
+        requests: Query arguments of the requests, e.g. from ``read_request_log``.
+        region_index (RegionIndex): Loaded region index, invalid requests are dropped.
+        top_n (int): Upper limit of lanes.
+
+    Returns:
+        List of (result cache key, RatesParams) tuples.
+    """
+    counts = Counter()
+    lanes = {}
+    for args in requests:
+        try:
+            validated_data = rate_api_validation.validate_rates_args(args, region_index)
+        except (ValidationError, AttributeError):
+            continue
+        key = rates_cache_key(validated_data)
+        counts[key] += 1
+        lanes.setdefault(key, validated_data)
+    return [(key, lanes[key]) for key, _ in counts.most_common(top_n)]
+
+
+def warm_rates_cache(app, top_n=None, concurrency=None, log_path=None):
+    """
+    Replays the most requested lanes of the request log through /rates/ to fill the result cache.
+
+    Lanes go through the normal request path (admission, tiers, caches, coalescing),
+    at most ``concurrency`` at a time. Lanes left when RATES_WARMUP_TIMEOUT is up are
+    skipped. Warmed keys are remembered in ``rates_warmed_keys``, so that
+    ``rates_warmed_lookups_total`` shows whether later requests hit them.
+
+    Args:
+        app (Flask): App whose cache is warmed.
+        top_n (int): Number of lanes, RATES_WARMUP_TOP_N if None.
+        concurrency (int): Requests in flight, RATES_WARMUP_CONCURRENCY if None.
+        log_path (str): Request log, RATES_WARMUP_LOG if None.
+
+    Returns:
+        Dict of lanes per result: warmed, cached (already in a shared cache), skipped, failed.
+    """
+    config = app.config
+    results = {"warmed": 0, "cached": 0, "skipped": 0, "failed": 0}
+    if app.extensions.get("rates_cache") is None:
+        logger.info("Result cache is disabled, nothing to warm")
+        return results
+
+    start = time.monotonic()
+    deadline = start + config["RATES_WARMUP_TIMEOUT"]
+    since = datetime.now(timezone.utc) - timedelta(hours=config["RATES_WARMUP_WINDOW_HOURS"])
+    with app.app_context():
+        lanes = top_lanes(
+            read_request_log(log_path or config["RATES_WARMUP_LOG"], since),
+            get_region_index(),
+            top_n if top_n is not None else config["RATES_WARMUP_TOP_N"],
+        )
+    warmed_keys = app.extensions["rates_warmed_keys"]
+
+    def warm(lane):
+        key, validated_data = lane
+        if time.monotonic() > deadline:
+            return "skipped"
+        response = app.test_client().get(
+            "/rates/",
+            query_string=validated_data.to_dict(),
+            environ_base={WARMUP_ENVIRON_KEY: True},
+        )
+        response.close()
+        cache_status = response.headers.get("X-Cache")
+        if response.status_code != 200:
+            logger.warning("Failed to warm %s Status %s", key, response.status_code)
+            return "failed"
+        if cache_status is None:
+            # Streamed responses bypass the cache
+            return "skipped"
+        warmed_keys.add(key)
+        return "cached" if cache_status == "HIT" else "warmed"
+
+    workers = concurrency if concurrency is not None else config["RATES_WARMUP_CONCURRENCY"]
+    with ThreadPoolExecutor(max(workers, 1), thread_name_prefix="rates-warmup") as executor:
+        for done, result in enumerate(executor.map(warm, lanes), 1):
+            results[result] += 1
+            metrics.inc("rates_warmup_lanes_total", result=result)
+            if done % PROGRESS_INTERVAL == 0:
+                logger.info("Warmed %s of %s lanes", done, len(lanes))
+
+    duration = time.monotonic() - start
+    metrics.observe("rates_warmup_duration_seconds", duration, buckets=WARMUP_BUCKETS)
+    logger.info("Warmed the result cache in %.1fs %s", duration, results)
+    return results
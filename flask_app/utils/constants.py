@@ -8,3 +8,14 @@ REGEX_FOR_SQL_INJECTION = r"(\s*([\0\b\'\"\n\r\t\%\_\\]*\s*(((select\s*.+\s*from
 
 # REGEX for string length validation
 REGEX_FOR_STR_LENGTH = r"^.{%s,%s}$"
+
+# Allowlist grammar of origin/destination: a UN/LOCODE port code or a region slug.
+# Both alternatives are linear, so matching can not backtrack.
+REGEX_FOR_LOCATION = r"(?:[A-Z]{2}[A-Z2-9]{3}|[a-z][a-z0-9_]*)\Z"
+REGEX_FOR_LOCATION_CHARS = r"[A-Za-z0-9_]*\Z"
+
+# REGEX for dates in YYYY-MM-DD format
+REGEX_FOR_DATE = r"([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})\Z"
+
+# Granularities of the RateAPI rows: one row per day, calendar week (from Monday) or month
+GRANULARITIES = ("day", "week", "month")
@@ -0,0 +1,372 @@
+import asyncio
+from datetime import date, timedelta
+
+from flask import current_app
+
+from custom.errors import QueryCancelledError
+from utils.logger import configure_logger
+from utils.admission import query_budget_var
+from db_engine.db import ReadDB
+from db_engine.numpy_db import get_price_db
+from utils.data_processor import RateAPIDataFormat, bucket_starts
+from utils.metrics import metrics, timed
+from queries.sql_queries import (
+    AVG_PRICE_QUERY,
+    AVG_PRICE_ROLLUP_QUERY,
+    AVG_PRICE_BUCKET_QUERIES,
+    AVG_PRICE_BUCKET_ROLLUP_QUERIES,
+    AVG_PRICE_BATCH_QUERY,
+    AVG_PRICE_ROLLUP_BATCH_QUERY,
+)
+
+logger = configure_logger(__name__)
+
+
+def get_rates_cache():
+    """Return the result cache of the current app, None if caching is disabled."""
+    return current_app.extensions.get("rates_cache")
+
+
+def get_day_cache():
+    """Return the day level cache of the current app, None if it is disabled."""
+    return current_app.extensions.get("rates_day_cache")
+
+
+def get_single_flight():
+    """Return the request coalescing of the current app, None if it is disabled."""
+    return current_app.extensions.get("single_flight")
+
+
+def rates_cache_key(validated_data):
+    """Normalized result cache key of the RateAPI arguments."""
+    key = (
+        "avg_price",
+        validated_data.origin,
+        validated_data.destination,
+        validated_data.date_from.isoformat(),
+        validated_data.date_to.isoformat(),
+    )
+    if validated_data.granularity != "day":
+        key += (validated_data.granularity,)
+    return key
+
+
+def avg_price_query(granularity, use_rollup):
+    """Query of the average prices per day, week or month, see create_avg_price_query_args."""
+    if granularity == "day":
+        return AVG_PRICE_ROLLUP_QUERY if use_rollup else AVG_PRICE_QUERY
+    queries = AVG_PRICE_BUCKET_ROLLUP_QUERIES if use_rollup else AVG_PRICE_BUCKET_QUERIES
+    return queries[granularity]
+
+
+def count_days(validated_data):
+    """Number of days between date_from and date_to, both included."""
+    return (validated_data.date_to - validated_data.date_from).days + 1
+
+
+def count_rows(validated_data):
+    """Number of rows of the response, one per day, week or month of the range."""
+    if validated_data.granularity == "day":
+        return count_days(validated_data)
+    return len(
+        bucket_starts(validated_data.date_from, validated_data.date_to, validated_data.granularity)
+    )
+
+
+def missing_day_ranges(days, is_missing, max_ranges):
+    """
+    Groups the missing days into at most ``max_ranges`` contiguous (first, last) ranges.
+
+    When there are more gaps than allowed, the ranges separated by the fewest
+    cached days are merged, re-fetching those few cached days.
+
+    Args:
+        days (list): Consecutive days of the request.
+        is_missing (list): For each day whether it is missing from the cache.
+        max_ranges (int): Upper limit of ranges (and so of queries).
+    """
+    ranges = []
+    for index, missing in enumerate(is_missing):
+        if not missing:
+            continue
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+
+    while len(ranges) > max(max_ranges, 1):
+        gaps = [ranges[i + 1][0] - ranges[i][1] for i in range(len(ranges) - 1)]
+        i = gaps.index(min(gaps))
+        ranges[i : i + 2] = [[ranges[i][0], ranges[i + 1][1]]]
+
+    return [(days[first], days[last]) for first, last in ranges]
+
+
+class RateAPIDataFetcher:
+    """
+    Fetches the daily average prices for validated RateAPI arguments.
+
+    Lookups go through the whole-response cache, then the per (origin,
+    destination, day) cache. Only the days missing from both are queried from
+    the raw prices or the rollup table.
+    """
+
+    def __init__(self, region_index):
+        self.region_index = region_index
+        invalidations = current_app.extensions.get("rates_cache_invalidations")
+        if invalidations is not None:
+            # Drops the cached days changed by other processes first
+            invalidations.poll()
+        self.cache = get_rates_cache()
+        self.day_cache = get_day_cache()
+        self.use_rollup = current_app.config["USE_PRICE_ROLLUP"]
+        self.max_day_ranges = current_app.config["RATES_DAY_CACHE_MAX_QUERIES"]
+        self.batch_chunk_size = current_app.config["RATES_BATCH_CHUNK_SIZE"]
+        self.single_flight = get_single_flight()
+        # Keys filled by the cache warm-up, their lookups show whether warming paid off
+        self.warmed_keys = current_app.extensions.get("rates_warmed_keys")
+
+    def _query_avg_prices(self, validated_data):
+        params = RateAPIDataFormat().create_avg_price_query_args(validated_data, self.region_index)
+        logger.debug("Created Params for RateAPI %s", params)
+
+        query = avg_price_query(validated_data.granularity, self.use_rollup)
+        return get_price_db().execute_query(query, params)
+
+    def query_avg_prices(self, validated_data):
+        """
+        Query the (day, average_price, sample_count) rows from the database.
+
+        Identical queries in flight on other threads are waited for instead of sent again.
+        """
+        if self.single_flight is None:
+            return self._query_avg_prices(validated_data)
+        key = rates_cache_key(validated_data) + (self.use_rollup,)
+        try:
+            return self.single_flight.do(key, self._query_avg_prices, validated_data)
+        except QueryCancelledError as e:
+            budget = query_budget_var.get()
+            is_disconnected = budget.is_disconnected if budget is not None else None
+            if e.reason != "disconnect" or (is_disconnected is not None and is_disconnected()):
+                raise
+            # The shared query was cancelled for the client of another request
+            return self.single_flight.do(key, self._query_avg_prices, validated_data)
+
+    def stream_avg_prices(self, validated_data, batch_size, budget=None):
+        """
+        Streams the (day, average_price, sample_count) rows in batches, bypassing the caches.
+
+        The QueryBudget of the request is applied to the query, see PostGresDB.stream_query.
+        """
+        params = RateAPIDataFormat().create_avg_price_query_args(validated_data, self.region_index)
+        query = avg_price_query(validated_data.granularity, self.use_rollup)
+        return ReadDB().stream_query(query, params, batch_size, budget)
+
+    def fetch_days(self, validated_data):
+        """
+        Serves the days of the range from the day cache and queries only the missing ones.
+
+        Returns:
+            (day, average_price, sample_count) rows ordered by day.
+        """
+        origin, destination = validated_data.origin, validated_data.destination
+        first = validated_data.date_from
+        days = [(first + timedelta(days=i)).isoformat() for i in range(count_days(validated_data))]
+
+        keys = [("avg_price_day", origin, destination, day) for day in days]
+        with timed("cache"):
+            cached = self.day_cache.get_many(keys)
+        rows = {day: value for day, value in zip(days, cached) if value is not None}
+
+        ranges = missing_day_ranges(days, [value is None for value in cached], self.max_day_ranges)
+        fetched_days = 0
+        for range_from, range_to in ranges:
+            validated_range = validated_data.replace(
+                date_from=date.fromisoformat(range_from), date_to=date.fromisoformat(range_to)
+            )
+            fetched = self.query_avg_prices(validated_range)
+            self.day_cache.set_many(
+                [
+                    (("avg_price_day", origin, destination, day), (average, count), (day, day))
+                    for day, average, count in fetched
+                ]
+            )
+            rows.update((day, (average, count)) for day, average, count in fetched)
+            fetched_days += len(fetched)
+
+        logger.debug("Served %s of %s days from cache", len(days) - fetched_days, len(days))
+        return [(day,) + rows[day] for day in days]
+
+    def fetch_avg_prices(self, validated_data):
+        """
+        Returns the (day, average_price, sample_count) rows and whether they came from the cache.
+        """
+        key = rates_cache_key(validated_data)
+        if self.cache is not None:
+            with timed("cache"):
+                data = self.cache.get(key)
+            if self.warmed_keys and key in self.warmed_keys:
+                result = "miss" if data is None else "hit"
+                metrics.inc("rates_warmed_lookups_total", result=result)
+            if data is not None:
+                return data, True
+
+        # The day cache holds daily rows, weeks and months come from their rollups
+        if self.day_cache is not None and validated_data.granularity == "day":
+            data = self.fetch_days(validated_data)
+        else:
+            data = self.query_avg_prices(validated_data)
+
+        if self.cache is not None:
+            self.cache.set(key, data, days=key[3:5])
+        return data, False
+
+    def query_avg_prices_batch(self, lanes):
+        """
+        Query many lanes with one set based query per chunk of lanes.
+
+        Args:
+            lanes (list): (lane_id, validated_data) tuples.
+
+        Returns:
+            Dict of lane_id to its (day, average_price, sample_count) rows.
+        """
+        query = AVG_PRICE_ROLLUP_BATCH_QUERY if self.use_rollup else AVG_PRICE_BATCH_QUERY
+        data = {lane_id: [] for lane_id, _ in lanes}
+        for start in range(0, len(lanes), self.batch_chunk_size):
+            chunk = lanes[start : start + self.batch_chunk_size]
+            params = RateAPIDataFormat().create_avg_price_batch_query_args(chunk, self.region_index)
+            for lane_id, *row in ReadDB().execute_query(query, params):
+                data[lane_id].append(tuple(row))
+        return data
+
+    def fetch_avg_prices_batch(self, lanes):
+        """
+        Returns the rows of every lane, serving cached lanes from the result cache.
+
+        Args:
+            lanes (list): (lane_id, validated_data) tuples.
+
+        Returns:
+            Dict of lane_id to its (day, average_price, sample_count) rows.
+        """
+        data = {}
+        missing = []
+        for lane_id, validated_data in lanes:
+            cached = self.cache.get(rates_cache_key(validated_data)) if self.cache else None
+            if cached is not None:
+                data[lane_id] = cached
+            else:
+                missing.append((lane_id, validated_data))
+
+        if missing:
+            # The set based query is daily, weekly and monthly lanes are queried one by one
+            queried = self.query_avg_prices_batch(
+                [lane for lane in missing if lane[1].granularity == "day"]
+            )
+            for lane_id, validated_data in missing:
+                if validated_data.granularity != "day":
+                    queried[lane_id] = self.query_avg_prices(validated_data)
+                data[lane_id] = queried[lane_id]
+                if self.cache is not None:
+                    key = rates_cache_key(validated_data)
+                    self.cache.set(key, queried[lane_id], days=key[3:5])
+        return data
+
+
+class AsyncRateAPIDataFetcher:
+    """
+    Async counterpart of RateAPIDataFetcher for the async app.
+
+    Shares the query arguments, queries and result cache keys with the sync
+    fetcher. Batch chunks are queried concurrently on the event loop.
+
+    Args:
+        config (dict): App config.
+        db (AsyncPostGresDB): Async DB of the current event loop.
+        region_index (RegionIndex): Loaded region index.
+        cache (BaseCache): Result cache or None.
+        single_flight (AsyncSingleFlight): Request coalescing of the event loop or None.
+    """
+
+    def __init__(self, config, db, region_index, cache=None, single_flight=None):
+        self.db = db
+        self.region_index = region_index
+        self.cache = cache
+        self.single_flight = single_flight
+        self.use_rollup = config["USE_PRICE_ROLLUP"]
+        self.batch_chunk_size = config["RATES_BATCH_CHUNK_SIZE"]
+        self.batch_concurrency = asyncio.Semaphore(config["DB_POOL_MAX_SIZE"])
+
+    async def _query_avg_prices(self, validated_data):
+        params = RateAPIDataFormat().create_avg_price_query_args(validated_data, self.region_index)
+        query = avg_price_query(validated_data.granularity, self.use_rollup)
+        return await self.db.execute_query(query, params)
+
+    async def query_avg_prices(self, validated_data):
+        if self.single_flight is None:
+            return await self._query_avg_prices(validated_data)
+        key = rates_cache_key(validated_data) + (self.use_rollup,)
+        return await self.single_flight.do(key, self._query_avg_prices, validated_data)
+
+    async def fetch_avg_prices(self, validated_data):
+        """
+        Returns the (day, average_price, sample_count) rows and whether they came from the cache.
+        """
+        key = rates_cache_key(validated_data)
+        if self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                return data, True
+
+        data = await self.query_avg_prices(validated_data)
+        if self.cache is not None:
+            self.cache.set(key, data, days=key[3:5])
+        return data, False
+
+    async def _query_batch_chunk(self, chunk):
+        query = AVG_PRICE_ROLLUP_BATCH_QUERY if self.use_rollup else AVG_PRICE_BATCH_QUERY
+        params = RateAPIDataFormat().create_avg_price_batch_query_args(chunk, self.region_index)
+        async with self.batch_concurrency:
+            return await self.db.execute_query(query, params)
+
+    async def _query_batch_lane(self, validated_data):
+        async with self.batch_concurrency:
+            return await self.query_avg_prices(validated_data)
+
+    async def fetch_avg_prices_batch(self, lanes):
+        """
+        Returns a dict of lane_id to its rows, cached lanes come from the result cache.
+        """
+        data = {}
+        missing = []
+        for lane_id, validated_data in lanes:
+            cached = self.cache.get(rates_cache_key(validated_data)) if self.cache else None
+            if cached is not None:
+                data[lane_id] = cached
+            else:
+                data[lane_id] = []
+                missing.append((lane_id, validated_data))
+
+        # The set based query is daily, weekly and monthly lanes are queried one by one
+        daily = [lane for lane in missing if lane[1].granularity == "day"]
+        bucketed = [lane for lane in missing if lane[1].granularity != "day"]
+        chunks = [
+            daily[start : start + self.batch_chunk_size]
+            for start in range(0, len(daily), self.batch_chunk_size)
+        ]
+        results = await asyncio.gather(
+            *[self._query_batch_chunk(chunk) for chunk in chunks],
+            *[self._query_batch_lane(validated_data) for _, validated_data in bucketed],
+        )
+        for rows in results[: len(chunks)]:
+            for lane_id, *row in rows:
+                data[lane_id].append(tuple(row))
+        for (lane_id, _), rows in zip(bucketed, results[len(chunks) :]):
+            data[lane_id] = rows
+
+        if self.cache is not None:
+            for lane_id, validated_data in missing:
+                key = rates_cache_key(validated_data)
+                self.cache.set(key, data[lane_id], days=key[3:5])
+        return data
@@ -1,8 +1,42 @@
+import json
+import sys
+from array import array
+from datetime import date, timedelta
+
 from utils.logger import configure_logger
 
+try:
+    import pyarrow
+except ImportError:  # Optional, only needed for the Arrow response format
+    pyarrow = None
+
 logger = configure_logger(__name__)
 
 
+def bucket_starts(date_from, date_to, granularity):
+    """
+    First day of every bucket of the range, the first bucket starts at date_from.
+
+    Weeks start on Monday and months on their first day, like date_trunc in Postgres.
+    """
+    if granularity == "day":
+        return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    starts = [date_from]
+    if granularity == "week":
+        start = date_from + timedelta(days=7 - date_from.weekday())
+        while start <= date_to:
+            starts.append(start)
+            start += timedelta(days=7)
+        return starts
+    year, month = date_from.year, date_from.month
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        start = date(year, month, 1)
+        if start > date_to:
+            return starts
+        starts.append(start)
+
+
 def return_message_if_no_price(func):
     def wrapper(self, raw_query_data):
         is_price_available = any(row[1] for row in raw_query_data)
@@ -21,19 +55,149 @@ class RateAPIDataFormat:
 
     @return_message_if_no_price
     def format_avg_price_query_data(self, raw_query_data):
-        # Convert list of lists to list of dictionaries
-        logger.info("Starting avg price query data formatting")
+        # Convert list of lists to list of dictionaries, the trailing sample_count
+        # column of the query is internal and dropped by zip
+        logger.debug("Starting avg price query data formatting")
         list_of_dicts = [dict(zip(self.avg_price_query_keys, row)) for row in raw_query_data]
-        logger.info("Completed avg price query data formatting")
+        logger.debug("Completed avg price query data formatting")
         return list_of_dicts
 
-    def create_avg_price_query_args(self, validated_data):
+    def _avg_price_row_to_json(self, row):
+        day, average_price = row[0], row[1]
+        return json.dumps(
+            {"day": day, "average_price": None if average_price is None else str(average_price)},
+            separators=(",", ":"),
+        )
+
+    def iter_avg_price_json(self, row_batches):
+        """
+        Formats batches of avg price rows as chunks of one JSON array.
+
+        Unlike ``format_avg_price_query_data`` every day is returned, even when
+        no price is available, as the rows are sent before all of them are seen.
+        """
+        yield "["
+        separator = ""
+        for rows in row_batches:
+            chunk = ",".join(self._avg_price_row_to_json(row) for row in rows)
+            yield separator + chunk
+            separator = ","
+        yield "]"
+
+    def iter_avg_price_ndjson(self, row_batches):
+        """
+        Formats batches of avg price rows as newline delimited JSON, one day per line.
+        """
+        for rows in row_batches:
+            yield "".join(self._avg_price_row_to_json(row) + "\n" for row in rows)
+
+    def format_avg_price_columnar(self, raw_query_data):
+        """
+        Formats avg price rows as one column: the first day plus one price per day.
+
+        Every day is returned, days without enough prices are null.
+        """
+        return {
+            "start_day": raw_query_data[0][0] if raw_query_data else None,
+            "average_price": [None if row[1] is None else int(row[1]) for row in raw_query_data],
+        }
+
+    def format_avg_price_int32(self, raw_query_data):
+        """
+        Packs avg price rows as little-endian int32 prices followed by a null bitmap.
+
+        The bitmap has one bit per day (least significant bit first), set when the
+        price is valid, so ``np.frombuffer(body, "<i4", count=n)`` loads the prices
+        without a copy. Null prices are stored as 0.
+        """
+        prices = array("i", (0 if row[1] is None else int(row[1]) for row in raw_query_data))
+        if sys.byteorder == "big":
+            prices.byteswap()
+
+        bitmap = bytearray((len(raw_query_data) + 7) // 8)
+        for index, row in enumerate(raw_query_data):
+            if row[1] is not None:
+                bitmap[index >> 3] |= 1 << (index & 7)
+        return prices.tobytes() + bytes(bitmap)
+
+    def format_avg_price_arrow(self, raw_query_data):
+        """
+        Serializes avg price rows as an Arrow IPC stream with day (date32) and
+        average_price (int32) columns.
+        """
+        days = pyarrow.array(
+            [date.fromisoformat(row[0]) for row in raw_query_data], type=pyarrow.date32()
+        )
+        prices = pyarrow.array(
+            [None if row[1] is None else int(row[1]) for row in raw_query_data],
+            type=pyarrow.int32(),
+        )
+        table = pyarrow.table({"day": days, "average_price": prices})
+
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def create_avg_price_query_args(self, validated_data, region_index):
         # Extract region and date parameters from validated data
-        origin = validated_data.get("origin")
-        destination = validated_data.get("destination")
-        date_from = validated_data.get("date_from")
-        date_to = validated_data.get("date_to")
+        origin = validated_data.origin
+        destination = validated_data.destination
+        date_from = validated_data.date_from
+        date_to = validated_data.date_to
+
+        # Expand origin/destination to the port codes and region slugs they cover
+        orig_codes, orig_regions = region_index.expand(origin)
+        dest_codes, dest_regions = region_index.expand(destination)
+
+        return {
+            "date_from": date_from,
+            "date_to": date_to,
+            "orig_codes": orig_codes,
+            "orig_regions": orig_regions,
+            "dest_codes": dest_codes,
+            "dest_regions": dest_regions,
+        }
+
+    def create_avg_price_batch_query_args(self, lanes, region_index):
+        """
+        Creates the unnest arrays of AVG_PRICE_BATCH_QUERY.
 
-        params = [origin, destination, date_from, date_to]
+        Args:
+            lanes (list): (lane_id, validated_data) tuples.
+            region_index (RegionIndex): Index expanding origin/destination.
+        """
+        args = {
+            key: []
+            for key in (
+                "lane_ids",
+                "dates_from",
+                "dates_to",
+                "orig_lane_ids",
+                "orig_keys",
+                "orig_is_code",
+                "dest_lane_ids",
+                "dest_keys",
+                "dest_is_code",
+            )
+        }
+        for lane_id, validated_data in lanes:
+            args["lane_ids"].append(lane_id)
+            args["dates_from"].append(validated_data.date_from)
+            args["dates_to"].append(validated_data.date_to)
 
-        return params * 2
+            for prefix, value in (
+                ("orig", validated_data.origin),
+                ("dest", validated_data.destination),
+            ):
+                codes, regions = region_index.expand(value)
+                for key, is_code in [(code, True) for code in codes] + [
+                    (region, False) for region in regions
+                ]:
+                    args[f"{prefix}_lane_ids"].append(lane_id)
+                    args[f"{prefix}_keys"].append(key)
+                    args[f"{prefix}_is_code"].append(is_code)
+        # Span of all the lanes as constants, lets the planner prune price_detail partitions
+        args["span_from"] = min(args["dates_from"], default=None)
+        args["span_to"] = max(args["dates_to"], default=None)
+        return args
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime
+from datetime import date
 
 from utils.logger import configure_logger
 from custom.errors import (
@@ -7,21 +7,68 @@ from custom.errors import (
     SQLInjectionError,
     DateOrderMismatchedError,
     StringLengthExceedError,
+    InvalidLocationError,
 )
 from utils.constants import (
     MIN_LENGTH_OF_STRING,
     MAX_LENGTH_OF_STRING,
     REGEX_FOR_SQL_INJECTION,
-    REGEX_FOR_STR_LENGTH,
+    REGEX_FOR_LOCATION,
+    REGEX_FOR_LOCATION_CHARS,
+    REGEX_FOR_DATE,
+    GRANULARITIES,
 )
 
 logger = configure_logger(__name__)
 
+# Compiled once at import time instead of on every call
+SQL_INJECTION_REGEX = re.compile(REGEX_FOR_SQL_INJECTION, re.IGNORECASE)
+LOCATION_REGEX = re.compile(REGEX_FOR_LOCATION)
+LOCATION_CHARS_REGEX = re.compile(REGEX_FOR_LOCATION_CHARS)
+DATE_REGEX = re.compile(REGEX_FOR_DATE)
+
+
+class RatesParams:
+    """Validated and typed arguments of the RateAPI."""
+
+    __slots__ = ("origin", "destination", "date_from", "date_to", "granularity")
+
+    def __init__(self, origin, destination, date_from, date_to, granularity="day"):
+        self.origin = origin
+        self.destination = destination
+        self.date_from = date_from
+        self.date_to = date_to
+        self.granularity = granularity
+
+    def replace(self, **changes):
+        """Copy of the params with some of the values replaced."""
+        values = {key: getattr(self, key) for key in self.__slots__}
+        values.update(changes)
+        return RatesParams(**values)
+
+    def to_dict(self):
+        values = {
+            "origin": self.origin,
+            "destination": self.destination,
+            "date_from": self.date_from.isoformat(),
+            "date_to": self.date_to.isoformat(),
+        }
+        if self.granularity != "day":
+            values["granularity"] = self.granularity
+        return values
+
+    def __eq__(self, other):
+        if not isinstance(other, RatesParams):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self):
+        return f"RatesParams({self.to_dict()})"
+
 
 class Validation:
     def detect_sql_injection(self, input_string):
-        regex = re.compile(REGEX_FOR_SQL_INJECTION, re.IGNORECASE)
-        is_sql = regex.search(input_string)
+        is_sql = SQL_INJECTION_REGEX.search(input_string)
         if is_sql:
             raise SQLInjectionError("Potential SQL Injection Detected")
 
@@ -38,15 +85,13 @@ class Validation:
         Raises:
             ValueError: If the length of the string is more than the specified limit.
         """
-
-        regex_for_str_validation = REGEX_FOR_STR_LENGTH % (string_min_length, string_max_length)
-        regex = re.compile(regex_for_str_validation, re.IGNORECASE)
-        is_string_valid = regex.search(value)
-
-        logger.info(f"Used regex for string length validation: {regex_for_str_validation}")
-        if not is_string_valid:
-            logger.error(
-                f"Length of {value} is {len(value)}. Expected limit is between {string_min_length} and {string_max_length}"
+        if not string_min_length <= len(value) <= string_max_length:
+            logger.debug(
+                "Length of %s is %s. Expected limit is between %s and %s",
+                value,
+                len(value),
+                string_min_length,
+                string_max_length,
             )
             raise StringLengthExceedError(
                 f"The provided string have exceeded length limit. It should be between {string_min_length} and {string_max_length}"
@@ -54,25 +99,55 @@ class Validation:
         if check_sql_injection:
             self.detect_sql_injection(value)
 
-    def _validate_date_order(self, start, end, date_format):
+    def _validate_location(self, value, string_min_length, string_max_length):
+        """
+        Validates an origin/destination against the allowlist grammar.
+
+        Unlike ``detect_sql_injection`` this never backtracks, anything outside
+        of port codes and region slugs is rejected.
+
+        Raises:
+            StringLengthExceedError: If the length is out of limits.
+            SQLInjectionError: If the value contains characters outside of the allowlist.
+            InvalidLocationError: If the value is neither a port code nor a region slug.
+        """
+        self._validate_str(value, string_min_length, string_max_length, check_sql_injection=False)
+        if LOCATION_REGEX.match(value):
+            return
+        if not LOCATION_CHARS_REGEX.match(value):
+            raise SQLInjectionError("Characters outside of the allowlist detected")
+        raise InvalidLocationError(f"{value} is neither a port code nor a region slug")
+
+    def _parse_date(self, value):
+        """
+        Parses a YYYY-MM-DD date.
+
+        Raises:
+            ValueError: If the value is not a valid date.
+        """
+        match = DATE_REGEX.match(value)
+        if match is None:
+            raise ValueError(f"{value} does not match format YYYY-MM-DD")
+        return date(*map(int, match.groups()))
+
+    def _validate_date_order(self, start, end):
         """
         Validate the order of dates
         Args:
             start: Start date string
             end: End date string
-            date_format: Date format string
+
+        Returns:
+            Tuple of the parsed start and end date
         """
-        try:
-            start_date = datetime.strptime(start, date_format)
-            end_date = datetime.strptime(end, date_format)
-        except ValueError as e:
-            logger.error(f"Failed to parsed date: start_date {start} and end_date {end} Error: {e}")
-            raise e
+        start_date = self._parse_date(start)
+        end_date = self._parse_date(end)
 
         if start_date > end_date:
-            message = f"Order of start date {start} and end date {end} mismatched"
-            logger.error(message)
-            raise DateOrderMismatchedError(message)
+            raise DateOrderMismatchedError(
+                f"Order of start date {start} and end date {end} mismatched"
+            )
+        return start_date, end_date
 
 
 class RateAPIValidation(Validation):
@@ -81,37 +156,47 @@ class RateAPIValidation(Validation):
         Initializes the Validation class with a mapping of validation functions for each parameter.
         """
         self.required_keys = ["date_from", "date_to", "origin", "destination"]
+        self.optional_keys = ["granularity"]
+        self._required_key_set = frozenset(self.required_keys)
+        self._allowed_key_set = frozenset(self.required_keys + self.optional_keys)
 
-    def validate_rates_args(self, params):
+    def validate_rates_args(self, params, region_index=None):
         """
         Validates the input parameters using provided validation functions.
 
         Args:
             params (dict): A dictionary containing input parameters to be validated.
+            region_index (RegionIndex): If given, origin/destination must be known to it.
 
         Raises:
             ValidationError: If any validation fails.
+
+        Returns:
+            RatesParams with parsed dates.
         """
         # Strip whitespace from keys and values in the params dictionary
         param_data = {key.strip(): value.strip() for key, value in params.items()}
 
-        date_from = param_data.get("date_from")
-        date_to = param_data.get("date_to")
-        origin = param_data.get("origin")
-        destination = param_data.get("destination")
-
         # Checking if received keys and required keys are matching
-        received_keys = sorted(list(param_data.keys()))
-        if sorted(self.required_keys) != received_keys:
+        if not self._required_key_set <= param_data.keys() <= self._allowed_key_set:
             raise ValidationError(
                 f"Received key and required keys are not matching. Please make sure request contains {', '.join(self.required_keys)}."
             )
 
-        # Validating Date format and order
-        try:
-            self._validate_date_order(
-                param_data.get("date_from"), param_data.get("date_to"), "%Y-%m-%d"
+        granularity = param_data.get("granularity", "day")
+        if granularity not in GRANULARITIES:
+            raise ValidationError(
+                f"Invalid granularity {granularity}. It should be one of {', '.join(GRANULARITIES)}"
             )
+
+        date_from = param_data["date_from"]
+        date_to = param_data["date_to"]
+        origin = param_data["origin"]
+        destination = param_data["destination"]
+
+        # Validating Date format and order, dates are parsed only once
+        try:
+            start_date, end_date = self._validate_date_order(date_from, date_to)
         except DateOrderMismatchedError:
             raise ValidationError(
                 f"Order of date_from {date_from} and date_to {date_to} mismatched"
@@ -121,12 +206,59 @@ class RateAPIValidation(Validation):
 
         # Validating origin/destination strings
         try:
-            self._validate_str(origin, MIN_LENGTH_OF_STRING, MAX_LENGTH_OF_STRING)
-            self._validate_str(destination, MIN_LENGTH_OF_STRING, MAX_LENGTH_OF_STRING)
+            self._validate_location(origin, MIN_LENGTH_OF_STRING, MAX_LENGTH_OF_STRING)
+            self._validate_location(destination, MIN_LENGTH_OF_STRING, MAX_LENGTH_OF_STRING)
         except StringLengthExceedError:
             raise ValidationError("The length of Origin/Dest should be between 5 and 25")
         except SQLInjectionError:
             raise ValidationError("The Value of Origin/Dest have possible SQL injection")
+        except InvalidLocationError:
+            raise ValidationError("The Value of Origin/Dest should be a port code or region slug")
+
+        # Rejecting unknown origin/destination before any DB round trip
+        if region_index is not None:
+            for value in (origin, destination):
+                if not region_index.is_known(value):
+                    raise ValidationError(
+                        f"Unknown Origin/Dest {value}. It should be a port code or region slug"
+                    )
+
+        logger.debug("Successfully Validated data for RateAPI")
+        return RatesParams(origin, destination, start_date, end_date, granularity)
+
+    def validate_batch_lanes(self, lanes, region_index=None, max_lanes=None):
+        """
+        Validates a list of lanes of the batch endpoint.
+
+        Args:
+            lanes (list): Lane specs with origin, destination, date_from and date_to.
+            region_index (RegionIndex): If given, origin/destination must be known to it.
+            max_lanes (int): Upper limit of lanes in one batch.
+
+        Raises:
+            ValidationError: If the batch itself is invalid.
+
+        Returns:
+            List of (validated_data, error message) tuples, one of them None per lane.
+        """
+        if not isinstance(lanes, list) or not lanes:
+            raise ValidationError("Request should contain a non empty list of lanes.")
+        if max_lanes is not None and len(lanes) > max_lanes:
+            raise ValidationError(f"A batch can contain at most {max_lanes} lanes.")
+
+        results = []
+        for lane in lanes:
+            if not isinstance(lane, dict) or not all(
+                isinstance(value, str) for value in lane.values()
+            ):
+                results.append((None, "Lane should be an object with string values."))
+                continue
+            try:
+                results.append((self.validate_rates_args(lane, region_index), None))
+            except ValidationError as e:
+                results.append((None, e.message))
+        return results
+
 
-        logger.info("Successfully Validated data for RateAPI")
-        return param_data
+# Validation is stateless, one instance serves every request
+rate_api_validation = RateAPIValidation()
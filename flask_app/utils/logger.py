@@ -1,30 +1,242 @@
+import atexit
+import copy
+import json
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
 
+LOG_FILE = os.path.join("logs", "app.log")
 
-def configure_logger(logger_name):
+# Records of the request logger go to their own file, one JSON object per served request
+REQUEST_LOGGER = "requests"
+REQUEST_LOG_FILE = os.path.join("logs", "requests.jsonl")
 
-    logs_dir = "logs"
-    if not os.path.exists(logs_dir):
-        os.makedirs(logs_dir)
+# Client supplied X-Request-ID values are only trusted if they look like an id
+REQUEST_ID_REGEX = re.compile(r"[A-Za-z0-9._-]{1,128}\Z")
 
-    logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.INFO)
+# Request scoped logging context, set by the request hooks of the apps
+request_id_var = ContextVar("request_id", default=None)
+log_sampled_var = ContextVar("log_sampled", default=True)
+
+_lock = threading.Lock()
+_queue = queue.SimpleQueue()
+_queue_handler = None
+_listener = None
+
+# Per module levels, ``configure_logger`` applies them to loggers created later
+_default_level = logging.INFO
+_module_levels = {}
+_sample_rate = 1.0
+_log_format = os.getenv("LOG_FORMAT", "json")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            data["request_id"] = request_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class RequestLogFormatter(logging.Formatter):
+    """Formats the ``request`` fields of a request log record as one JSON object per line."""
+
+    def format(self, record):
+        data = {"time": datetime.fromtimestamp(record.created, timezone.utc).isoformat()}
+        data.update(getattr(record, "request", {}))
+        return json.dumps(data, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attaches the request id and drops the INFO/DEBUG records of unsampled requests.
+
+    Runs on the request thread since the request context lives in context variables.
+    The request log is never sampled.
+    """
+
+    def filter(self, record):
+        if (
+            record.levelno < logging.WARNING
+            and not log_sampled_var.get()
+            and record.name != REQUEST_LOGGER
+        ):
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The message and the traceback are rendered on the logging thread, the
+        # args may be mutated and the frames gone once the listener formats the
+        # record. The rest of the formatting is left to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _create_handlers(log_format):
+    if not os.path.exists(os.path.dirname(LOG_FILE)):
+        os.makedirs(os.path.dirname(LOG_FILE))
+
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s - %(message)s"
+        )
 
     # Configure FileHandler
-    file_handler = logging.FileHandler("logs/app.log")
-    file_handler.setLevel(logging.INFO)
-    log_format = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s - %(message)s"
-    )
-    file_handler.setFormatter(log_format)
-    logger.addHandler(file_handler)
+    file_handler = logging.FileHandler(LOG_FILE)
+    file_handler.setFormatter(formatter)
 
     # Configure StreamHandler (to print logs to console)
     stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setLevel(logging.INFO)
-    stream_handler.setFormatter(log_format)
-    logger.addHandler(stream_handler)
+    stream_handler.setFormatter(formatter)
+
+    request_handler = logging.FileHandler(REQUEST_LOG_FILE)
+    request_handler.setFormatter(RequestLogFormatter())
+    request_handler.addFilter(logging.Filter(REQUEST_LOGGER))
+    for handler in (file_handler, stream_handler):
+        handler.addFilter(lambda record: record.name != REQUEST_LOGGER)
+    return [file_handler, stream_handler, request_handler]
+
 
+def start_log_listener(log_format=None):
+    """(Re)start the background thread writing the queued records to file and console."""
+    global _listener, _log_format
+    with _lock:
+        _log_format = log_format or _log_format
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        handlers = _create_handlers(_log_format)
+        _listener = logging.handlers.QueueListener(_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_log_listener():
+    """Flush the queued records and stop the background thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def _restart_after_fork():
+    # Threads do not survive fork, a forked worker needs its own listener
+    global _listener, _queue
+    if _listener is not None:
+        _listener = None
+        _queue = queue.SimpleQueue()
+        _queue_handler.queue = _queue
+        start_log_listener()
+
+
+def _get_queue_handler():
+    global _queue_handler
+    if _queue_handler is None:
+        with _lock:
+            if _queue_handler is None:
+                handler = _QueueHandler(_queue)
+                handler.addFilter(RequestContextFilter())
+                _queue_handler = handler
+        start_log_listener()
+    return _queue_handler
+
+
+def parse_log_levels(value):
+    """Parse ``module=LEVEL,module=LEVEL`` into a dict."""
+    levels = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level="INFO", module_levels=None, sample_rate=1.0, log_format=None):
+    """
+    Applies the logging config of an app.
+
+    Args:
+        level (str): Level of every module without an explicit level.
+        module_levels (dict): Level per logger name, e.g. {"db_engine.postgres_db": "WARNING"}.
+        sample_rate (float): Share of requests whose INFO/DEBUG records are kept.
+        log_format (str): json or text, restarts the listener if it changed.
+    """
+    global _default_level, _module_levels, _sample_rate
+    _default_level = logging.getLevelName(level.upper())
+    _module_levels = dict(module_levels or {})
+    _sample_rate = sample_rate
+
+    for name in list(logging.root.manager.loggerDict):
+        logger = logging.getLogger(name)
+        if _queue_handler is not None and _queue_handler in logger.handlers:
+            logger.setLevel(_module_levels.get(name, _default_level))
+    if log_format and log_format != _log_format and _listener is not None:
+        start_log_listener(log_format)
+
+
+def bind_request(request_id=None):
+    """
+    Binds a request id and the sampling decision to the current context.
+
+    Args:
+        request_id (str): Id received from the client, a new one is created if missing or invalid.
+
+    Returns:
+        The request id
+    """
+    if not request_id or not REQUEST_ID_REGEX.match(request_id):
+        request_id = uuid.uuid4().hex
+    request_id_var.set(request_id)
+    log_sampled_var.set(_sample_rate >= 1.0 or random.random() < _sample_rate)
+    return request_id
+
+
+def configure_logger(logger_name):
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(_module_levels.get(logger_name, _default_level))
+
+    # Every module shares one queue handler, attach it only once per logger
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+    logger.propagate = False
     return logger
+
+
+atexit.register(stop_log_listener)
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,265 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from utils.logger import configure_logger, request_id_var
+
+logger = configure_logger(__name__)
+
+# Upper bounds of the latency histograms in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests by endpoint and status"),
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "rates_stage_duration_seconds": ("histogram", "Time spent per stage of a request"),
+    "db_queries_total": ("counter", "Queries sent to the database"),
+    "db_query_errors_total": ("counter", "Queries failed in the database"),
+    "db_rows_returned": ("histogram", "Rows returned per query"),
+    "single_flight_calls_total": ("counter", "Queries run on behalf of coalesced requests"),
+    "single_flight_coalesced_total": ("counter", "Requests that waited for an identical query"),
+    "db_queries_cancelled_total": ("counter", "Queries cancelled by timeout or client disconnect"),
+    "rates_rejected_total": ("counter", "Requests shed by the admission control"),
+    "db_read_queries_total": ("counter", "Read queries per read replica"),
+    "db_read_errors_total": ("counter", "Read queries failed by their read replica"),
+    "db_read_query_duration_seconds": ("histogram", "Read query latency per read replica"),
+    "db_replica_ejections_total": ("counter", "Read replicas taken out of the rotation"),
+    "db_statements_prepared_total": ("counter", "Statements prepared on a pooled connection"),
+    "db_prepare_duration_seconds": ("histogram", "Time spent preparing statements"),
+    "db_prepare_seconds_saved_total": ("counter", "Prepare time saved by reused statements"),
+    "slow_requests_profiled_total": ("counter", "Slow requests whose profile was saved"),
+    "rates_warmup_lanes_total": ("counter", "Lanes replayed by the cache warm-up by result"),
+    "rates_warmup_duration_seconds": ("histogram", "Time spent warming the result cache"),
+    "rates_warmed_lookups_total": ("counter", "Result cache lookups of warmed lanes by result"),
+    "db_pool_created_total": ("counter", "Connections opened by the pool"),
+    "db_pool_discarded_total": ("counter", "Broken or surplus connections closed by the pool"),
+    "db_pool_checkouts_total": ("counter", "Connections checked out of the pool"),
+    "db_pool_timeouts_total": ("counter", "Checkouts timed out waiting for a connection"),
+    "db_pool_wait_time_seconds_total": ("counter", "Time spent waiting for a connection"),
+    "cache_hits_total": ("counter", "Cache lookups found in the cache"),
+    "cache_misses_total": ("counter", "Cache lookups not found in the cache"),
+    "cache_invalidations_total": ("counter", "Cache entries dropped by invalidations"),
+    "cache_evictions_total": ("counter", "Cache entries evicted to stay under the size limit"),
+}
+
+# Stage timings of the current request, None outside of instrumented requests
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Metrics:
+    """Process wide counters and histograms, rendered in the Prometheus text format.
+
+    Updates take a lock for a few increments only, cheap enough for every request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        index = bisect_left(buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Bucket counts, sum and count
+                histogram = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            if index < len(buckets):
+                histogram[1][index] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def get(self, name, **labels):
+        """Value of a counter, or count of a histogram."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][3]
+            return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, gauges=()):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Args:
+            gauges: Extra (name, labels dict, value) samples, e.g. pool and cache stats.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (buckets, list(counts), total, count))
+                for key, (buckets, counts, total, count) in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name, default_type):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = HELP.get(name, (default_type, name.replace("_", " ")))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, key), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for (name, key), (buckets, counts, total, count) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        # Samples of a metric must be contiguous, stable sort keeps the label order
+        for name, labels, value in sorted(gauges, key=lambda sample: sample[0]):
+            describe(name, "gauge")
+            lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def record_stage(stage, seconds):
+    """Adds the duration of a stage to its histogram and to the timings of the current request."""
+    metrics.observe("rates_stage_duration_seconds", seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class timed:
+    """Context manager timing a stage of the request, e.g. ``with timed("db_query"):``."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, time.perf_counter() - self.start)
+
+
+def record_query(db, seconds, rows=None, failed=False):
+    """Records a query of a DBBaseClass implementation, rows is None for commands."""
+    record_stage("db_query", seconds)
+    metrics.inc("db_queries_total", db=db)
+    if failed:
+        metrics.inc("db_query_errors_total", db=db)
+    elif rows is not None:
+        metrics.observe("db_rows_returned", rows, buckets=ROW_BUCKETS, db=db)
+
+
+class SlowRequestProfiler:
+    """Profiles a sample of the requests and keeps the profiles of the slow ones.
+
+    A profile can not be started once a request turned out to be slow, so
+    ``sample_rate`` of the requests run under cProfile and the profile is
+    written to ``directory`` only if the request took longer than ``slow_seconds``.
+
+    Args:
+        sample_rate (float): Share of requests to profile.
+        slow_seconds (float): Requests slower than this keep their profile.
+        directory (str): Where the ``<request id>.prof`` files are written.
+    """
+
+    def __init__(self, sample_rate, slow_seconds, directory):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.directory = directory
+
+    def start(self):
+        if random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profile
+
+    def stop(self, profile, duration):
+        profile.disable()
+        if duration < self.slow_seconds:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{request_id_var.get() or int(time.time() * 1000)}.prof"
+        )
+        profile.dump_stats(path)
+        metrics.inc("slow_requests_profiled_total")
+        logger.warning("Slow request took %.3fs, profile saved to %s", duration, path)
+        return path
+
+
+class RequestTimer:
+    """State of an instrumented request, see ``begin_request``."""
+
+    __slots__ = ("start", "timings", "token", "profile", "profiler")
+
+    def end(self, endpoint, status):
+        """
+        Records the request metrics.
+
+        Returns:
+            Server-Timing header value
+        """
+        duration = time.perf_counter() - self.start
+        _request_timings.reset(self.token)
+        if self.profile is not None:
+            self.profiler.stop(self.profile, duration)
+
+        metrics.inc("http_requests_total", endpoint=endpoint, status=status)
+        metrics.observe("http_request_duration_seconds", duration, endpoint=endpoint)
+
+        timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.timings.items()]
+        timings.append(f"total;dur={duration * 1000:.2f}")
+        return ", ".join(timings)
+
+
+def begin_request(profiler=None):
+    """Starts timing a request, the returned timer's ``end`` records it."""
+    timer = RequestTimer()
+    timer.timings = {}
+    timer.token = _request_timings.set(timer.timings)
+    timer.profiler = profiler
+    timer.profile = profiler.start() if profiler is not None else None
+    timer.start = time.perf_counter()
+    return timer
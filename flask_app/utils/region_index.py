@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+
+from utils.logger import configure_logger
+from db_engine.db import ReadDB
+from queries.sql_queries import REGIONS_QUERY, PORT_CODES_QUERY
+
+logger = configure_logger(__name__)
+
+
+class RegionIndex:
+    """In memory index of the region tree and the known port codes.
+
+    The regions table almost never changes, so instead of walking the tree with
+    recursive CTEs on every request the tree is expanded once and every slug is
+    mapped to itself and all of its descendants.
+
+    Args:
+        ttl (float): Seconds after which the index is reloaded. ``None`` disables the TTL.
+    """
+
+    # Seconds before a failed reload of a stale index is retried
+    RELOAD_RETRY = 30
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Created on first use, so that it belongs to the event loop of the server
+        self._async_lock = None
+        self._descendants = {}
+        self._port_codes = frozenset()
+        self._top_level = frozenset()
+        self._loaded_at = None
+
+    @staticmethod
+    def build_descendants(region_rows):
+        """Map every region slug to the tuple of itself and all of its descendants.
+
+        Args:
+            region_rows: Iterable of (slug, parent_slug) rows.
+        """
+        children = defaultdict(list)
+        slugs = []
+        for slug, parent_slug in region_rows:
+            slugs.append(slug)
+            if parent_slug is not None:
+                children[parent_slug].append(slug)
+
+        descendants = {}
+        for slug in slugs:
+            seen = {slug}
+            stack = [slug]
+            while stack:
+                for child in children.get(stack.pop(), ()):
+                    # Guard against cycles in the tree
+                    if child not in seen:
+                        seen.add(child)
+                        stack.append(child)
+            descendants[slug] = tuple(sorted(seen))
+        return descendants
+
+    def load(self, region_rows=None, port_code_rows=None):
+        """(Re)load the index, by default from the database.
+
+        Args:
+            region_rows: Optional (slug, parent_slug) rows, queried when not given.
+            port_code_rows: Optional (code,) rows, queried when not given.
+        """
+        if region_rows is None:
+            region_rows = ReadDB().execute_query(REGIONS_QUERY)
+        region_rows = list(region_rows)
+        if port_code_rows is None:
+            port_code_rows = ReadDB().execute_query(PORT_CODES_QUERY)
+
+        descendants = self.build_descendants(region_rows)
+        port_codes = frozenset(row[0] for row in port_code_rows if row[0] is not None)
+        top_level = frozenset(slug for slug, parent_slug in region_rows if parent_slug is None)
+
+        # Swap the maps at once so readers never see a half loaded index
+        self._descendants, self._port_codes, self._top_level = descendants, port_codes, top_level
+        self._loaded_at = time.monotonic()
+        logger.info(
+            "Loaded region index with %s regions, %s ports", len(descendants), len(port_codes)
+        )
+
+    def refresh(self):
+        """Reload the index, e.g. after the regions table has changed."""
+        with self._lock:
+            self.load()
+
+    @property
+    def is_loaded(self):
+        return self._loaded_at is not None
+
+    def is_stale(self):
+        return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+    def keep_stale(self, error):
+        """Keep serving the stale index after a failed reload and retry it later."""
+        logger.warning("Failed to reload region index, keeping the old one Error: %s", error)
+        # Backs off, the next request retries once RELOAD_RETRY seconds are up
+        retry = min(self.ttl, self.RELOAD_RETRY)
+        self._loaded_at = time.monotonic() - self.ttl + retry
+
+    def ensure_fresh(self):
+        """Load the index on first use and reload it once the TTL expired.
+
+        While a stale index is being reloaded other threads keep using the old one, as
+        they do when the reload fails. Only a failed first load raises.
+        """
+        if not self.is_loaded:
+            with self._lock:
+                if not self.is_loaded:
+                    self.load()
+        elif self.is_stale() and self._lock.acquire(blocking=False):
+            try:
+                self.load()
+            except Exception as e:
+                self.keep_stale(e)
+            finally:
+                self._lock.release()
+        return self
+
+    async def ensure_fresh_async(self, db):
+        """Async variant of ``ensure_fresh`` loading the rows with an async DB."""
+        if self.is_loaded and not self.is_stale():
+            return self
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        if self.is_loaded and self._async_lock.locked():
+            # Another task is reloading the stale index
+            return self
+        async with self._async_lock:
+            if self.is_loaded and not self.is_stale():
+                return self
+            try:
+                region_rows = await db.execute_query(REGIONS_QUERY)
+                port_code_rows = await db.execute_query(PORT_CODES_QUERY)
+                self.load(region_rows, port_code_rows)
+            except Exception as e:
+                if not self.is_loaded:
+                    raise
+                self.keep_stale(e)
+        return self
+
+    def is_known(self, value):
+        """Check if value is a known port code or region slug."""
+        return value in self._port_codes or value in self._descendants
+
+    def is_region(self, value):
+        return value in self._descendants
+
+    def is_top_level(self, value):
+        """Check if value is a region without parent region."""
+        return value in self._top_level
+
+    def root_of(self, slug):
+        """Top level region containing the region slug, None if it is unknown."""
+        roots = [root for root, descendants in self._descendants.items() if slug in descendants]
+        return max(roots, key=lambda root: len(self._descendants[root]), default=None)
+
+    def expand(self, value):
+        """Expand an origin/destination to the port codes and region slugs it covers.
+
+        Returns:
+            Tuple of (list of port codes, list of region slugs).
+        """
+        codes = [value] if value in self._port_codes else []
+        regions = list(self._descendants.get(value, ()))
+        return codes, regions
+
+
+def get_region_index():
+    """Return the loaded region index of the current app."""
+    return current_app.extensions["region_index"].ensure_fresh()
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+from utils.metrics import metrics
+
+
+class _Call:
+    """An in-flight call and, once the event is set, its result or error."""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs concurrent calls with the same key only once, across the threads of a worker.
+
+    The first caller of a key runs the function, callers arriving while it is in
+    flight wait for it and share its result or exception. Nothing is kept once
+    the call finished, later callers run the function again.
+
+    Args:
+        group (str): Label of the coalescing metrics.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args):
+        """
+        Returns function(*args), or the result of the in-flight call with the same key.
+
+        The result is shared between the callers and must not be modified.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("single_flight_coalesced_total", group=self.group)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.inc("single_flight_calls_total", group=self.group)
+        try:
+            call.result = function(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """Runs concurrent calls with the same key only once, across the tasks of an event loop.
+
+    Like ``SingleFlight`` for coroutine functions. A waiting task that is cancelled
+    does not cancel the shared call, if the calling task is cancelled the waiting
+    ones run the call again instead of failing.
+
+    Args:
+        group (str): Label of the coalescing metrics.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._calls = {}
+
+    async def do(self, key, function, *args):
+        """Returns await function(*args), or the result of the in-flight call with the same key."""
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            metrics.inc("single_flight_coalesced_total", group=self.group)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This task was cancelled, not the call
+                    raise
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        metrics.inc("single_flight_calls_total", group=self.group)
+        try:
+            result = await function(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when no task waited for it
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+        future.set_result(result)
+        return result
@@ -1,5 +1,8 @@
+from pathlib import Path
+
 from flask import current_app
 from db_engine.db import DB
+from db_engine.postgres_db import close_pools
 
 
 class TestDBUtils:
@@ -34,6 +37,8 @@ class TestDBUtils:
         """
         Drops the test database.
         """
+        # Pooled connections would keep the database in use
+        close_pools()
         query = f"DROP DATABASE {current_app.config['DB_NAME']}"
         conn = DB().get_db_connection(db_name="postgres")
         conn.autocommit = True
@@ -41,3 +46,19 @@ class TestDBUtils:
         cursor.execute(query)
         cursor.close()
         conn.close()
+
+    def load_rateapi_data(self):
+        """
+        Loads data into the test database from an SQL file.
+        """
+        sql_file_path = Path("tests/sql_data/test_sql.sql")
+
+        # Open and read the SQL file
+        with sql_file_path.open(mode="r") as sql_file:
+            # Execute the SQL commands in the file
+            conn = DB().get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(sql_file.read())
+            conn.commit()
+        cursor.close()
+        conn.close()
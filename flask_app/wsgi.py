@@ -3,6 +3,6 @@ from app import create_app
 from config import DevelopmentConfig
 
 app = create_app(DevelopmentConfig)
-# Run the app if this file is executed
+# Development server only, production runs `gunicorn --config gunicorn.conf.py wsgi:app`
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=os.getenv("DEBUG"))